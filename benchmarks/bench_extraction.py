@@ -0,0 +1,60 @@
+"""Micro-benchmark of the detail page extraction engines.
+
+Runs both engines over the HTML fixtures in tests/test_scrapy/ and reports the time
+per page. Run from the repository root:
+
+    uv run python -m benchmarks.bench_extraction
+"""
+
+import glob
+import timeit
+
+from scrapy.http import HtmlResponse
+
+from funding_crawler.extraction import CompiledExtractor, SelectorExtractor
+
+FIXTURES = "tests/test_scrapy/detail*.html"
+REPEAT = 5
+NUMBER = 200
+
+
+def load_responses():
+    responses = []
+    for file_name in sorted(glob.glob(FIXTURES)):
+        with open(file_name, "rb") as f:
+            responses.append(
+                HtmlResponse(
+                    url=f"https://www.foerderdatenbank.de/FDB/Content/DE/Foerderprogramm/Bund/{file_name}",
+                    body=f.read(),
+                    encoding="utf-8",
+                )
+            )
+    return responses
+
+
+def bench(extractor, responses):
+    def run():
+        for response in responses:
+            extractor.extract(response.selector, response.url, lambda msg: None)
+
+    timings = timeit.repeat(run, repeat=REPEAT, number=NUMBER)
+    return min(timings) / (NUMBER * len(responses))
+
+
+def main():
+    responses = load_responses()
+    # parse the documents up front, both engines work on the same lxml tree
+    for response in responses:
+        response.selector
+
+    selectors = bench(SelectorExtractor(), responses)
+    compiled = bench(CompiledExtractor(), responses)
+
+    print(f"pages: {len(responses)}, best of {REPEAT} x {NUMBER} rounds")
+    print(f"selectors: {selectors * 1e6:8.1f} us/page")
+    print(f"compiled:  {compiled * 1e6:8.1f} us/page")
+    print(f"speedup:   {selectors / compiled:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark of the dlt steps for row dicts vs. Arrow batches from the queue.
+
+Builds a synthetic crawl of 10k items from the detail page fixtures in
+tests/test_scrapy/, feeds it through ScrapingQueue and PipelineRunner into a
+temporary duckdb database, once as lists of dicts and once as Arrow batches
+(`arrow_schema`), and reports the duration of each dlt step. Run from the
+repository root:
+
+    uv run python -m benchmarks.bench_normalize
+"""
+
+import argparse
+import os
+import tempfile
+import warnings
+
+import dlt
+
+from funding_crawler.dlt_utils.helpers import cfg_provider
+from funding_crawler.dlt_utils.queue import ScrapingQueue
+from funding_crawler.dlt_utils.runner import PipelineRunner
+from funding_crawler.extraction import extract_item_from_body
+from funding_crawler.helpers import pydantic_to_arrow_schema
+from funding_crawler.models import FundingProgramSchema
+
+TEMPLATES = [
+    "tests/test_scrapy/detail_multi_desc.html",
+    "tests/test_scrapy/detail_single_desc.html",
+    "tests/test_scrapy/details_single_desc_alt.html",
+]
+
+write_disposition = {
+    "disposition": "merge",
+    "strategy": "scd2",
+    "validity_column_names": ["on_website_from", "on_website_to"],
+    "row_version_column_name": "checksum",
+}
+
+
+def synthetic_items(count):
+    templates = []
+    for file_name in TEMPLATES:
+        with open(file_name, "rb") as f:
+            templates.append(f.read())
+
+    items = []
+    for i in range(count):
+        url = f"https://www.foerderdatenbank.de/FDB/Content/DE/Foerderprogramm/Bund/program-{i:05d}.html"
+        item, _ = extract_item_from_body(
+            "compiled", templates[i % len(templates)], url, "utf-8"
+        )
+        items.append(item)
+    return items
+
+
+def run(items, arrow, batch_size, tmp):
+    mode = "arrow" if arrow else "dicts"
+    pipeline = dlt.pipeline(
+        pipeline_name=f"bench_normalize_{mode}",
+        pipelines_dir=os.path.join(tmp, "pipelines"),
+        destination=dlt.destinations.duckdb(os.path.join(tmp, f"{mode}.duckdb")),
+        dataset_name="programs",
+    )
+    queue = ScrapingQueue(
+        batch_size=batch_size,
+        read_timeout=0.1,
+        arrow_schema=pydantic_to_arrow_schema(FundingProgramSchema) if arrow else None,
+    )
+    runner = PipelineRunner(pipeline, queue)
+
+    for item in items:
+        queue.put(item)
+    queue.close()
+
+    runner.run(columns=FundingProgramSchema, write_disposition=write_disposition).join()
+    if not runner.succeeded:
+        raise RuntimeError(f"Pipeline run with {mode} failed")
+
+    return {
+        step.step: (step.finished_at - step.started_at).total_seconds()
+        for step in pipeline.last_trace.steps
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    dlt.config.register_provider(cfg_provider)
+
+    items = synthetic_items(args.items)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for arrow in (False, True):
+            results["arrow" if arrow else "dicts"] = run(
+                items, arrow, args.batch_size, tmp
+            )
+
+    print(f"{args.items} items, batch size {args.batch_size}")
+    print(f"{'step':<10} {'dicts':>8} {'arrow':>8}")
+    for step in results["dicts"]:
+        print(
+            f"{step:<10} {results['dicts'][step]:>7.2f}s {results['arrow'][step]:>7.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
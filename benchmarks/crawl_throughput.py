@@ -0,0 +1,123 @@
+"""End-to-end benchmark of crawling and loading against the local fixture site.
+
+Starts `tests.fixture_site.FixtureSite`, runs the ScrapingHost with the production
+spider and settings into a temporary duckdb database and reports pages/s, items/s,
+time spent waiting on the queue and the duration of the dlt steps. Run from the
+repository root:
+
+    uv run python -m benchmarks.crawl_throughput --programs 1000 --latency 0.05
+    uv run python -m benchmarks.crawl_throughput --set DOWNLOAD_DELAY=0 --set ADAPTIVE_DELAY_MIN=0
+"""
+
+import argparse
+import ast
+import os
+import tempfile
+import time
+import warnings
+
+import dlt
+
+from funding_crawler.dlt_utils.helpers import cfg_provider, create_pipeline_runner
+from funding_crawler.models import FundingProgramSchema
+from funding_crawler.spider import FundingSpider
+from scrapy_settings import scrapy_settings
+from tests.fixture_site import FixtureSite
+
+crawl_stats = {}
+
+
+class BenchmarkSpider(FundingSpider):
+    def closed(self, reason):
+        super().closed(reason)
+        crawl_stats.update(self.crawler.stats.get_stats())
+
+
+def parse_setting(value):
+    key, _, raw = value.partition("=")
+    try:
+        return key, ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        return key, raw
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--programs", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="override a scrapy setting, values are parsed as Python literals",
+    )
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    dlt.config.register_provider(cfg_provider)
+
+    settings = {
+        **scrapy_settings,
+        "LOG_LEVEL": "WARNING",
+        "FUNDING_VALIDATOR_CACHE": None,
+        "WARC_ARCHIVE_DIR": None,
+        **dict(parse_setting(value) for value in args.set),
+    }
+
+    with (
+        tempfile.TemporaryDirectory() as tmp,
+        FixtureSite(
+            programs=args.programs, latency=args.latency, error_rate=args.error_rate
+        ) as site,
+    ):
+        pipeline = dlt.pipeline(
+            pipeline_name="crawl_throughput",
+            pipelines_dir=os.path.join(tmp, "pipelines"),
+            destination=dlt.destinations.duckdb(
+                os.path.join(tmp, "crawl_throughput.duckdb")
+            ),
+            dataset_name="bench",
+        )
+        scraping_host = create_pipeline_runner(
+            pipeline,
+            BenchmarkSpider,
+            batch_size=args.batch_size,
+            scrapy_settings=settings,
+            start_urls=[site.start_url],
+        )
+
+        started = time.perf_counter()
+        scraping_host.run(columns=FundingProgramSchema, write_disposition="replace")
+        elapsed = time.perf_counter() - started
+
+        steps = {
+            step.step: (step.finished_at - step.started_at).total_seconds()
+            for step in pipeline.last_trace.steps
+        }
+        queue_stats = scraping_host.queue.stats
+        requests = site.request_count
+
+    pages = crawl_stats.get("response_received_count", 0)
+    items = crawl_stats.get("item_scraped_count", 0)
+
+    print(f"programs:         {args.programs} ({requests} requests served)")
+    print(f"total time:       {elapsed:.2f} s")
+    print(f"pages:            {pages} ({pages / elapsed:.1f} pages/s)")
+    print(f"items:            {items} ({items / elapsed:.1f} items/s)")
+    print(f"queue put wait:   {queue_stats['put_wait_seconds']:.2f} s")
+    print(f"queue get wait:   {queue_stats['get_wait_seconds']:.2f} s")
+    batches = max(queue_stats["batch_count"], 1)
+    print(
+        f"batches:          {queue_stats['batch_count']}, "
+        f"fill {queue_stats['batch_fill_seconds_total'] / batches:.2f} s avg, "
+        f"latency {queue_stats['batch_latency_seconds_total'] / batches:.2f} s avg "
+        f"/ {queue_stats['batch_latency_seconds_max']:.2f} s max"
+    )
+    for step, duration in steps.items():
+        print(f"dlt {step + ':':<13} {duration:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import os
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MultipartUploadWriter:
+    """
+    Writable file object that uploads what is written to it as an S3 multipart
+    upload. Parts of `part_size` bytes are uploaded by `max_in_flight` threads,
+    `write` blocks while that many parts are pending, so at most
+    `(max_in_flight + 1) * part_size` bytes are held in memory.
+
+    `close` completes the upload, `abort` discards the uploaded parts.
+    """
+
+    def __init__(self, client, bucket, key, part_size=64 * 2**20, max_in_flight=4):
+        # S3 rejects parts below 5 MB except the last one
+        if part_size < 5 * 2**20:
+            raise ValueError("part_size must be at least 5 MB")
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.bytes_written = 0
+        self.parts = []
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)[
+            "UploadId"
+        ]
+
+    def _upload_part(self, number, data):
+        try:
+            response = self.client.upload_part(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                PartNumber=number,
+                Body=data,
+            )
+            return {"PartNumber": number, "ETag": response["ETag"]}
+        finally:
+            self.slots.release()
+
+    def _submit(self, data):
+        self.slots.acquire()
+        self.parts.append(
+            self.executor.submit(self._upload_part, len(self.parts) + 1, data)
+        )
+        # fail early instead of after the whole dump
+        for part in self.parts:
+            if part.done() and part.exception() is not None:
+                raise part.exception()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        self.bytes_written += len(data)
+        while len(self.buffer) >= self.part_size:
+            self._submit(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+        return len(data)
+
+    def close(self):
+        # an upload needs at least one part, the only part may be empty
+        if self.buffer or not self.parts:
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        try:
+            parts = [part.result() for part in self.parts]
+        finally:
+            self.executor.shutdown()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+        )
+
+
+def pg_dump_command(conn_str, output_format="custom", jobs=1, file=None):
+    """
+    pg_dump arguments for a zstd compressed dump of `conn_str`. The custom format is
+    written to stdout, the directory format, dumped by `jobs` parallel connections,
+    to the directory `file`.
+    """
+    command = ["pg_dump", "-v", "-Z", "zstd:12", "-d", conn_str]
+    if output_format == "directory":
+        return [*command, "-Fd", "-j", str(jobs), "-f", file]
+    return [*command, "-Fc"]
+
+
+def _run(command, stdout=None):
+    # pg_dump -v writes a line per object to stderr, only the end is kept for errors
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE if stdout is not None else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    stderr = deque(maxlen=50)
+    stderr_thread = threading.Thread(
+        target=lambda: stderr.extend(
+            line.decode(errors="replace") for line in process.stderr
+        )
+    )
+    stderr_thread.start()
+    try:
+        if stdout is not None:
+            while chunk := process.stdout.read(1 << 20):
+                stdout.write(chunk)
+    finally:
+        if process.stdout is not None:
+            process.stdout.close()
+        returncode = process.wait()
+        stderr_thread.join()
+    if returncode != 0:
+        raise RuntimeError(
+            f"{command[0]} failed with return code {returncode}:\n{''.join(stderr)}"
+        )
+
+
+def stream_backup(
+    client,
+    conn_str,
+    bucket,
+    key,
+    output_format="custom",
+    jobs=1,
+    command=None,
+    **writer_options,
+):
+    """
+    Dump `conn_str` with pg_dump and upload the dump to `key` while it is written,
+    without a local file. The custom format is streamed from stdout. The directory
+    format is dumped by `jobs` connections into a temporary directory first and
+    uploaded as an uncompressed tar of it, the files in it are compressed already.
+    `command` replaces the pg_dump arguments of the custom format, see
+    `pg_dump_command`.
+
+    The upload is aborted if pg_dump fails, so no partial backup is left behind.
+
+    Returns:
+        dict: bytes uploaded, seconds and throughput in MB/s.
+    """
+    start = time.perf_counter()
+    writer = MultipartUploadWriter(client, bucket, key, **writer_options)
+    try:
+        if output_format == "directory":
+            with tempfile.TemporaryDirectory() as directory:
+                dump = os.path.join(directory, "dump")
+                _run(command or pg_dump_command(conn_str, "directory", jobs, dump))
+                with tarfile.open(fileobj=writer, mode="w|") as tar:
+                    tar.add(dump, arcname=os.path.basename(key).removesuffix(".tar"))
+        else:
+            _run(command or pg_dump_command(conn_str), stdout=writer)
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+    seconds = time.perf_counter() - start
+    return {
+        "bytes": writer.bytes_written,
+        "seconds": seconds,
+        "mb_per_second": writer.bytes_written / 2**20 / seconds,
+    }
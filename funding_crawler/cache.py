@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional
+
+from markdownify import markdownify as md
+
+
+class DirectoryStore:
+    """
+    Key-value store keeping one JSON file per key in a local directory.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            with open(self._file(key), encoding="utf-8") as f:
+                return json.load(f)["value"]
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        file_name = self._file(key)
+        tmp_file_name = file_name + ".tmp"
+        with open(tmp_file_name, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "value": value}, f)
+        os.replace(tmp_file_name, file_name)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self) -> Iterator[str]:
+        for file_name in os.listdir(self.path):
+            if not file_name.endswith(".json"):
+                continue
+            with open(os.path.join(self.path, file_name), encoding="utf-8") as f:
+                yield json.load(f)["key"]
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteStore:
+    """
+    Key-value store backed by a single SQLite file.
+
+    Writes are committed in batches of `commit_every` and on close.
+    """
+
+    def __init__(self, path: str, commit_every: int = 100) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.commit_every = commit_every
+        self._pending = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._conn.execute(
+            "SELECT value FROM kv WHERE key = ?", (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+            (key, json.dumps(value)),
+        )
+        self._maybe_commit()
+
+    def delete(self, key: str) -> None:
+        self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+        self._maybe_commit()
+
+    def keys(self) -> Iterator[str]:
+        for (key,) in self._conn.execute("SELECT key FROM kv").fetchall():
+            yield key
+
+    def _maybe_commit(self) -> None:
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self) -> None:
+        self._conn.commit()
+        self._conn.close()
+
+
+def open_store(uri: str):
+    """
+    open a key-value store; paths ending in .sqlite/.sqlite3/.db are opened as SQLite files,
+    everything else as a directory (both work on a mounted Modal Volume)
+    """
+    if uri.endswith((".sqlite", ".sqlite3", ".db")):
+        return SqliteStore(uri)
+    return DirectoryStore(uri)
+
+
+def body_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class ValidatorCache:
+    """
+    Stores HTTP validators (ETag/Last-Modified), a body hash and the extracted item per
+    canonical URL, so that unchanged detail pages can be answered from the previous run.
+
+    Entries written with another `version` of the extractor are treated as missing.
+    """
+
+    def __init__(self, store, version: Optional[str] = None) -> None:
+        self.store = store
+        self.version = version
+
+    def _entry(self, key: str) -> Optional[dict]:
+        entry = self.store.get(key)
+        if not entry or entry.get("version") != self.version:
+            return None
+        return entry
+
+    def conditional_headers(self, key: str) -> Dict[str, str]:
+        """
+        headers for a conditional GET of `key`, empty if nothing is cached
+        """
+        entry = self._entry(key)
+        if not entry:
+            return {}
+
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def cached_item(self, key: str, response) -> Optional[dict]:
+        """
+        return the previously extracted item if `response` is a 304 or carries the same body
+        as last time, otherwise None
+        """
+        entry = self._entry(key)
+        if not entry:
+            return None
+
+        if response.status == 304 or entry.get("body_hash") == body_hash(response.body):
+            if response.status != 304:
+                self._remember_validators(entry, response)
+                self.store.set(key, entry)
+            return dict(entry["item"])
+
+        return None
+
+    def update(self, key: str, response, item: dict) -> None:
+        entry = {
+            "body_hash": body_hash(response.body),
+            "item": item,
+            "version": self.version,
+        }
+        self._remember_validators(entry, response)
+        self.store.set(key, entry)
+
+    @staticmethod
+    def _remember_validators(entry: dict, response) -> None:
+        for field, header in [("etag", b"ETag"), ("last_modified", b"Last-Modified")]:
+            value = response.headers.get(header)
+            entry[field] = value.decode("latin-1") if value else None
+
+    def close(self) -> None:
+        self.store.close()
+
+
+class MarkdownCache:
+    """
+    Markdown conversions of HTML values, stored per SHA-256 hash of the HTML, so that
+    only new or changed values are converted. Misses are converted in `pool` if given.
+
+    Every key looked up is remembered, `evict` drops the entries of all other keys,
+    i.e. of HTML that is no longer exported.
+    """
+
+    def __init__(self, store, pool=None, chunksize: int = 16) -> None:
+        self.store = store
+        self.pool = pool
+        self.chunksize = chunksize
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    def convert(self, values: List[Optional[str]]) -> List[Optional[str]]:
+        keys = [
+            None if value is None else body_hash(value.encode()) for value in values
+        ]
+        results = {}
+        missing = {}
+        for key, value in zip(keys, values):
+            if key is None or key in results or key in missing:
+                continue
+            cached = self.store.get(key)
+            if cached is None:
+                missing[key] = value
+            else:
+                results[key] = cached
+
+        if missing:
+            converted = (
+                self.pool.map(md, missing.values(), chunksize=self.chunksize)
+                if self.pool is not None
+                else map(md, missing.values())
+            )
+            for key, markdown in zip(missing, converted):
+                self.store.set(key, markdown)
+                results[key] = markdown
+
+        self.hits += len(results) - len(missing)
+        self.misses += len(missing)
+        self.used.update(results)
+        return [None if key is None else results[key] for key in keys]
+
+    def evict(self) -> int:
+        """
+        delete the entries of HTML not converted since the cache was opened,
+        returns the number of deleted entries
+        """
+        stale = [key for key in self.store.keys() if key not in self.used]
+        for key in stale:
+            self.store.delete(key)
+        return len(stale)
+
+    def close(self) -> None:
+        self.store.close()
@@ -0,0 +1,167 @@
+from dlt.destinations.exceptions import DatabaseUndefinedRelation
+
+from funding_crawler.dlt_utils.content import content_table_name
+from funding_crawler.helpers import gen_query, gen_query_columns
+
+
+def current_table_name(table_name):
+    return f"{table_name}_current"
+
+
+def _refresh_table_name(table_name):
+    return f"{table_name}_current_refresh"
+
+
+def _watermark_query(history):
+    # latest validity boundary in the history, every load inserts or retires rows
+    # at it; both maxima are read from the ends of the on_website_from and
+    # on_website_to indexes, see HISTORY_INDEXES
+    return f"""SELECT
+        (SELECT MAX(on_website_from) FROM {history}),
+        (SELECT MAX(on_website_to) FROM {history} WHERE on_website_to IS NOT NULL)"""
+
+
+def _watermark(client, history):
+    rows = client.execute_sql(_watermark_query(history))
+    return max((value for value in rows[0] if value is not None), default=None)
+
+
+def _touched_query(history, refreshed_through, id_hashes=()):
+    """
+    Query of the ids of the programs with rows inserted or retired after
+    `refreshed_through`, and of `id_hashes`, with its arguments. The validity
+    conditions are looked up in the indexes on on_website_from and on_website_to.
+    """
+    if refreshed_through is None:
+        touched, args = "TRUE", []
+    else:
+        touched = "on_website_from > %s OR on_website_to > %s"
+        args = [refreshed_through, refreshed_through]
+    if id_hashes:
+        touched += f" OR id_hash IN ({', '.join(['%s'] * len(id_hashes))})"
+        args += list(id_hashes)
+    return f"SELECT id_hash FROM {history} WHERE {touched}", args
+
+
+def _current_query(client, source, table_name, columns, content_columns):
+    content_table = None
+    if content_columns:
+        content_table = client.make_qualified_table_name(content_table_name(table_name))
+    return gen_query(source, columns, content_table, content_columns)
+
+
+def refresh_current_state(
+    pipeline, table_name, columns, id_hashes=(), content_columns=()
+):
+    """
+    Update `<table_name>_current`, one row per program as returned by `gen_query`,
+    from the scd2 history in `table_name`.
+
+    The table is built from the whole history once, and again if `columns` changed.
+    Afterwards only the programs with rows inserted or retired since the last refresh
+    are rebuilt, by running `gen_query` over their history alone, so the cost follows
+    the size of the change set instead of the size of the history. Programs in
+    `id_hashes` are rebuilt in any case, e.g. after rows were deleted from their
+    history. Values of `content_columns` are resolved from the content table, see
+    `ContentStore`.
+
+    Returns:
+        int: number of programs that were (re)built.
+    """
+    with pipeline.sql_client() as client:
+        history = client.make_qualified_table_name(table_name)
+        current = client.make_qualified_table_name(current_table_name(table_name))
+        refresh = client.make_qualified_table_name(_refresh_table_name(table_name))
+
+        try:
+            refreshed_through = client.execute_sql(
+                f"SELECT refreshed_through FROM {refresh}"
+            )[0][0]
+        except DatabaseUndefinedRelation:
+            refreshed_through = None
+            initial = True
+        else:
+            # rows are inserted by position, the table is rebuilt if the columns changed
+            with client.execute_query(f"SELECT * FROM {current} LIMIT 0") as cursor:
+                current_columns = [column[0] for column in cursor.description]
+            initial = current_columns != gen_query_columns(columns)
+
+        with client.begin_transaction():
+            watermark = _watermark(client, history)
+
+            if initial:
+                client.execute_sql(f"DROP TABLE IF EXISTS {current}")
+                client.execute_sql(f"DROP TABLE IF EXISTS {refresh}")
+                query = _current_query(
+                    client, history, table_name, columns, content_columns
+                )
+                client.execute_sql(f"CREATE TABLE {current} AS {query}")
+                # duckdb rejects deleting and reinserting a key of a unique index
+                # in one transaction, the key is only enforced on other destinations
+                if pipeline.destination.destination_name != "duckdb":
+                    client.execute_sql(
+                        f"CREATE UNIQUE INDEX {current_table_name(table_name)}_id_hash"
+                        f" ON {current} (id_hash)"
+                    )
+                client.execute_sql(
+                    f"CREATE TABLE {refresh} (refreshed_through TIMESTAMP WITH TIME ZONE)"
+                )
+                client.execute_sql(f"INSERT INTO {refresh} VALUES (%s)", watermark)
+                return client.execute_sql(f"SELECT COUNT(*) FROM {current}")[0][0]
+
+            if not id_hashes and (
+                watermark is None
+                or (refreshed_through is not None and watermark <= refreshed_through)
+            ):
+                return 0
+
+            # history of the programs with rows inserted or retired since the last refresh
+            touched, args = _touched_query(history, refreshed_through, id_hashes)
+            client.execute_sql("DROP TABLE IF EXISTS current_state_touched")
+            client.execute_sql(
+                f"""CREATE TEMPORARY TABLE current_state_touched AS
+                SELECT * FROM {history} WHERE id_hash IN ({touched})""",
+                *args,
+            )
+
+            client.execute_sql(
+                f"DELETE FROM {current} WHERE id_hash IN"
+                " (SELECT id_hash FROM current_state_touched)"
+            )
+            query = _current_query(
+                client, "current_state_touched", table_name, columns, content_columns
+            )
+            client.execute_sql(f"INSERT INTO {current} {query}")
+            count = client.execute_sql(
+                "SELECT COUNT(DISTINCT id_hash) FROM current_state_touched"
+            )[0][0]
+            client.execute_sql("DROP TABLE current_state_touched")
+            client.execute_sql(
+                f"UPDATE {refresh} SET refreshed_through = %s", watermark
+            )
+
+    return count
+
+
+def verify_current_state(pipeline, table_name, columns, content_columns=()):
+    """
+    Compare `<table_name>_current` with `gen_query` over the whole history.
+
+    Returns:
+        int: number of rows that are only in one of both, 0 if they are equal.
+    """
+    with pipeline.sql_client() as client:
+        history = client.make_qualified_table_name(table_name)
+        current = client.make_qualified_table_name(current_table_name(table_name))
+
+        query = _current_query(client, history, table_name, columns, content_columns)
+        expected = f"SELECT * FROM ({query}) AS expected"
+        actual = f"SELECT * FROM {current}"
+
+        return client.execute_sql(
+            f"""SELECT COUNT(*) FROM (
+                ({expected} EXCEPT {actual})
+                UNION ALL
+                ({actual} EXCEPT {expected})
+            ) AS difference"""
+        )[0][0]
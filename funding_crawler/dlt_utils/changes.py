@@ -0,0 +1,111 @@
+import typing as t
+
+import dlt
+from dlt.common import logger, pendulum
+from dlt.destinations.exceptions import DatabaseUndefinedRelation
+
+from .types import AnyDict
+
+
+class ChangeSet:
+    """Forwards only new or changed items to an scd2 table
+
+    Before the crawl, `prepare` fetches the `key` and row version of every
+    active row of the table. Items are then only passed on if their key is
+    unknown or their row version differs. The load uses `key` as merge key,
+    so dlt only retires rows whose key is in the load. Rows of keys not seen
+    during the crawl are retired by `retire_absent` with the same boundary
+    timestamp as the load.
+    """
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.known: t.Dict[str, str] = {}
+        self.seen: t.Set[str] = set()
+        self.forwarded = 0
+        self.skipped = 0
+        self.retired = 0
+        self.version_column: t.Optional[str] = None
+        self.valid_to_column: t.Optional[str] = None
+        self.boundary_timestamp: t.Optional[pendulum.DateTime] = None
+
+    def prepare(
+        self, pipeline: dlt.Pipeline, table_name: str, write_disposition: AnyDict
+    ) -> AnyDict:
+        """Fetches the active rows and returns the write disposition for the load
+
+        The returned disposition fixes the boundary timestamp, so rows retired by
+        the load and by `retire_absent` share it.
+        """
+        if not (
+            isinstance(write_disposition, dict)
+            and write_disposition.get("strategy") == "scd2"
+        ):
+            raise ValueError("Change sets require the scd2 merge strategy")
+
+        self.version_column = write_disposition.get("row_version_column_name")
+        if self.version_column is None:
+            raise ValueError("Change sets require a row_version_column_name")
+        self.valid_to_column = write_disposition.get(
+            "validity_column_names", ["_dlt_valid_from", "_dlt_valid_to"]
+        )[1]
+        self.boundary_timestamp = pendulum.now("UTC")
+
+        try:
+            with pipeline.sql_client() as client:
+                rows = client.execute_sql(
+                    f"SELECT {client.escape_column_name(self.key)},"
+                    f" {client.escape_column_name(self.version_column)}"
+                    f" FROM {client.make_qualified_table_name(table_name)}"
+                    f" WHERE {client.escape_column_name(self.valid_to_column)} IS NULL"
+                )
+        except DatabaseUndefinedRelation:
+            rows = []
+        self.known = {key: version for key, version in rows or []}
+        logger.info(f"Change set: {len(self.known)} active rows in {table_name}")
+
+        return {**write_disposition, "boundary_timestamp": self.boundary_timestamp}
+
+    def __call__(self, item: t.Any) -> bool:
+        """Records the key of `item`, True if the item is new or changed"""
+        key = item[self.key]
+        self.seen.add(key)
+        if key in self.known and self.known[key] == item[self.version_column]:
+            self.skipped += 1
+            return False
+        self.forwarded += 1
+        return True
+
+    @property
+    def absent(self) -> t.Set[str]:
+        """Keys of active rows that were not seen during the crawl"""
+        return set(self.known) - self.seen
+
+    def retire_absent(self, pipeline: dlt.Pipeline, table_name: str) -> int:
+        """Closes the validity of the active rows whose key was not seen"""
+        absent = sorted(self.absent)
+        if absent:
+            with pipeline.sql_client() as client:
+                placeholders = ", ".join(["%s"] * len(absent))
+                valid_to = client.escape_column_name(self.valid_to_column)
+                client.execute_sql(
+                    f"UPDATE {client.make_qualified_table_name(table_name)}"
+                    f" SET {valid_to} = %s"
+                    f" WHERE {valid_to} IS NULL"
+                    f" AND {client.escape_column_name(self.key)} IN ({placeholders})",
+                    self.boundary_timestamp,
+                    *absent,
+                )
+        self.retired = len(absent)
+        logger.info(f"Change set: retired {self.retired} rows in {table_name}")
+        return self.retired
+
+    @property
+    def stats(self) -> AnyDict:
+        return {
+            "known": len(self.known),
+            "seen": len(self.seen),
+            "forwarded": self.forwarded,
+            "skipped": self.skipped,
+            "retired": self.retired,
+        }
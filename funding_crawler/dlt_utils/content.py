@@ -0,0 +1,131 @@
+import hashlib
+import typing as t
+
+import dlt
+import pyarrow as pa
+from dlt.common import logger
+
+from .types import AnyDict
+
+
+def content_table_name(table_name: str) -> str:
+    return f"{table_name}_content"
+
+
+def content_hash(value: str) -> str:
+    """sha256 hex digest of the UTF-8 encoded value"""
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def sql_content_hash(destination_name: str, expression: str) -> str:
+    """SQL expression computing `content_hash` of a text expression"""
+    if destination_name == "postgres":
+        return f"encode(sha256(convert_to({expression}, 'UTF8')), 'hex')"
+    return f"sha256({expression})"
+
+
+def create_content_table(client: t.Any, qualified_table_name: str) -> None:
+    client.execute_sql(
+        f"CREATE TABLE IF NOT EXISTS {qualified_table_name}"
+        " (content_hash VARCHAR(64) PRIMARY KEY, content TEXT NOT NULL)"
+    )
+
+
+class ContentStore:
+    """Stores large text columns once per distinct value in a side table
+
+    Before a batch is loaded, the values of `columns` are replaced by their
+    `content_hash` and values not stored yet are inserted into
+    `<table_name>_content`, keyed by the hash. Versions of an item that only
+    differ in other columns then share the stored text instead of each
+    holding a copy. Content is stored before the rows referring to it are
+    loaded, a failed load only leaves unreferenced content behind.
+    """
+
+    def __init__(self, columns: t.Sequence[str]) -> None:
+        self.columns = list(columns)
+        self.known: t.Set[str] = set()
+        self.pipeline: t.Optional[dlt.Pipeline] = None
+        self.table_name: t.Optional[str] = None
+        self.stored = 0
+        self.reused = 0
+
+    def prepare(self, pipeline: dlt.Pipeline, table_name: str) -> None:
+        """Creates the content table if needed and fetches the stored hashes"""
+        self.pipeline = pipeline
+        self.table_name = content_table_name(table_name)
+        with pipeline.sql_client() as client:
+            if not client.has_dataset():
+                client.create_dataset()
+            content = client.make_qualified_table_name(self.table_name)
+            create_content_table(client, content)
+            rows = client.execute_sql(f"SELECT content_hash FROM {content}")
+        self.known = {content_hash for (content_hash,) in rows or []}
+        logger.info(f"Content store: {len(self.known)} stored values")
+
+    def externalize(self, batch: t.Any) -> t.Any:
+        """Returns the batch, a list of items or an Arrow table, with the values
+        of `columns` replaced by their hashes, after storing new values
+        """
+        contents: t.Dict[str, str] = {}
+
+        def digest(value: t.Optional[str]) -> t.Optional[str]:
+            if value is None:
+                return None
+            key = content_hash(value)
+            if key in self.known or key in contents:
+                self.reused += 1
+            else:
+                contents[key] = value
+            return key
+
+        if isinstance(batch, pa.Table):
+            for column in self.columns:
+                index = batch.schema.get_field_index(column)
+                if index == -1:
+                    continue
+                values = [digest(value) for value in batch.column(index).to_pylist()]
+                batch = batch.set_column(
+                    index, batch.schema.field(index), pa.array(values, pa.string())
+                )
+        else:
+            batch = [
+                {
+                    **item,
+                    **{
+                        column: digest(item[column])
+                        for column in self.columns
+                        if column in item
+                    },
+                }
+                for item in batch
+            ]
+
+        self.store(contents)
+        return batch
+
+    def store(self, contents: t.Dict[str, str]) -> None:
+        """Inserts hash -> value pairs, values stored in the meantime are skipped"""
+        if not contents:
+            return
+        if self.pipeline is None:
+            raise RuntimeError("ContentStore.prepare has to be called first")
+
+        with self.pipeline.sql_client() as client:
+            placeholders = ", ".join(["(%s, %s)"] * len(contents))
+            client.execute_sql(
+                f"INSERT INTO {client.make_qualified_table_name(self.table_name)}"
+                f" (content_hash, content) VALUES {placeholders}"
+                " ON CONFLICT (content_hash) DO NOTHING",
+                *[value for pair in contents.items() for value in pair],
+            )
+        self.known.update(contents)
+        self.stored += len(contents)
+
+    @property
+    def stats(self) -> AnyDict:
+        return {
+            "known": len(self.known),
+            "stored": self.stored,
+            "reused": self.reused,
+        }
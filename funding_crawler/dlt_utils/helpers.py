@@ -2,6 +2,7 @@ import os
 import typing as t
 from dlt.common.configuration.providers.toml import SettingsTomlProvider
 import dlt
+import pyarrow as pa
 from dlt.common.configuration.inject import with_config
 from dlt.common.configuration.specs.base_configuration import (
     configspec,
@@ -10,6 +11,9 @@ from dlt.common.configuration.specs.base_configuration import (
 
 from scrapy import Spider
 
+from .changes import ChangeSet
+from .checkpoint import CrawlCheckpoint
+from .content import ContentStore
 from .queue import ScrapingQueue
 from .settings import SOURCE_SCRAPY_QUEUE_SIZE, SOURCE_SCRAPY_SETTINGS
 from .runner import ScrapingHost, PipelineRunner, ScrapyRunner, Signals
@@ -31,10 +35,45 @@ class ScrapingConfig(BaseConfiguration):
     # result wait timeout for our queue
     queue_result_timeout: t.Optional[float] = 1.0
 
+    # Bound the queue by the estimated bytes of the items in memory instead of
+    # queue_size, items above the bound are spilled to disk so scrapy never blocks
+    queue_max_bytes: t.Optional[int] = None
+
+    # Directory for spilled items, defaults to the system temp directory
+    queue_spill_dir: t.Optional[str] = None
+
+    # Flush a batch early once its items reach this estimated size in bytes
+    batch_max_bytes: t.Optional[int] = None
+
+    # Flush a batch once its first item is this many seconds old,
+    # defaults to queue_result_timeout
+    batch_max_age: t.Optional[float] = None
+
     # List of start urls
     start_urls: t.List[str] = None
     start_urls_file: str = None
 
+    # Directory to checkpoint crawl progress to, enables resuming an interrupted crawl
+    checkpoint_dir: t.Optional[str] = None
+
+    # Seconds between two checkpoints
+    checkpoint_interval: float = 30.0
+
+    # Hours after which an unfinished checkpoint is discarded instead of resumed
+    checkpoint_max_age: t.Optional[float] = 72.0
+
+    # File format dlt stages the data in, e.g. "csv" to load with COPY on postgres
+    # instead of INSERT statements, defaults to the preferred format of the destination
+    loader_file_format: t.Optional[str] = None
+
+    # Only load new or changed items into an scd2 table, compared by this key
+    # and the row version column, and retire the rows of items no longer scraped
+    change_key: t.Optional[str] = None
+
+    # Store the values of these text columns once per distinct value in a
+    # `<table>_content` table and load only their hashes into the table itself
+    content_columns: t.Optional[t.List[str]] = None
+
 
 @with_config(sections=("sources", "scraping"), spec=ScrapingConfig)
 def resolve_start_urls(
@@ -64,21 +103,74 @@ def create_pipeline_runner(
     batch_size: int = dlt.config.value,
     queue_size: int = dlt.config.value,
     queue_result_timeout: float = dlt.config.value,
+    queue_max_bytes: t.Optional[int] = dlt.config.value,
+    queue_spill_dir: t.Optional[str] = dlt.config.value,
+    batch_max_bytes: t.Optional[int] = dlt.config.value,
+    batch_max_age: t.Optional[float] = dlt.config.value,
+    checkpoint_dir: t.Optional[str] = dlt.config.value,
+    checkpoint_interval: float = dlt.config.value,
+    checkpoint_max_age: t.Optional[float] = dlt.config.value,
+    loader_file_format: t.Optional[str] = dlt.config.value,
+    change_key: t.Optional[str] = dlt.config.value,
+    content_columns: t.Optional[t.List[str]] = dlt.config.value,
     scrapy_settings: t.Optional[AnyDict] = None,
+    spider_kwargs: t.Optional[AnyDict] = None,
+    start_urls: t.Optional[t.List[str]] = None,
+    arrow_schema: t.Optional[pa.Schema] = None,
+    batch_transform: t.Optional[t.Callable[[t.Any], t.Any]] = None,
 ) -> ScrapingHost:
     """Creates scraping host instance
     This helper only creates pipeline host, so running and controlling
     scrapy runner and pipeline is completely delegated to advanced users
+
+    `start_urls` replaces the configured start urls, e.g. to crawl a local test site.
+
+    With `arrow_schema` the queue assembles batches into Arrow record batches
+    and dlt loads them through its Arrow path instead of normalizing each row.
+
+    `loader_file_format` is passed to `pipeline.run`, with "csv" postgres loads the
+    batches with COPY instead of INSERT statements.
+
+    With `change_key`, the scraping host compares scraped items with the active
+    rows of the scd2 table before loading, see `ChangeSet`.
+
+    `batch_transform` is applied to every batch, a list of items or an Arrow table,
+    on the pipeline thread before it is loaded, e.g. for CPU work that should not
+    run on the thread of the crawl.
+
+    With `content_columns`, the values of these columns are loaded into a content
+    table keyed by their hash and the table only holds the hashes, see `ContentStore`.
+
+    If `checkpoint_dir` is set, the spider receives the checkpoint as
+    `checkpoint` keyword argument and is expected to save its state to it.
     """
+    checkpoint = None
+    if checkpoint_dir:
+        checkpoint = CrawlCheckpoint(
+            checkpoint_dir,
+            interval=checkpoint_interval,
+            max_age=checkpoint_max_age,
+        )
+        spider_kwargs = {**(spider_kwargs or {}), "checkpoint": checkpoint}
+
     queue = ScrapingQueue(  # type: ignore
         maxsize=queue_size,
         batch_size=batch_size,
         read_timeout=queue_result_timeout,
+        max_bytes=queue_max_bytes,
+        spill_dir=queue_spill_dir,
+        batch_max_bytes=batch_max_bytes,
+        batch_max_age=batch_max_age,
+        arrow_schema=arrow_schema,
     )
 
+    change_set = ChangeSet(change_key) if change_key else None
+
     signals = Signals(
         pipeline_name=pipeline.pipeline_name,
         queue=queue,
+        checkpoint=checkpoint,
+        item_filter=change_set,
     )
 
     # Just to simple merge
@@ -88,20 +180,26 @@ def create_pipeline_runner(
 
     scrapy_runner = ScrapyRunner(
         spider=spider,
-        start_urls=resolve_start_urls(),
+        start_urls=start_urls or resolve_start_urls(),
         signals=signals,
         settings=settings,
+        spider_kwargs=spider_kwargs,
     )
 
     pipeline_runner = PipelineRunner(
         pipeline=pipeline,
         queue=queue,
+        loader_file_format=loader_file_format,
+        content_store=ContentStore(content_columns) if content_columns else None,
+        batch_transform=batch_transform,
     )
 
     scraping_host = ScrapingHost(
         queue,
         scrapy_runner,
         pipeline_runner,
+        checkpoint=checkpoint,
+        change_set=change_set,
     )
 
     return scraping_host
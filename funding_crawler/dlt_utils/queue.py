@@ -1,6 +1,12 @@
+import os
+import pickle
+import tempfile
+import time
 import typing as t
-from queue import Empty, Queue
+from collections import deque
+from queue import Queue
 
+import pyarrow as pa
 from dlt.common import logger
 
 
@@ -22,52 +28,264 @@ class QueueClosedError(Exception):
     pass
 
 
+def estimate_size(item: t.Any) -> int:
+    """Rough size of an item in bytes, counting the characters of its strings"""
+    if isinstance(item, (str, bytes)):
+        return len(item)
+    if isinstance(item, dict):
+        return sum(len(key) + estimate_size(value) for key, value in item.items())
+    if isinstance(item, (list, tuple)):
+        return sum(estimate_size(value) for value in item)
+    return 8
+
+
 class ScrapingQueue(_Queue[T]):
+    """Queue between the scrapy signals and the dlt resource
+
+    By default the queue is bounded by `maxsize` items and `put` blocks once
+    it is full. With `max_bytes` the queue is bounded by the estimated size of
+    the items kept in memory instead and `put` never blocks: once the bound is
+    reached, further items are written to `spill_dir` in files of `batch_size`
+    items and read back in order when the consumer catches up.
+
+    `get_batches` flushes a batch once it holds `batch_size` items, its items
+    reach `batch_max_bytes` or its first item is `batch_max_age` seconds old
+    (`read_timeout` by default), whichever comes first.
+
+    With `arrow_schema`, batches are assembled into a `pyarrow.RecordBatch`
+    with that schema instead of being yielded as lists of items.
+    """
+
     def __init__(
         self,
         maxsize: int = 0,
         batch_size: int = 10,
         read_timeout: float = 1.0,
+        max_bytes: t.Optional[int] = None,
+        spill_dir: t.Optional[str] = None,
+        batch_max_bytes: t.Optional[int] = None,
+        batch_max_age: t.Optional[float] = None,
+        arrow_schema: t.Optional[pa.Schema] = None,
     ) -> None:
-        super().__init__(maxsize)
+        super().__init__(0 if max_bytes else maxsize)
         self.batch_size = batch_size
         self.read_timeout = read_timeout
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_max_age = read_timeout if batch_max_age is None else batch_max_age
+        self.max_bytes = max_bytes
+        self.arrow_schema = arrow_schema
+        self.spill_dir = spill_dir or tempfile.gettempdir()
         self._is_closed = False
 
+        # Items in memory are kept with their estimated size (0 if no byte bound
+        # is set) and the time they were put, spilled items with the time only
+        self._memory_bytes = 0
+        self._spilling = False
+        self._overflow: t.List[t.Tuple[T, float]] = []
+        self._spill_files: t.Deque[t.Tuple[str, int]] = deque()
+
+        # Seconds producers spent blocked on a full queue and the consumer
+        # spent waiting for items
+        self.stats: t.Dict[str, float] = {
+            "put_count": 0,
+            "put_wait_seconds": 0.0,
+            "get_wait_seconds": 0.0,
+            "memory_bytes_high_water": 0,
+            "memory_items_high_water": 0,
+            "spilled_items": 0,
+            "spill_files_high_water": 0,
+            "batch_count": 0,
+            "flushed_on_size": 0,
+            "flushed_on_bytes": 0,
+            "flushed_on_age": 0,
+            "flushed_on_close": 0,
+            # Time from the first item of a batch to its flush, and
+            # age of the oldest item of a batch when it was flushed
+            "batch_fill_seconds_total": 0.0,
+            "batch_fill_seconds_max": 0.0,
+            "batch_latency_seconds_total": 0.0,
+            "batch_latency_seconds_max": 0.0,
+        }
+
+    # `_qsize`, `_put` and `_get` are called by `Queue` with its mutex held
+
+    def _qsize(self) -> int:
+        spilled = sum(count for _, count in self._spill_files)
+        return len(self.queue) + spilled + len(self._overflow)
+
+    def _put(self, item: T) -> None:
+        enqueued_at = time.monotonic()
+        if not self.max_bytes:
+            size = estimate_size(item) if self.batch_max_bytes else 0
+            self._append(item, size, enqueued_at)
+            return
+
+        size = estimate_size(item)
+        if not self._spilling and (
+            self._memory_bytes + size <= self.max_bytes or not self.queue
+        ):
+            self._append(item, size, enqueued_at)
+            return
+
+        # Keep the order: once spilling, everything goes to disk until the
+        # consumer has read the spilled items back
+        self._spilling = True
+        self._overflow.append((item, enqueued_at))
+        self.stats["spilled_items"] += 1
+        if len(self._overflow) >= self.batch_size:
+            self._spill()
+
+    def _get(self) -> T:
+        return self._pop()[0]
+
+    def _pop(self) -> t.Tuple[T, int, float]:
+        if not self.queue:
+            self._refill()
+        item, size, enqueued_at = self.queue.popleft()
+        self._memory_bytes -= size
+        return item, size, enqueued_at
+
+    def _append(self, item: T, size: int, enqueued_at: float) -> None:
+        self.queue.append((item, size, enqueued_at))
+        self._memory_bytes += size
+        self.stats["memory_bytes_high_water"] = max(
+            self.stats["memory_bytes_high_water"], self._memory_bytes
+        )
+        self.stats["memory_items_high_water"] = max(
+            self.stats["memory_items_high_water"], len(self.queue)
+        )
+
+    def _spill(self) -> None:
+        fd, path = tempfile.mkstemp(
+            prefix="scraping-queue-", suffix=".pickle", dir=self.spill_dir
+        )
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(self._overflow, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spill_files.append((path, len(self._overflow)))
+        self._overflow = []
+        self.stats["spill_files_high_water"] = max(
+            self.stats["spill_files_high_water"], len(self._spill_files)
+        )
+
+    def _refill(self) -> None:
+        """Moves the oldest spilled items back to memory"""
+        if self._spill_files:
+            path, _ = self._spill_files.popleft()
+            with open(path, "rb") as f:
+                items = pickle.load(f)
+            os.remove(path)
+        else:
+            items, self._overflow = self._overflow, []
+            self._spilling = False
+
+        for item, enqueued_at in items:
+            self._append(item, estimate_size(item), enqueued_at)
+
+    def put(
+        self, item: T, block: bool = True, timeout: t.Optional[float] = None
+    ) -> None:
+        started = time.perf_counter()
+        super().put(item, block, timeout)
+        self.stats["put_count"] += 1
+        self.stats["put_wait_seconds"] += time.perf_counter() - started
+
     def get_batches(self) -> t.Iterator[t.Any]:
         """Batching helper can be wrapped as a dlt.resource
 
+        Waits on the queue condition instead of polling, a batch is flushed as
+        soon as one of the limits is reached and `close` wakes the consumer
+        immediately. Items still queued on close are consumed before stopping.
+
         Returns:
             Iterator[Any]: yields scraped items one by one
         """
         batch: t.List[T] = []
+        batch_bytes = 0
+        batch_started = 0.0
+        oldest_enqueued = 0.0
+
         while True:
-            if len(batch) == self.batch_size:
-                yield batch
-                batch = []
+            with self.not_empty:
+                started = time.monotonic()
+                while not self._qsize() and not self._is_closed:
+                    if not batch:
+                        self.not_empty.wait()
+                        continue
+
+                    remaining = batch_started + self.batch_max_age - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.not_empty.wait(remaining)
 
-            try:
-                if self.is_closed:
-                    raise QueueClosedError("Queue is closed")
+                self.stats["get_wait_seconds"] += time.monotonic() - started
+                entry = self._pop() if self._qsize() else None
+                if entry is not None:
+                    self.not_full.notify()
 
-                item = self.get(timeout=self.read_timeout)
+            reason = None
+            if entry is None:
+                reason = "close" if self._is_closed else "age"
+            else:
+                item, size, enqueued_at = entry
+                if not batch:
+                    batch_started = time.monotonic()
+                    oldest_enqueued = enqueued_at
                 batch.append(item)
+                batch_bytes += size
 
                 # Mark task as completed
                 self.task_done()
-            except Empty:
-                if batch:
-                    yield batch
-                    batch = []
-            except QueueClosedError:
-                logger.info("Queue is closed, stopping...")
 
-                # Return the last batch before exiting
-                if batch:
-                    yield batch
+                if len(batch) >= self.batch_size:
+                    reason = "size"
+                elif self.batch_max_bytes and batch_bytes >= self.batch_max_bytes:
+                    reason = "bytes"
+                elif time.monotonic() - batch_started >= self.batch_max_age:
+                    reason = "age"
 
+            if reason is not None and batch:
+                self._record_batch(reason, batch_started, oldest_enqueued)
+                yield batch if self.arrow_schema is None else self.to_arrow(batch)
+                batch = []
+                batch_bytes = 0
+
+            if reason == "close":
+                logger.info("Queue is closed, stopping...")
                 break
 
+    def to_arrow(self, batch: t.List[T]) -> pa.RecordBatch:
+        """Converts a batch of items to a record batch with `arrow_schema`
+
+        Keys missing in the schema are dropped, missing values become nulls.
+        Raises ValueError if a non-nullable column contains nulls.
+        """
+        record_batch = pa.RecordBatch.from_pylist(batch, schema=self.arrow_schema)
+        for field, column in zip(self.arrow_schema, record_batch.columns):
+            if not field.nullable and column.null_count:
+                raise ValueError(
+                    f"Column {field.name} is not nullable, "
+                    f"but {column.null_count} items have no value"
+                )
+        return record_batch
+
+    def _record_batch(
+        self, reason: str, batch_started: float, oldest_enqueued: float
+    ) -> None:
+        now = time.monotonic()
+        fill = now - batch_started
+        latency = now - oldest_enqueued
+
+        self.stats["batch_count"] += 1
+        self.stats[f"flushed_on_{reason}"] += 1
+        self.stats["batch_fill_seconds_total"] += fill
+        self.stats["batch_fill_seconds_max"] = max(
+            self.stats["batch_fill_seconds_max"], fill
+        )
+        self.stats["batch_latency_seconds_total"] += latency
+        self.stats["batch_latency_seconds_max"] = max(
+            self.stats["batch_latency_seconds_max"], latency
+        )
+
     def stream(self) -> t.Iterator[t.Any]:
         """Streaming generator, wraps get_batches
         and handles `GeneratorExit` if dlt closes it.
@@ -81,8 +299,10 @@ class ScrapingQueue(_Queue[T]):
             self.close()
 
     def close(self) -> None:
-        """Marks queue as closed"""
-        self._is_closed = True
+        """Marks queue as closed and wakes up the consumer"""
+        with self.not_empty:
+            self._is_closed = True
+            self.not_empty.notify_all()
 
     @property
     def is_closed(self) -> bool:
@@ -3,14 +3,19 @@
 import threading
 import typing as t
 import dlt
+import pyarrow as pa
 
-from dlt.common import logger
+from dlt.common import json, logger
+from dlt.common.libs.pydantic import BaseModel, pydantic_to_table_schema_columns
 from pydispatch import dispatcher  # type: ignore
 from typing_extensions import Self
 
 from scrapy import signals, Item, Spider  # type: ignore
 from scrapy.crawler import CrawlerProcess  # type: ignore
 
+from .changes import ChangeSet
+from .checkpoint import CrawlCheckpoint
+from .content import ContentStore
 from .types import AnyDict, Runnable, P
 from .queue import ScrapingQueue
 
@@ -24,14 +29,31 @@ class Signals:
     this is required to stop the scraping process as soon as the queue closes.
     """
 
-    def __init__(self, pipeline_name: str, queue: ScrapingQueue[T]) -> None:
+    def __init__(
+        self,
+        pipeline_name: str,
+        queue: ScrapingQueue[T],
+        checkpoint: t.Optional[CrawlCheckpoint] = None,
+        item_filter: t.Optional[t.Callable[[t.Any], bool]] = None,
+    ) -> None:
         self.stopping = False
         self.queue = queue
         self.pipeline_name = pipeline_name
+        self.checkpoint = checkpoint
+        self.item_filter = item_filter
+        self.finish_reason: t.Optional[str] = None
+
+    def forward(self, item: t.Any) -> None:
+        """Puts the item into the queue unless `item_filter` rejects it"""
+        if self.item_filter is None or self.item_filter(item):
+            self.queue.put(item)
 
     def on_item_scraped(self, item: Item) -> None:
         if not self.queue.is_closed:
-            self.queue.put(item)
+            # Journal every item, a resumed crawl has to see unchanged items too
+            if self.checkpoint is not None:
+                self.checkpoint.record_item(item)
+            self.forward(item)
         else:
             logger.info(
                 "Queue is closed, stopping",
@@ -47,6 +69,9 @@ class Signals:
         self.queue.close()
         self.queue.join()
 
+    def on_spider_closed(self, reason: str) -> None:
+        self.finish_reason = reason
+
     def __call__(self, crawler: CrawlerProcess) -> Self:
         self.crawler = crawler
         return self
@@ -59,9 +84,13 @@ class Signals:
         # Once crawling engine stops we would like to know about it as well.
         dispatcher.connect(self.on_engine_stopped, signals.engine_stopped)
 
+        # To only drop a checkpoint if the spider actually finished.
+        dispatcher.connect(self.on_spider_closed, signals.spider_closed)
+
     def __exit__(self, exc_type: t.Any, exc_val: t.Any, exc_tb: t.Any) -> None:
         dispatcher.disconnect(self.on_item_scraped, signals.item_scraped)
         dispatcher.disconnect(self.on_engine_stopped, signals.engine_stopped)
+        dispatcher.disconnect(self.on_spider_closed, signals.spider_closed)
 
 
 class ScrapyRunner(Runnable):
@@ -73,23 +102,26 @@ class ScrapyRunner(Runnable):
         start_urls: t.List[str],
         settings: AnyDict,
         signals: Signals,
+        spider_kwargs: t.Optional[AnyDict] = None,
     ) -> None:
         self.spider = spider
         self.start_urls = start_urls
         self.crawler = CrawlerProcess(settings=settings)
         self.signals = signals
+        self.spider_kwargs = spider_kwargs or {}
 
     def run(self, *args: P.args, **kwargs: P.kwargs) -> None:
         """Runs scrapy crawler process
 
-        All `kwargs` are forwarded to `crawler.crawl(**kwargs)`.
+        All `kwargs` are forwarded to `crawler.crawl(**kwargs)` together with
+        the `spider_kwargs` given on creation.
         Also manages relevant signal handling in proper way.
         """
         self.crawler.crawl(
             self.spider,
             name="scraping_spider",
             start_urls=self.start_urls,
-            **kwargs,
+            **{**self.spider_kwargs, **kwargs},
         )
 
         try:
@@ -114,9 +146,16 @@ class PipelineRunner(Runnable):
         self,
         pipeline: dlt.Pipeline,
         queue: ScrapingQueue[T],
+        loader_file_format: t.Optional[str] = None,
+        content_store: t.Optional[ContentStore] = None,
+        batch_transform: t.Optional[t.Callable[[t.Any], t.Any]] = None,
     ) -> None:
         self.pipeline = pipeline
         self.queue = queue
+        self.loader_file_format = loader_file_format
+        self.content_store = content_store
+        self.batch_transform = batch_transform
+        self.succeeded = False
 
         if pipeline.dataset_name and not self.is_default_dataset_name(pipeline):
             resource_name = pipeline.dataset_name
@@ -124,14 +163,36 @@ class PipelineRunner(Runnable):
             resource_name = f"{pipeline.pipeline_name}_results"
 
         logger.info(f"Resource name: {resource_name}")
+        self.resource_name = resource_name
 
         self.scraping_resource = dlt.resource(
             # Queue get_batches is a generator so we can
             # pass it to pipeline.run and dlt will handle the rest.
-            self.queue.stream(),
+            self.queue.stream()
+            if queue.arrow_schema is None
+            and content_store is None
+            and batch_transform is None
+            else self.stream(),
             name=resource_name,
         )
 
+    def stream(self) -> t.Iterator[t.Any]:
+        """Yields the batches of the queue, record batches as Arrow tables
+        so dlt can skip the per row normalization, passed through
+        `batch_transform` and with large text columns moved to the content
+        store if they are set
+        """
+        for batch in self.queue.stream():
+            if self.queue.arrow_schema is not None:
+                batch = pa.Table.from_batches([batch])
+            if self.batch_transform is not None:
+                batch = self.batch_transform(batch)
+            if self.content_store is not None:
+                batch = self.content_store.externalize(batch)
+            if isinstance(batch, pa.Table) and self.loader_file_format == "csv":
+                batch = nested_to_json(batch)
+            yield batch
+
     def is_default_dataset_name(self, pipeline: dlt.Pipeline) -> bool:
         default_name = pipeline.pipeline_name + pipeline.DEFAULT_DATASET_SUFFIX
         return pipeline.dataset_name == default_name
@@ -157,9 +218,23 @@ class PipelineRunner(Runnable):
         ```
         """
 
+        if self.loader_file_format is not None:
+            kwargs.setdefault("loader_file_format", self.loader_file_format)
+
+        columns = kwargs.get("columns")
+        if (
+            self.queue.arrow_schema is not None
+            and isinstance(columns, type)
+            and issubclass(columns, BaseModel)
+        ):
+            # Pydantic validation works on dicts only, Arrow batches are checked
+            # against the schema by the queue, so only the column hints are kept
+            kwargs["columns"] = pydantic_to_table_schema_columns(columns)
+
         def run() -> None:
             try:
                 self.pipeline.run(self.scraping_resource, **kwargs)  # type: ignore[arg-type]
+                self.succeeded = True
             except Exception:
                 logger.error("Error during pipeline.run call, closing the queue")
                 raise
@@ -171,6 +246,22 @@ class PipelineRunner(Runnable):
         return thread_runner
 
 
+def nested_to_json(table: pa.Table) -> pa.Table:
+    """Serializes list columns to JSON strings, as csv files have no nested types"""
+    for index, field in enumerate(table.schema):
+        if pa.types.is_list(field.type):
+            values = [
+                None if value is None else json.dumps(value)
+                for value in table.column(index).to_pylist()
+            ]
+            table = table.set_column(
+                index,
+                pa.field(field.name, pa.string(), field.nullable),
+                pa.array(values, pa.string()),
+            )
+    return table
+
+
 class ScrapingHost:
     """Scraping host runs the pipeline and scrapy"""
 
@@ -179,22 +270,94 @@ class ScrapingHost:
         queue: ScrapingQueue[T],
         scrapy_runner: ScrapyRunner,
         pipeline_runner: PipelineRunner,
+        checkpoint: t.Optional[CrawlCheckpoint] = None,
+        change_set: t.Optional[ChangeSet] = None,
     ) -> None:
         self.queue = queue
         self.scrapy_runner = scrapy_runner
         self.pipeline_runner = pipeline_runner
+        self.checkpoint = checkpoint
+        self.change_set = change_set
 
     def run(
         self,
         *args: P.args,
         **kwargs: P.kwargs,
     ) -> None:
-        """You can pass kwargs which are passed to `pipeline.run`"""
+        """You can pass kwargs which are passed to `pipeline.run`
+
+        If a checkpoint of an unfinished crawl exists, its items are fed to the
+        pipeline first and the checkpoint is removed once crawling finished
+        and the pipeline succeeded.
+
+        With a change set, only new and changed items are loaded and rows of
+        items missing from a finished crawl are retired afterwards.
+
+        With a content store, its columns are loaded as hashes into the table
+        and their values into the content table next to it.
+        """
+        pipeline = self.pipeline_runner.pipeline
+        table_name = kwargs.get("table_name") or self.pipeline_runner.resource_name
+        if self.change_set is not None:
+            columns = kwargs.get("columns")
+            if (
+                self.queue.arrow_schema is None
+                and isinstance(columns, type)
+                and issubclass(columns, BaseModel)
+            ):
+                # dlt derives the columns of a Pydantic model again on every
+                # batch and drops the merge key, so the load would retire every
+                # row that was not forwarded
+                raise ValueError(
+                    "Change sets with Pydantic columns require an arrow_schema"
+                )
+            kwargs["write_disposition"] = self.change_set.prepare(
+                pipeline, table_name, kwargs.get("write_disposition")
+            )
+            self.pipeline_runner.scraping_resource.apply_hints(
+                merge_key=self.change_set.key
+            )
+        if self.pipeline_runner.content_store is not None:
+            self.pipeline_runner.content_store.prepare(pipeline, table_name)
+
         logger.info("Starting pipeline")
         pipeline_worker = self.pipeline_runner.run(*args, **kwargs)
 
+        if self.checkpoint is not None and self.checkpoint.is_resumable:
+            logger.info("Resuming from checkpoint, replaying scraped items")
+            for item in self.checkpoint.replay_items():
+                self.scrapy_runner.signals.forward(item)
+
+            # Make sure the pipeline picked them up before scrapy can close the queue
+            self.queue.join()
+
         logger.info("Starting scrapy crawler")
         self.scrapy_runner.run()
 
         # Wait to for pipeline finish its job
         pipeline_worker.join()
+        logger.info(f"Queue stats: {self.queue.stats}")
+
+        finished = (
+            self.pipeline_runner.succeeded
+            and self.scrapy_runner.signals.finish_reason == "finished"
+        )
+
+        if self.change_set is not None:
+            if finished:
+                self.change_set.retire_absent(pipeline, table_name)
+            else:
+                logger.info("Crawl did not finish, not retiring missing items")
+            logger.info(f"Change set stats: {self.change_set.stats}")
+
+        if self.pipeline_runner.content_store is not None:
+            logger.info(
+                f"Content store stats: {self.pipeline_runner.content_store.stats}"
+            )
+
+        if self.checkpoint is not None:
+            if finished:
+                self.checkpoint.clear()
+            else:
+                logger.info(f"Keeping checkpoint in {self.checkpoint.path}")
+            self.checkpoint.close()
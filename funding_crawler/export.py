@@ -0,0 +1,354 @@
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from contextlib import ExitStack
+from queue import Queue
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from funding_crawler.helpers import pydantic_to_arrow_schema
+
+# columns of the minimal export files, the HTML ones are converted to markdown
+MIN_COLUMNS = [
+    "id_hash",
+    "deleted",
+    "on_website_from",
+    "url",
+    "title",
+    "description",
+    "more_info",
+    "legal_basis",
+    "funding_type",
+    "funding_area",
+    "funding_location",
+    "eligible_applicants",
+    "funding_body",
+]
+FORMAT_COLUMNS = ["description", "more_info", "legal_basis"]
+
+# columns gen_query adds to the model columns
+QUERY_COLUMNS = {
+    "previous_update_dates": pl.List(pl.Datetime("us", "UTC")),
+    "last_updated": pl.Datetime("us", "UTC"),
+    "on_website_from": pl.Datetime("us", "UTC"),
+    "deleted": pl.Boolean,
+}
+
+DATA_FILE = "data.parquet"
+MIN_PARQUET_FILE = "min_data_format.parquet"
+MIN_CSV_FILE = "min_data_format.csv"
+
+
+def export_schema(model):
+    """
+    Polars schema of the `gen_query` result for a Pydantic model. Every batch is
+    cast to it, so batches with only nulls in a column still match the files.
+    """
+    schema = dict(pl.from_arrow(pydantic_to_arrow_schema(model).empty_table()).schema)
+    return {**schema, **QUERY_COLUMNS}
+
+
+def read_batches(engine, query, schema, batch_size=500):
+    """
+    Read the result of `query` in DataFrames of at most `batch_size` rows through a
+    server-side cursor, so only one batch is held in memory at a time.
+    """
+    with engine.connect().execution_options(
+        stream_results=True, max_row_buffer=batch_size
+    ) as conn:
+        for batch in pl.read_database(
+            query=query,
+            connection=conn,
+            iter_batches=True,
+            batch_size=batch_size,
+            execute_options={"parameters": []},
+            schema_overrides=schema,
+            infer_schema_length=None,
+        ):
+            yield batch.cast(
+                {col: schema[col] for col in batch.columns if col in schema}
+            )
+
+
+def csv_column_type(dtype):
+    # Arrow type a column is parsed as from the csv output of COPY
+    if dtype == pl.String or dtype == pl.List:
+        return pa.string()
+    if dtype == pl.Boolean:
+        return pa.bool_()
+    if isinstance(dtype, pl.Datetime):
+        return pa.timestamp("us", "UTC")
+    return None
+
+
+def decode_lists(df, schema):
+    # list columns are sent as JSON, timestamps in them as ISO 8601 strings
+    for col in df.columns:
+        dtype = schema.get(col)
+        if dtype != pl.List:
+            continue
+        decoded = pl.col(col).str.json_decode(pl.List(pl.String))
+        if isinstance(dtype.inner, pl.Datetime):
+            decoded = decoded.list.eval(
+                pl.element()
+                .str.to_datetime(format="%Y-%m-%dT%H:%M:%S%.f%:z", time_unit="us")
+                .dt.convert_time_zone("UTC")
+            )
+        df = df.with_columns(decoded)
+    return df
+
+
+def read_csv_batches(source, schema, block_size=1 << 22):
+    """
+    Parse the csv output of Postgres' COPY from a file object into DataFrames
+    with `schema`, each from a block of about `block_size` bytes.
+    """
+    reader = pa_csv.open_csv(
+        source,
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={
+                col: csv_column_type(dtype)
+                for col, dtype in schema.items()
+                if csv_column_type(dtype) is not None
+            },
+            true_values=["t"],
+            false_values=["f"],
+            # NULL is written unquoted, empty strings quoted
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    for record_batch in reader:
+        df = decode_lists(pl.from_arrow(record_batch), schema)
+        yield df.cast({col: schema[col] for col in df.columns if col in schema})
+
+
+def copy_batches(engine, query, schema, block_size=1 << 22):
+    """
+    Read the result of `query` with `COPY ... TO STDOUT` as csv, which pyarrow
+    parses into record batches of about `block_size` bytes while Postgres is still
+    sending, instead of building a Python object per value. List columns are sent
+    as JSON and decoded by polars. Yields the same DataFrames as `read_batches`.
+    """
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM ({query}) AS export LIMIT 0")
+        columns = [column[0] for column in cursor.description]
+        selected = ", ".join(
+            f"to_json({col}) AS {col}" if schema.get(col) == pl.List else col
+            for col in columns
+        )
+        cursor.execute("SET LOCAL TIME ZONE 'UTC'")
+
+        read_fd, write_fd = os.pipe()
+        errors = []
+
+        def copy():
+            try:
+                with os.fdopen(write_fd, "wb") as out:
+                    cursor.copy_expert(
+                        f"COPY (SELECT {selected} FROM ({query}) AS export)"
+                        " TO STDOUT WITH (FORMAT csv, HEADER)",
+                        out,
+                    )
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=copy)
+        thread.start()
+        try:
+            with os.fdopen(read_fd, "rb") as source:
+                yield from read_csv_batches(source, schema, block_size)
+        except Exception:
+            thread.join()
+            # an error of COPY ends the stream early, it is the cause
+            if errors:
+                raise errors[0] from None
+            raise
+        finally:
+            # if the batches are not consumed to the end, closing the read end
+            # stops COPY with a broken pipe
+            thread.join()
+        if errors:
+            raise errors[0]
+    finally:
+        conn.close()
+
+
+def markdown_column(df, col):
+    """
+    Markdown of the HTML column `col`: the `<col>_md` column stored at load time,
+    see `add_markdown` and `backfill_markdown`.
+    """
+    if f"{col}_md" in df.columns:
+        return df[f"{col}_md"].alias(col)
+    return pl.Series(col, [None] * len(df), dtype=pl.String)
+
+
+def format_batch(df):
+    """
+    Minimal export columns of a batch, HTML as markdown, see `markdown_column`,
+    and list columns joined with ", ".
+    """
+    mindf = df[MIN_COLUMNS].with_columns(
+        markdown_column(df, col) for col in FORMAT_COLUMNS
+    )
+    for col in mindf.columns:
+        if mindf[col].dtype == pl.List:
+            mindf = mindf.with_columns(pl.col(col).list.join(", ").alias(col))
+    return mindf
+
+
+def format_batches(batches):
+    """
+    Yield each batch with its minimal format, see `format_batch`, and check that
+    `id_hash` is unique across all batches.
+    """
+    id_hashes = set()
+    for df in batches:
+        ids = df["id_hash"].to_list()
+        if len(set(ids)) < len(ids) or not id_hashes.isdisjoint(ids):
+            raise ValueError("id_hash is not unique!")
+        id_hashes.update(ids)
+        yield df, format_batch(df)
+
+
+class ExportFileWriter:
+    """
+    Appends batches to the export file `name` in the binary file object `file`:
+    the full data for `DATA_FILE`, the minimal format for the others.
+    """
+
+    def __init__(self, name, file):
+        self.name = name
+        self.file = file
+        self.parquet_writer = None
+        self.header = True
+
+    def write(self, df, mindf):
+        if self.name == MIN_CSV_FILE:
+            mindf.write_csv(self.file, include_header=self.header)
+            self.header = False
+            return
+        table = (df if self.name == DATA_FILE else mindf).to_arrow()
+        if self.parquet_writer is None:
+            self.parquet_writer = pq.ParquetWriter(
+                self.file, table.schema, compression="zstd"
+            )
+        self.parquet_writer.write_table(table)
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+
+def write_export(batches, directory):
+    """
+    Write the full data as parquet and the minimal format as parquet and csv, one
+    batch at a time.
+
+    Returns:
+        dict: file name -> path of the written files.
+    """
+    paths = {
+        name: os.path.join(directory, name)
+        for name in [DATA_FILE, MIN_PARQUET_FILE, MIN_CSV_FILE]
+    }
+
+    with ExitStack() as stack:
+        writers = []
+        for name, path in paths.items():
+            writer = ExportFileWriter(name, stack.enter_context(open(path, "wb")))
+            stack.callback(writer.close)
+            writers.append(writer)
+
+        for df, mindf in format_batches(batches):
+            for writer in writers:
+                writer.write(df, mindf)
+
+    return paths
+
+
+def write_archive(path, file_names, extra_files, items, spool_size=1 << 26):
+    """
+    Write the zip archive `path` from the `(df, mindf)` pairs in `items`. The first
+    of `file_names` is written straight into its zip entry. A zip file only takes
+    one entry at a time, so the others are spooled in memory up to `spool_size`
+    bytes each and copied in afterwards. `extra_files` maps names of further
+    entries to their content.
+    """
+    with zipfile.ZipFile(path, "w") as zipf, ExitStack() as spool_stack:
+        spooled = {
+            name: spool_stack.enter_context(tempfile.SpooledTemporaryFile(spool_size))
+            for name in file_names[1:]
+        }
+        with ExitStack() as stack:
+            files = {file_names[0]: stack.enter_context(zipf.open(file_names[0], "w"))}
+            writers = []
+            for name, file in {**files, **spooled}.items():
+                writer = ExportFileWriter(name, file)
+                stack.callback(writer.close)
+                writers.append(writer)
+
+            for df, mindf in items:
+                for writer in writers:
+                    writer.write(df, mindf)
+
+        for name, file in spooled.items():
+            file.seek(0)
+            with zipf.open(name, "w") as entry:
+                shutil.copyfileobj(file, entry)
+        for name, content in extra_files.items():
+            zipf.writestr(name, content)
+
+
+def write_export_archives(batches, archives, extra_files=None, queue_size=4):
+    """
+    Write the export files into zip archives without writing them to disk first.
+    `archives` maps the path of each archive to the export file names it contains,
+    `extra_files` maps names of entries added to every archive to their content.
+
+    Batches are read and formatted once, each archive is written by its own thread
+    from a queue of at most `queue_size` batches, so encoding the files overlaps
+    with reading and formatting the next batches.
+    """
+    extra_files = extra_files or {}
+    queues = {path: Queue(queue_size) for path in archives}
+    errors = []
+
+    def write(path):
+        items = iter(queues[path].get, None)
+        try:
+            write_archive(path, archives[path], extra_files, items)
+        except Exception as e:
+            errors.append(e)
+            # take the remaining batches, so the reader does not block on a full queue
+            for _ in items:
+                pass
+
+    threads = [threading.Thread(target=write, args=(path,)) for path in archives]
+    for thread in threads:
+        thread.start()
+    try:
+        for df, mindf in format_batches(batches):
+            if errors:
+                break
+            # polars rejects using one DataFrame from two threads at once, clones
+            # share the data
+            for queue in queues.values():
+                queue.put((df.clone(), mindf.clone()))
+    finally:
+        for queue in queues.values():
+            queue.put(None)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,389 @@
+import hashlib
+import inspect
+import sys
+from datetime import datetime
+from lxml import etree
+from parsel.utils import extract_regex
+from scrapy.http import HtmlResponse
+from funding_crawler.helpers import compute_checksum, gen_license
+
+translate_map = {
+    "Kurzzusammenfassung": "description",
+    "Zusatzinfos": "more_info",
+    "Rechtsgrundlage": "legal_basis",
+    "Ansprechpunkt": "contact_info",
+    "Weiterführende Links": "further_links",
+    "Förderart": "funding_type",
+    "Förderbereich": "funding_area",
+    "Fördergebiet": "funding_location",
+    "Förderberechtigte": "eligible_applicants",
+    "Fördergeber": "funding_body",
+}
+
+list_fields = [
+    "funding_type",
+    "funding_area",
+    "funding_location",
+    "eligible_applicants",
+]
+
+
+def _first(values):
+    return values[0] if values else None
+
+
+def _re_first(regex, values):
+    for value in values:
+        matches = extract_regex(regex, value)
+        if matches:
+            return matches[0]
+    return None
+
+
+def _html(node):
+    return etree.tostring(node, method="html", encoding="unicode", with_tail=False)
+
+
+class SelectorExtractor:
+    """
+    Reference extraction engine evaluating every selector through parsel on each call.
+    """
+
+    def extract(self, selector, url, warn):
+        """
+        Extract the program fields of a detail page.
+
+        Args:
+            selector (Selector): parsel selector of the detail page.
+            url (str): URL of the page, used for warnings.
+            warn (callable): called with a message for every anomaly found.
+
+        Returns:
+            dict: extracted fields, or None if the page has no title.
+        """
+        dct = {}
+
+        dct["title"] = "".join(
+            selector.xpath("//h1[@class='title']//text()").getall()
+        ).strip()
+        dct["title"] = dct["title"] if dct["title"] else None
+
+        if not dct["title"]:
+            warn(f"No title found on page: {url}")
+            return None  # Don't yield items without titles
+
+        tab_names = selector.xpath(
+            "/html/body/main/div[2]/div/div[1]/h2/span//text()"
+        ).getall()
+
+        if tab_names:
+            article_nodes = selector.xpath("//div[@class='content']//article")
+
+            for i, article in enumerate(article_nodes):
+                content = article.get()
+                key = translate_map.get(tab_names[i].strip())
+                dct[key] = content
+        else:
+            content_node = selector.xpath(
+                "//main/div[@class='jumbotron']/following-sibling::div/div[@class='content']"
+            ).get()
+            dct["description"] = content_node
+
+            if not content_node:
+                warn(f"No content structure found on page: {url}")
+
+        dt_elements = selector.xpath("//dt")
+        dd_elements = selector.xpath("//dd")
+
+        if (
+            not dt_elements
+            and not dd_elements
+            and not tab_names
+            and not dct.get("description")
+        ):
+            warn(f"No extractable data fields found on page: {url}")
+
+        for dt, dd in zip(dt_elements, dd_elements):
+            key = dt.xpath("text()").get()
+            if key:
+                key = translate_map.get(key.strip().replace(":", ""))
+                if not key:
+                    continue
+            else:
+                continue
+
+            if key in list_fields:
+                lst_str = dd.xpath("text()").get()
+                lst = lst_str.strip().split(", ") if lst_str else []
+                dct[key] = lst if lst else None
+
+            elif key == "funding_body":
+                # /html/body/main/div[1]/div[2]/div/dl/dd[4]/p/a/span
+                str = dd.xpath(
+                    "p[@class='card--title']/a[@title='Öffnet die Einzelsicht']/span[@class='link--label']/text()"
+                ).get()
+                dct[key] = str.strip() if str else None
+
+            elif key == "further_links":
+                links = []
+                for link in dd.xpath(".//a[@href]"):
+                    link_url = link.xpath("@href").get()
+                    if not link_url.startswith("http"):
+                        link_url = "https://www.foerderdatenbank.de/" + link_url
+                    links.append(link_url)
+
+                dct[key] = links if links else None
+
+            elif key == "contact_info":
+                dct["contact_info_institution"] = (
+                    " ".join(
+                        dd.xpath(
+                            ".//a[@title='Öffnet die Einzelsicht']/span[@class='link--label']//text()"
+                        ).getall()
+                    ).strip()
+                    or None
+                )
+
+                dct["contact_info_street"] = (
+                    dd.xpath(".//p[@class='adr']/text()").get() or ""
+                ).strip() or None
+
+                dct["contact_info_city"] = (
+                    dd.xpath(".//p[@class='locality']/text()").get() or ""
+                ).strip() or None
+
+                dct["contact_info_fax"] = (
+                    dd.xpath(".//p[@class='fax']/text()").re_first(r"Fax:\s*(.*)")
+                    or None
+                )
+
+                dct["contact_info_phone"] = (
+                    dd.xpath(".//p[@class='tel']/text()").re_first(r"Tel:\s*(.*)")
+                    or None
+                )
+
+                dct["contact_info_email"] = (
+                    dd.xpath(".//p[@class='email']/a[@href]")
+                    .xpath("@href")
+                    .re_first(r"mailto:(.*)")
+                    or None
+                )
+
+                dct["contact_info_website"] = (
+                    dd.xpath(".//p[@class='website']/a[@href]").xpath("@href").get()
+                    or None
+                )
+
+            else:
+                value = dd.xpath("text()").get()
+                dct[key] = value.strip() if value else None
+
+        return dct
+
+
+class CompiledExtractor:
+    """
+    Extraction engine with all XPath expressions compiled once at class level.
+
+    Works directly on the lxml tree of the page and walks the definition list in a
+    single pass. Produces the same dict as `SelectorExtractor`.
+    """
+
+    title_xpath = etree.XPath("//h1[@class='title']//text()", smart_strings=False)
+    tab_names_xpath = etree.XPath(
+        "/html/body/main/div[2]/div/div[1]/h2/span//text()", smart_strings=False
+    )
+    articles_xpath = etree.XPath("//div[@class='content']//article")
+    content_xpath = etree.XPath(
+        "//main/div[@class='jumbotron']/following-sibling::div/div[@class='content']"
+    )
+
+    text_xpath = etree.XPath("text()", smart_strings=False)
+    funding_body_xpath = etree.XPath(
+        "p[@class='card--title']/a[@title='Öffnet die Einzelsicht']/span[@class='link--label']/text()",
+        smart_strings=False,
+    )
+    links_xpath = etree.XPath(".//a[@href]/@href", smart_strings=False)
+
+    institution_xpath = etree.XPath(
+        ".//a[@title='Öffnet die Einzelsicht']/span[@class='link--label']//text()",
+        smart_strings=False,
+    )
+    street_xpath = etree.XPath(".//p[@class='adr']/text()", smart_strings=False)
+    city_xpath = etree.XPath(".//p[@class='locality']/text()", smart_strings=False)
+    fax_xpath = etree.XPath(".//p[@class='fax']/text()", smart_strings=False)
+    phone_xpath = etree.XPath(".//p[@class='tel']/text()", smart_strings=False)
+    email_xpath = etree.XPath(
+        ".//p[@class='email']/a[@href]/@href", smart_strings=False
+    )
+    website_xpath = etree.XPath(
+        ".//p[@class='website']/a[@href]/@href", smart_strings=False
+    )
+
+    def extract(self, selector, url, warn):
+        """
+        Extract the program fields of a detail page, see `SelectorExtractor.extract`.
+        """
+        root = selector.root
+        dct = {}
+
+        title = "".join(self.title_xpath(root)).strip()
+        dct["title"] = title if title else None
+
+        if not dct["title"]:
+            warn(f"No title found on page: {url}")
+            return None  # Don't yield items without titles
+
+        tab_names = self.tab_names_xpath(root)
+
+        if tab_names:
+            for i, article in enumerate(self.articles_xpath(root)):
+                key = translate_map.get(tab_names[i].strip())
+                dct[key] = _html(article)
+        else:
+            content_node = _first(self.content_xpath(root))
+            dct["description"] = (
+                _html(content_node) if content_node is not None else None
+            )
+
+            if not dct["description"]:
+                warn(f"No content structure found on page: {url}")
+
+        dt_elements = []
+        dd_elements = []
+        for node in root.iter("dt", "dd"):
+            if node.tag == "dt":
+                dt_elements.append(node)
+            else:
+                dd_elements.append(node)
+
+        if (
+            not dt_elements
+            and not dd_elements
+            and not tab_names
+            and not dct.get("description")
+        ):
+            warn(f"No extractable data fields found on page: {url}")
+
+        for dt, dd in zip(dt_elements, dd_elements):
+            key = _first(self.text_xpath(dt))
+            if key:
+                key = translate_map.get(key.strip().replace(":", ""))
+                if not key:
+                    continue
+            else:
+                continue
+
+            if key in list_fields:
+                lst_str = _first(self.text_xpath(dd))
+                lst = lst_str.strip().split(", ") if lst_str else []
+                dct[key] = lst if lst else None
+
+            elif key == "funding_body":
+                value = _first(self.funding_body_xpath(dd))
+                dct[key] = value.strip() if value else None
+
+            elif key == "further_links":
+                links = []
+                for link_url in self.links_xpath(dd):
+                    if not link_url.startswith("http"):
+                        link_url = "https://www.foerderdatenbank.de/" + link_url
+                    links.append(str(link_url))
+
+                dct[key] = links if links else None
+
+            elif key == "contact_info":
+                dct["contact_info_institution"] = (
+                    " ".join(self.institution_xpath(dd)).strip() or None
+                )
+                dct["contact_info_street"] = (
+                    _first(self.street_xpath(dd)) or ""
+                ).strip() or None
+                dct["contact_info_city"] = (
+                    _first(self.city_xpath(dd)) or ""
+                ).strip() or None
+                dct["contact_info_fax"] = (
+                    _re_first(r"Fax:\s*(.*)", self.fax_xpath(dd)) or None
+                )
+                dct["contact_info_phone"] = (
+                    _re_first(r"Tel:\s*(.*)", self.phone_xpath(dd)) or None
+                )
+                dct["contact_info_email"] = (
+                    _re_first(r"mailto:(.*)", self.email_xpath(dd)) or None
+                )
+                dct["contact_info_website"] = _first(self.website_xpath(dd)) or None
+
+            else:
+                value = _first(self.text_xpath(dd))
+                dct[key] = value.strip() if value else None
+
+        return dct
+
+
+extraction_engines = {
+    "compiled": CompiledExtractor,
+    "selectors": SelectorExtractor,
+}
+
+
+def extractor_version(engine):
+    """
+    Digest of the extraction code of `engine` and of the checksum, items extracted
+    by another version are not taken from the validator cache.
+    """
+    digest = hashlib.sha256(engine.encode())
+    digest.update(inspect.getsource(sys.modules[__name__]).encode())
+    digest.update(inspect.getsource(compute_checksum).encode())
+    return digest.hexdigest()[:16]
+
+
+def extract_item(extractor, selector, url, warn):
+    """
+    Extract a detail page and add identifiers, checksum and license info.
+
+    Returns:
+        dict: the item, or None if the page has no title.
+    """
+    dct = extractor.extract(selector, url, warn)
+
+    if dct is None:
+        return None
+
+    url_parts = url.partition("Foerderprogramm/")
+
+    if url_parts[1] == "":
+        url_parts = url.partition(
+            "Archiv/"
+        )  # e.g. 'https://www.foerderdatenbank.de/FDB/Content/DE/Archiv/innovativer-schiffbau-sichert-arbeitsplaetze.html'
+
+    foerderprogramm_url_id = url_parts[2].replace("/", "-").replace(".html", "").lower()
+    foerderprogramm_hash_id = hashlib.md5(foerderprogramm_url_id.encode()).hexdigest()
+
+    dct["url"] = url
+    dct["id_hash"] = foerderprogramm_hash_id
+    dct["id_url"] = foerderprogramm_url_id
+
+    ignore_fields = ["url", "id_hash", "id_url"]
+    watch_fields = [x for x in list(dct.keys()) if x not in ignore_fields]
+
+    dct["checksum"] = compute_checksum(dct, watch_fields)
+
+    date = datetime.today()
+    dct["license_info"] = gen_license(dct["title"], date, dct["url"])
+
+    return dct
+
+
+def extract_item_from_body(engine, body, url, encoding):
+    """
+    Worker entry point for process pools: parse the raw body and extract the item.
+
+    Returns:
+        tuple: the item (or None) and the list of warnings raised during extraction.
+    """
+    warnings = []
+    response = HtmlResponse(url=url, body=body, encoding=encoding)
+    item = extract_item(
+        extraction_engines[engine](), response.selector, url, warnings.append
+    )
+    return item, warnings
@@ -2,9 +2,11 @@ import hashlib
 import json
 from pydantic import BaseModel
 import polars as pl
+import pyarrow as pa
 import requests
 from typing import Union, Dict, Any
 from bs4 import BeautifulSoup
+from markdownify import markdownify as md
 import random
 import time
 
@@ -67,12 +69,30 @@ def gen_comp_c(dataset_name, columns):
             AND aggregated_data_retired.last_updated = {dataset_name}.on_website_to"""
 
 
-def gen_query(dataset_name, columns):
+def gen_content_joins(content_table, content_columns, stored_value):
+    # columns moved to a content table hold a content hash, rows loaded before hold the value
+    return "".join(
+        f"""
+        LEFT JOIN
+            {content_table} AS {col}_content
+            ON {col}_content.content_hash = {stored_value(col)}"""
+        for col in content_columns
+    )
+
+
+def gen_query(dataset_name, columns, content_table=None, content_columns=()):
     coalesce_columns = [
-        f"COALESCE(data_new.{col}, most_recent_data_retired.{col}) AS {col}"
+        f"COALESCE({col}_content.content, data_new.{col}, most_recent_data_retired.{col}) AS {col}"
+        if col in content_columns
+        else f"COALESCE(data_new.{col}, most_recent_data_retired.{col}) AS {col}"
         for col in columns
         if col != "id_hash"
     ]
+    content_joins = gen_content_joins(
+        content_table,
+        content_columns,
+        lambda col: f"COALESCE(data_new.{col}, most_recent_data_retired.{col})",
+    )
 
     query = f"""
     WITH data_new AS (
@@ -110,11 +130,64 @@ def gen_query(dataset_name, columns):
             ON data_new.new_id_hash = most_recent_data_retired.agg_id
         LEFT JOIN
             deleted_records
-            ON COALESCE(data_new.new_id_hash, most_recent_data_retired.agg_id) = deleted_records.agg_id
+            ON COALESCE(data_new.new_id_hash, most_recent_data_retired.agg_id) = deleted_records.agg_id{content_joins}
     """
     return query
 
 
+def gen_query_columns(columns):
+    # names of the columns returned by gen_query, in order
+    return [
+        "id_hash",
+        *[col for col in columns if col != "id_hash"],
+        "previous_update_dates",
+        "last_updated",
+        "on_website_from",
+        "deleted",
+    ]
+
+
+# HTML tab fields that are also stored as markdown in `<field>_md`
+MARKDOWN_FIELDS = ["description", "more_info", "legal_basis"]
+
+
+def add_markdown(batch):
+    """
+    Set the `<field>_md` markdown version of each HTML tab field where it is
+    missing, in a list of items or an Arrow table. Runs on the pipeline thread,
+    see `PipelineRunner`, so the conversion does not block the crawl.
+    """
+    if not isinstance(batch, pa.Table):
+        for item in batch:
+            for field in MARKDOWN_FIELDS:
+                if item.get(f"{field}_md") is None and item.get(field) is not None:
+                    item[f"{field}_md"] = md(item[field])
+        return batch
+
+    for field in MARKDOWN_FIELDS:
+        if field not in batch.column_names:
+            continue
+        html = batch.column(field).to_pylist()
+        stored = (
+            batch.column(f"{field}_md").to_pylist()
+            if f"{field}_md" in batch.column_names
+            else [None] * len(html)
+        )
+        values = pa.array(
+            [
+                md(value) if markdown is None and value is not None else markdown
+                for value, markdown in zip(html, stored)
+            ],
+            pa.string(),
+        )
+        if f"{field}_md" in batch.column_names:
+            index = batch.column_names.index(f"{field}_md")
+            batch = batch.set_column(index, batch.field(index), values)
+        else:
+            batch = batch.append_column(f"{field}_md", values)
+    return batch
+
+
 def gen_license(title, scrape_date, url):
     temp = f"""
 {title} von Bundesministerium für Wirtschaft und Klimaschutz, lizensiert unter CC BY-ND 3.0 DE (https://creativecommons.org/licenses/by-nd/3.0/de/deed.de), zuletzt abgerufen am {scrape_date} unter {url}
@@ -139,6 +212,28 @@ def pydantic_to_polars_schema(model: type[BaseModel]) -> Dict[str, Any]:
     return schema_overrides
 
 
+def pydantic_to_arrow_schema(model: type[BaseModel]) -> pa.Schema:
+    """Convert Pydantic model fields to an Arrow schema, Optional fields are nullable."""
+    fields = []
+    for field_name, field in model.__annotations__.items():
+        base_type = field
+        nullable = False
+        if hasattr(field, "__origin__") and field.__origin__ is Union:
+            base_type = field.__args__[0]
+            nullable = type(None) in field.__args__
+
+        if getattr(base_type, "__origin__", None) is list:
+            arrow_type = pa.list_(pa.string())
+        elif base_type is str:
+            arrow_type = pa.string()
+        else:
+            raise TypeError(f"Unsupported type {field} of field {field_name}")
+
+        fields.append(pa.field(field_name, arrow_type, nullable=nullable))
+
+    return pa.schema(fields)
+
+
 def get_hits_count(url, max_retries=3, backoff_factor=0.5):
     """
     Extract number of funding programs with retry logic.
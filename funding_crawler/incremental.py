@@ -0,0 +1,120 @@
+import polars as pl
+from sqlalchemy import inspect
+from w3lib.url import canonicalize_url
+
+from funding_crawler.dlt_utils.content import content_table_name
+from funding_crawler.helpers import (
+    gen_comp_b,
+    gen_content_joins,
+    pydantic_to_polars_schema,
+)
+from funding_crawler.models import FundingProgramSchema
+
+
+def gen_known_programs_query(
+    dataset_name, columns, content_table=None, content_columns=()
+):
+    # current version of every program still on the website, with its change history
+    selected_columns = [
+        f"COALESCE({col}_content.content, data_new.{col}) AS {col}"
+        if col in content_columns
+        else f"data_new.{col}"
+        for col in columns
+        if col != "id_hash"
+    ]
+    content_joins = gen_content_joins(
+        content_table, content_columns, lambda col: f"data_new.{col}"
+    )
+    return f"""
+    WITH data_new AS (
+        {gen_comp_b(dataset_name, columns)}
+    ),
+    history AS (
+        SELECT
+            id_hash AS hist_id,
+            MIN(on_website_from) AS first_seen,
+            COUNT(*) AS version_count
+        FROM
+            {dataset_name}
+        GROUP BY
+            id_hash
+    )
+    SELECT
+        data_new.new_id_hash AS id_hash,
+        {", ".join(selected_columns)},
+        history.first_seen,
+        history.version_count
+    FROM
+        data_new
+    JOIN
+        history ON data_new.new_id_hash = history.hist_id{content_joins}
+    """
+
+
+def fetch_known_programs(engine, dataset_name, columns, content_columns=()):
+    """
+    Load the current version of all programs still on the website. Values of
+    `content_columns` are resolved from the content table, see `ContentStore`.
+
+    Returns:
+        dict: canonical URL -> row with all columns plus `first_seen` and
+            `version_count`, empty if the table does not exist yet.
+    """
+    schema, table = dataset_name.split(".")
+    if not inspect(engine).has_table(table, schema=schema):
+        return {}
+
+    with engine.connect() as conn:
+        df = pl.read_database(
+            query=gen_known_programs_query(
+                dataset_name,
+                columns,
+                content_table_name(dataset_name) if content_columns else None,
+                content_columns,
+            ),
+            connection=conn,
+            execute_options={"parameters": []},
+            schema_overrides=pydantic_to_polars_schema(FundingProgramSchema),
+            infer_schema_length=None,
+        )
+
+    df = df.with_columns(pl.col("first_seen").dt.date())
+
+    return {canonicalize_url(row["url"]): row for row in df.to_dicts()}
+
+
+def revisit_interval(first_seen, version_count, today, min_days, max_days):
+    """
+    Days between two visits of a program, derived from how often it changed
+    since it was first seen. Programs are revisited twice per expected change,
+    programs that never changed every `max_days`.
+    """
+    changes = version_count - 1
+    if changes <= 0:
+        return max_days
+
+    observed_days = max((today - first_seen).days, 1)
+    interval = (observed_days / changes) / 2
+
+    return int(min(max(interval, min_days), max_days))
+
+
+def is_due(id_hash, interval_days, today, run_period_days):
+    """
+    Whether a program with the given revisit interval is fetched in a run on `today`.
+
+    Each program gets a fixed phase from its hash, so revisits of programs with
+    the same interval are spread evenly over the runs.
+    """
+    if interval_days <= run_period_days:
+        return True
+
+    phase = int(id_hash[:8], 16) % interval_days
+    return (today.toordinal() + phase) % interval_days < run_period_days
+
+
+def is_full_sweep(today, full_sweep_days, run_period_days):
+    """
+    Whether the run on `today` has to fetch every program regardless of its schedule.
+    """
+    return today.toordinal() % full_sweep_days < run_period_days
@@ -0,0 +1,417 @@
+import argparse
+import os
+
+import dlt
+from dlt.destinations.exceptions import DatabaseUndefinedRelation
+from markdownify import markdownify as md
+
+from funding_crawler.current_state import current_table_name
+from funding_crawler.dlt_utils.content import (
+    content_hash,
+    content_table_name,
+    create_content_table,
+    sql_content_hash,
+)
+from funding_crawler.helpers import MARKDOWN_FIELDS
+
+# large HTML and markdown columns stored once per distinct value in the content table
+CONTENT_COLUMNS = [
+    "description",
+    "more_info",
+    "legal_basis",
+    "description_md",
+    "more_info_md",
+    "legal_basis_md",
+]
+
+# name suffix, indexed columns and predicate of the indexes on the history table
+HISTORY_INDEXES = [
+    # current versions: gen_comp_b, the change set lookup and the scd2 merge/retire
+    ("active_id_hash", "(id_hash) INCLUDE (checksum)", "on_website_to IS NULL"),
+    ("active_checksum", "(checksum)", "on_website_to IS NULL"),
+    # retired versions: gen_comp_a groups them by id_hash, gen_comp_c joins on both
+    ("retired_id_hash", "(id_hash, on_website_to)", "on_website_to IS NOT NULL"),
+    # versions of a program in order, see compact_duplicates
+    ("versions", "(id_hash, on_website_from, _dlt_load_id, _dlt_id)", None),
+    # rows inserted or retired since the last refresh of the current state table
+    ("on_website_from", "(on_website_from)", None),
+    ("on_website_to", "(on_website_to)", "on_website_to IS NOT NULL"),
+]
+
+
+def index_name(table_name, suffix):
+    return f"{table_name}_{suffix}"
+
+
+def history_index_statements(table_name, qualified_table_name):
+    """
+    Returns:
+        dict: index name -> CREATE INDEX statement for every index in HISTORY_INDEXES.
+    """
+    statements = {}
+    for suffix, columns, predicate in HISTORY_INDEXES:
+        name = index_name(table_name, suffix)
+        statement = (
+            f"CREATE INDEX IF NOT EXISTS {name} ON {qualified_table_name} {columns}"
+        )
+        if predicate:
+            statement += f" WHERE {predicate}"
+        statements[name] = statement
+    return statements
+
+
+def ensure_indexes(pipeline, table_name):
+    """
+    Create the missing indexes of HISTORY_INDEXES on the history table and update
+    its planner statistics if any were created. Safe to run after every load.
+
+    Only Postgres destinations are indexed, the indexes use INCLUDE and predicates.
+
+    Returns:
+        list: names of the created indexes.
+    """
+    if pipeline.destination.destination_name != "postgres":
+        return []
+
+    with pipeline.sql_client() as client:
+        qualified_table_name = client.make_qualified_table_name(table_name)
+        existing = {
+            name
+            for (name,) in client.execute_sql(
+                "SELECT indexname FROM pg_indexes"
+                " WHERE schemaname = %s AND tablename = %s",
+                client.dataset_name,
+                table_name,
+            )
+            or []
+        }
+
+        created = []
+        for name, statement in history_index_statements(
+            table_name, qualified_table_name
+        ).items():
+            if name not in existing:
+                client.execute_sql(statement)
+                created.append(name)
+
+        if created:
+            client.execute_sql(f"ANALYZE {qualified_table_name}")
+
+    return created
+
+
+def gen_versions_query(qualified_table_name):
+    # a version is a duplicate if the previous version of the program, ordered by
+    # on_website_from, has the same checksum and its validity touches or overlaps
+    # its own; a program changed back to an earlier checksum (A -> B -> A) keeps
+    # both As. Consecutive duplicates form a run with the version before them.
+    return f"""
+        SELECT
+            *,
+            SUM(CASE WHEN is_duplicate THEN 0 ELSE 1 END) OVER (
+                PARTITION BY id_hash
+                ORDER BY on_website_from, _dlt_load_id, _dlt_id
+                ROWS UNBOUNDED PRECEDING
+            ) AS run_number
+        FROM (
+            SELECT
+                _dlt_id,
+                _dlt_load_id,
+                id_hash,
+                on_website_from,
+                on_website_to,
+                COALESCE(
+                    checksum = LAG(checksum) OVER versions
+                    AND (
+                        LAG(on_website_to) OVER versions IS NULL
+                        OR LAG(on_website_to) OVER versions >= on_website_from
+                    ),
+                    FALSE
+                ) AS is_duplicate
+            FROM
+                {qualified_table_name}
+            WINDOW versions AS (
+                PARTITION BY id_hash
+                ORDER BY on_website_from, _dlt_load_id, _dlt_id
+            )
+        ) AS versions"""
+
+
+def gen_duplicates_query(qualified_table_name):
+    return f"""
+        SELECT _dlt_id, _dlt_load_id
+        FROM ({gen_versions_query(qualified_table_name)}) AS versions
+        WHERE is_duplicate"""
+
+
+def gen_merged_validity_query(qualified_table_name):
+    # the first version of a run is kept and valid until the end of the run,
+    # still valid if any version of the run is
+    return f"""
+        SELECT kept._dlt_id, kept._dlt_load_id, runs.on_website_to
+        FROM ({gen_versions_query(qualified_table_name)}) AS kept
+        JOIN (
+            SELECT
+                id_hash,
+                run_number,
+                CASE
+                    WHEN COUNT(*) > COUNT(on_website_to) THEN NULL
+                    ELSE MAX(on_website_to)
+                END AS on_website_to
+            FROM ({gen_versions_query(qualified_table_name)}) AS versions
+            GROUP BY id_hash, run_number
+            HAVING COUNT(*) > 1
+        ) AS runs ON kept.id_hash = runs.id_hash AND kept.run_number = runs.run_number
+        WHERE NOT kept.is_duplicate"""
+
+
+def compact_duplicates(pipeline, table_name, dry_run=False):
+    """
+    Merge duplicate versions, rows with the same id_hash and checksum as the
+    previous version of the program whose validity touches or overlaps it, into
+    that version in one transaction. The kept version is valid until the end of
+    the merged ones, the others are deleted.
+
+    Returns:
+        list: (id_hash, checksum, _dlt_load_id, on_website_from, on_website_to) of
+            the deleted rows, or of the rows that would be deleted with `dry_run`.
+    """
+    with pipeline.sql_client() as client:
+        history = client.make_qualified_table_name(table_name)
+        returned = ", ".join(
+            f"history.{col}"
+            for col in [
+                "id_hash",
+                "checksum",
+                "_dlt_load_id",
+                "on_website_from",
+                "on_website_to",
+            ]
+        )
+        # rows are identified by _dlt_id and _dlt_load_id together
+        matches = (
+            "history._dlt_id = {alias}._dlt_id"
+            " AND history._dlt_load_id = {alias}._dlt_load_id"
+        )
+
+        if dry_run:
+            return (
+                client.execute_sql(
+                    f"SELECT {returned} FROM {history} AS history"
+                    f" JOIN ({gen_duplicates_query(history)}) AS duplicates"
+                    f" ON {matches.format(alias='duplicates')}"
+                    " ORDER BY history.id_hash, history.checksum, history._dlt_load_id"
+                )
+                or []
+            )
+
+        with client.begin_transaction():
+            # extending the kept versions does not change the runs
+            client.execute_sql(
+                f"UPDATE {history} AS history"
+                " SET on_website_to = merged.on_website_to"
+                f" FROM ({gen_merged_validity_query(history)}) AS merged"
+                f" WHERE {matches.format(alias='merged')}"
+                " AND history.on_website_to IS DISTINCT FROM merged.on_website_to"
+            )
+            return (
+                client.execute_sql(
+                    f"DELETE FROM {history} AS history"
+                    f" USING ({gen_duplicates_query(history)}) AS duplicates"
+                    f" WHERE {matches.format(alias='duplicates')}"
+                    f" RETURNING {returned}"
+                )
+                or []
+            )
+
+
+def externalize_content(pipeline, table_name, content_columns=CONTENT_COLUMNS):
+    """
+    Move the values of `content_columns` that are stored in the history table
+    itself, by loads before the content store was enabled, to the content table
+    and replace them with their hash. Postgres only returns the space of the
+    replaced values once the table is rewritten, e.g. by VACUUM FULL.
+
+    Returns:
+        int: number of replaced values.
+    """
+    destination_name = pipeline.destination.destination_name
+    with pipeline.sql_client() as client:
+        history = client.make_qualified_table_name(table_name)
+        content = client.make_qualified_table_name(content_table_name(table_name))
+
+        replaced = 0
+        with client.begin_transaction():
+            create_content_table(client, content)
+            for col in content_columns:
+                # values that are not the hash of a stored value
+                inline = (
+                    f"history.{col} IS NOT NULL AND NOT EXISTS"
+                    f" (SELECT 1 FROM {content} WHERE content_hash = history.{col})"
+                )
+                client.execute_sql(
+                    f"INSERT INTO {content} (content_hash, content)"
+                    f" SELECT DISTINCT {sql_content_hash(destination_name, col)}, {col}"
+                    f" FROM {history} AS history WHERE {inline}"
+                    " ON CONFLICT (content_hash) DO NOTHING"
+                )
+                replaced += len(
+                    client.execute_sql(
+                        f"UPDATE {history} AS history"
+                        f" SET {col} = {sql_content_hash(destination_name, col)}"
+                        f" WHERE {inline} RETURNING 1"
+                    )
+                    or []
+                )
+
+    return replaced
+
+
+def _insert_pairs(client, qualified_table_name, rows, suffix="", chunk_size=1000):
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start : start + chunk_size]
+        client.execute_sql(
+            f"INSERT INTO {qualified_table_name} VALUES"
+            f" {', '.join(['(%s, %s)'] * len(chunk))}{suffix}",
+            *[value for row in chunk for value in row],
+        )
+
+
+def backfill_markdown(
+    pipeline, table_name, content_columns=CONTENT_COLUMNS, convert=None
+):
+    """
+    Set the `<field>_md` markdown of the MARKDOWN_FIELDS in the versions loaded
+    before these columns were added, which `add_markdown` only fills for new and
+    changed programs. Nothing is scanned but the current state table once every
+    current version has its markdown, so this is safe to run after every load.
+
+    `convert` maps a list of HTML values to their markdown, `markdownify` by
+    default. Values of `content_columns` are read from and stored in the content
+    table, see `ContentStore`.
+
+    Returns:
+        set: id_hash of the programs with updated versions, their current state
+            has to be refreshed.
+    """
+    if convert is None:
+        convert = lambda values: [md(value) for value in values]  # noqa: E731
+
+    with pipeline.sql_client() as client:
+        history = client.make_qualified_table_name(table_name)
+        current = client.make_qualified_table_name(current_table_name(table_name))
+        content = client.make_qualified_table_name(content_table_name(table_name))
+
+        missing = " OR ".join(
+            f"({field}_md IS NULL AND {field} IS NOT NULL)" for field in MARKDOWN_FIELDS
+        )
+        try:
+            if not client.execute_sql(
+                f"SELECT id_hash FROM {current} WHERE {missing} LIMIT 1"
+            ):
+                return set()
+        except DatabaseUndefinedRelation:
+            # not refreshed yet, the history is checked instead
+            pass
+
+        updated = set()
+        with client.begin_transaction():
+            if any(col in content_columns for col in MARKDOWN_FIELDS):
+                create_content_table(client, content)
+            client.execute_sql("DROP TABLE IF EXISTS markdown_backfill")
+            client.execute_sql(
+                "CREATE TEMPORARY TABLE markdown_backfill"
+                " (stored TEXT PRIMARY KEY, markdown TEXT NOT NULL)"
+            )
+            for field in MARKDOWN_FIELDS:
+                # stored value of the HTML, its hash for content columns, -> HTML
+                if field in content_columns:
+                    query = (
+                        f"SELECT DISTINCT history.{field}, content.content"
+                        f" FROM {history} AS history JOIN {content} AS content"
+                        f" ON content.content_hash = history.{field}"
+                    )
+                else:
+                    query = (
+                        f"SELECT DISTINCT {field}, {field} FROM {history} AS history"
+                    )
+                html = client.execute_sql(
+                    f"{query} WHERE history.{field}_md IS NULL"
+                    f" AND history.{field} IS NOT NULL"
+                )
+                if not html:
+                    continue
+
+                markdown = convert([value for _, value in html])
+                if f"{field}_md" in content_columns:
+                    contents = {content_hash(value): value for value in markdown}
+                    _insert_pairs(
+                        client,
+                        content,
+                        list(contents.items()),
+                        " ON CONFLICT (content_hash) DO NOTHING",
+                    )
+                    markdown = [content_hash(value) for value in markdown]
+
+                client.execute_sql("DELETE FROM markdown_backfill")
+                _insert_pairs(
+                    client,
+                    "markdown_backfill",
+                    [(stored, value) for (stored, _), value in zip(html, markdown)],
+                )
+                rows = client.execute_sql(
+                    f"UPDATE {history} AS history"
+                    f" SET {field}_md = markdown_backfill.markdown"
+                    " FROM markdown_backfill"
+                    f" WHERE history.{field} = markdown_backfill.stored"
+                    f" AND history.{field}_md IS NULL"
+                    " RETURNING history.id_hash"
+                )
+                updated.update(id_hash for (id_hash,) in rows or [])
+            client.execute_sql("DROP TABLE markdown_backfill")
+
+    return updated
+
+
+def main():
+    """
+    Maintenance of the history table: `compact` deletes duplicate versions, or
+    lists them with --dry-run, `externalize` moves the content columns of rows
+    loaded before the content store was enabled to the content table.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("command", choices=["compact", "externalize"])
+    parser.add_argument(
+        "--credentials",
+        default=os.getenv("POSTGRES_CONN_STR"),
+        help="Postgres connection string, defaults to $POSTGRES_CONN_STR",
+    )
+    parser.add_argument("--dataset", default="foerderdatenbankdumpbackend")
+    parser.add_argument("--table", help="history table, defaults to the dataset name")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    if not args.credentials:
+        parser.error("--credentials or $POSTGRES_CONN_STR is required")
+
+    pipeline = dlt.pipeline(
+        pipeline_name="fundingcrawler_maintenance",
+        destination=dlt.destinations.postgres(args.credentials),
+        dataset_name=args.dataset,
+    )
+    table_name = args.table or args.dataset
+
+    if args.command == "externalize":
+        replaced = externalize_content(pipeline, table_name)
+        print(f"{replaced} values moved to {content_table_name(table_name)}")
+        return
+
+    rows = compact_duplicates(pipeline, table_name, args.dry_run)
+
+    for id_hash, checksum, load_id, valid_from, valid_to in rows:
+        print(f"{id_hash} {checksum[:12]} load {load_id} {valid_from} - {valid_to}")
+    action = "would be deleted" if args.dry_run else "deleted"
+    print(f"{len(rows)} duplicate versions {action}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import logging
+import math
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value):
+    """
+    parse a Retry-After header value (seconds or HTTP date) into seconds, None if invalid
+    """
+    if not value:
+        return None
+
+    value = value.decode("latin-1").strip() if isinstance(value, bytes) else value
+    if value.isdigit():
+        return float(value)
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class _Window:
+    def __init__(self, cooldown=False):
+        self.responses = 0
+        self.errors = 0
+        self.latency = 0.0
+        # the window started with a decrease, responses to requests sent before it
+        # must not decrease again
+        self.cooldown = cooldown
+
+
+class AdaptiveConcurrencyMiddleware:
+    """
+    Downloader middleware adjusting concurrency and delay of each download slot
+    with an AIMD policy.
+
+    Responses are collected in windows of `ADAPTIVE_WINDOW` responses per slot. After
+    a window without congestion (error rate and mean latency below the configured
+    targets), concurrency is increased by one and the delay multiplied by
+    `ADAPTIVE_DELAY_RECOVERY`, but decreased by at least `ADAPTIVE_DELAY_STEP`.
+    Congestion, i.e. too many `RETRY_HTTP_CODES` responses or exceptions in a window
+    or a mean latency above twice the target, multiplies concurrency by
+    `ADAPTIVE_BACKOFF_FACTOR` and doubles the delay. A Retry-After header on an
+    error response multiplies concurrency the same way and raises the delay to the
+    Retry-After value. At most one decrease happens per window, so a burst of
+    responses to requests that were in flight at the same time only counts once.
+    Values stay within the configured floor and ceiling, decisions are recorded in
+    the crawl stats.
+
+    Note that `CONCURRENT_REQUESTS` still caps the total number of requests.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+
+        if not settings.getbool("ADAPTIVE_CONCURRENCY_ENABLED"):
+            raise NotConfigured
+
+        self.crawler = crawler
+        self.stats = crawler.stats
+
+        self.min_concurrency = settings.getint("ADAPTIVE_CONCURRENCY_MIN", 1)
+        self.max_concurrency = settings.getint("ADAPTIVE_CONCURRENCY_MAX", 16)
+        self.min_delay = settings.getfloat("ADAPTIVE_DELAY_MIN", 0.0)
+        self.max_delay = settings.getfloat("ADAPTIVE_DELAY_MAX", 30.0)
+        self.delay_step = settings.getfloat("ADAPTIVE_DELAY_STEP", 0.1)
+        self.delay_recovery = settings.getfloat("ADAPTIVE_DELAY_RECOVERY", 0.75)
+        self.target_latency = settings.getfloat("ADAPTIVE_TARGET_LATENCY", 2.0)
+        self.max_error_rate = settings.getfloat("ADAPTIVE_MAX_ERROR_RATE", 0.05)
+        self.backoff_factor = settings.getfloat("ADAPTIVE_BACKOFF_FACTOR", 0.5)
+        self.window_size = settings.getint("ADAPTIVE_WINDOW", 20)
+        self.error_codes = {int(code) for code in settings.getlist("RETRY_HTTP_CODES")}
+
+        self.windows = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_response(self, request, response, spider):
+        key, slot = self._get_slot(request)
+        if slot is None:
+            return response
+
+        window = self._window(key, slot)
+        window.responses += 1
+        window.latency += request.meta.get("download_latency", 0.0)
+
+        if response.status in self.error_codes:
+            window.errors += 1
+
+        retry_after = parse_retry_after(response.headers.get(b"Retry-After"))
+        if retry_after is not None and response.status in self.error_codes:
+            self.stats.inc_value("adaptive/retry_after_count")
+            delay = min(max(slot.delay, retry_after), self.max_delay)
+            if window.cooldown:
+                self._set(key, slot, slot.concurrency, delay)
+            else:
+                self._decrease(key, slot, delay)
+        elif window.responses >= self.window_size:
+            self._adjust(key, slot, window)
+
+        return response
+
+    def process_exception(self, request, exception, spider):
+        key, slot = self._get_slot(request)
+        if slot is None:
+            return None
+
+        window = self._window(key, slot)
+        window.responses += 1
+        window.errors += 1
+
+        if window.responses >= self.window_size:
+            self._adjust(key, slot, window)
+
+        return None
+
+    def _get_slot(self, request):
+        key = request.meta.get("download_slot")
+        if key is None or self.crawler.engine is None:
+            return None, None
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def _window(self, key, slot):
+        if key not in self.windows:
+            self.windows[key] = _Window()
+            # start from the configured values, clamped into the allowed range
+            self._set(
+                key,
+                slot,
+                min(max(slot.concurrency, self.min_concurrency), self.max_concurrency),
+                min(max(slot.delay, self.min_delay), self.max_delay),
+            )
+        return self.windows[key]
+
+    def _adjust(self, key, slot, window):
+        error_rate = window.errors / window.responses
+        mean_latency = window.latency / window.responses
+        self.windows[key] = _Window()
+
+        self.stats.set_value(f"adaptive/error_rate/{key}", round(error_rate, 3))
+        self.stats.set_value(f"adaptive/latency/{key}", round(mean_latency, 3))
+
+        if error_rate > self.max_error_rate or mean_latency > 2 * self.target_latency:
+            self._decrease(
+                key, slot, min(max(slot.delay * 2, self.delay_step), self.max_delay)
+            )
+        elif mean_latency <= self.target_latency:
+            self.stats.inc_value("adaptive/increase_count")
+            self._set(
+                key,
+                slot,
+                min(slot.concurrency + 1, self.max_concurrency),
+                max(
+                    min(slot.delay * self.delay_recovery, slot.delay - self.delay_step),
+                    self.min_delay,
+                ),
+            )
+
+    def _decrease(self, key, slot, delay):
+        self.stats.inc_value("adaptive/decrease_count")
+        self.windows[key] = _Window(cooldown=True)
+        self._set(
+            key,
+            slot,
+            max(
+                math.floor(slot.concurrency * self.backoff_factor), self.min_concurrency
+            ),
+            delay,
+        )
+
+    def _set(self, key, slot, concurrency, delay):
+        if concurrency != slot.concurrency or delay != slot.delay:
+            logger.debug(
+                f"Slot {key}: concurrency {slot.concurrency} -> {concurrency}, "
+                f"delay {slot.delay:.2f} -> {delay:.2f}"
+            )
+
+        slot.concurrency = concurrency
+        slot.delay = delay
+
+        self.stats.set_value(f"adaptive/concurrency/{key}", concurrency)
+        self.stats.set_value(f"adaptive/delay/{key}", round(delay, 3))
+        self.stats.max_value(f"adaptive/max_concurrency/{key}", concurrency)
+        self.stats.min_value(f"adaptive/min_concurrency/{key}", concurrency)
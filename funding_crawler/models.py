@@ -45,6 +45,10 @@ class FundingProgramSchema(BaseModel):
 
     further_links: Optional[List[str]] = None  # Weiterführende Links
 
+    description_md: Optional[str] = None # description as markdown
+    more_info_md: Optional[str] = None # more_info as markdown
+    legal_basis_md: Optional[str] = None # legal_basis as markdown
+
     checksum: str # used to see whether there were changes
 
     license_info: str # fixed to CC-BY-ND 4.0.
@@ -1,21 +1,27 @@
-import hashlib
-from scrapy import Request, Spider
-from datetime import datetime
-from funding_crawler.helpers import compute_checksum, gen_license
+import math
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from scrapy import Request, Spider, signals
+from datetime import date, datetime
+from funding_crawler.cache import ValidatorCache, open_store
+from funding_crawler.extraction import (
+    extract_item,
+    extract_item_from_body,
+    extraction_engines,
+    extractor_version,
+)
+from funding_crawler.helpers import gen_license
+from funding_crawler.incremental import is_due, is_full_sweep, revisit_interval
+from funding_crawler.models import FundingProgramSchema
+from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.request import request_from_dict
+from twisted.internet import reactor, task
+from twisted.internet.defer import Deferred, DeferredSemaphore
 from w3lib.url import canonicalize_url
 
-translate_map = {
-    "Kurzzusammenfassung": "description",
-    "Zusatzinfos": "more_info",
-    "Rechtsgrundlage": "legal_basis",
-    "Ansprechpunkt": "contact_info",
-    "Weiterführende Links": "further_links",
-    "Förderart": "funding_type",
-    "Förderbereich": "funding_area",
-    "Fördergebiet": "funding_location",
-    "Förderberechtigte": "eligible_applicants",
-    "Fördergeber": "funding_body",
-}
+# page parameter inside the (double url-encoded) gtp query value, e.g. "..._list%253D2"
+page_param_pattern = re.compile(r"(list%253D)(\d+)")
 
 
 class FundingSpider(Spider):
@@ -27,11 +33,148 @@ class FundingSpider(Spider):
 
     name = "funding"
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, known_programs=None, checkpoint=None, **kwargs):
         super(FundingSpider, self).__init__(*args, **kwargs)
         self.total_cards_found = 0
         self.unique_urls = {}  # URL -> (page_number, page_url) mapping
         self.page_count = 0
+        self.validator_cache = None
+        self.pagination_fanout = False
+        self.extraction_engine = "compiled"
+        self.extractor = extraction_engines[self.extraction_engine]()
+        self.parse_pool = None
+        self.parse_slots = None
+
+        # incremental mode, see funding_crawler/incremental.py
+        self.known_programs = known_programs or {}  # canonical URL -> stored row
+        self.incremental = False
+        self.today = date.today()
+        self.run_period_days = 2
+        self.revisit_min_days = 2
+        self.revisit_max_days = 30
+        self.revisited_count = 0
+        self.skipped_count = 0
+
+        # resumable crawl, see funding_crawler/dlt_utils/checkpoint.py
+        self.checkpoint = checkpoint
+        self.frontier = {}  # key -> request scheduled but not yet fully processed
+        self.checkpoint_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(FundingSpider, cls).from_crawler(crawler, *args, **kwargs)
+
+        spider.pagination_fanout = crawler.settings.getbool("FUNDING_PAGINATION_FANOUT")
+        spider.extraction_engine = crawler.settings.get(
+            "FUNDING_EXTRACTION_ENGINE", "compiled"
+        )
+        spider.extractor = extraction_engines[spider.extraction_engine]()
+
+        cache_uri = crawler.settings.get("FUNDING_VALIDATOR_CACHE")
+        if cache_uri:
+            spider.validator_cache = ValidatorCache(
+                open_store(cache_uri), extractor_version(spider.extraction_engine)
+            )
+
+        workers = crawler.settings.getint("FUNDING_PARSE_WORKERS")
+        if workers > 0:
+            # spawn instead of fork, the reactor must not be copied into the workers
+            spider.parse_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            spider.parse_slots = DeferredSemaphore(
+                crawler.settings.getint("FUNDING_PARSE_CONCURRENCY") or 2 * workers
+            )
+
+        settings = crawler.settings
+        spider.run_period_days = settings.getint("FUNDING_RUN_PERIOD_DAYS", 2)
+        spider.revisit_min_days = settings.getint("FUNDING_REVISIT_MIN_DAYS", 2)
+        spider.revisit_max_days = settings.getint("FUNDING_REVISIT_MAX_DAYS", 30)
+
+        if settings.getbool("FUNDING_INCREMENTAL") and spider.known_programs:
+            full_sweep = is_full_sweep(
+                spider.today,
+                settings.getint("FUNDING_FULL_SWEEP_DAYS", 14),
+                spider.run_period_days,
+            )
+            spider.incremental = not full_sweep
+            spider.logger.info(
+                "Running full sweep" if full_sweep else "Running incremental crawl"
+            )
+
+        if spider.checkpoint is not None:
+            crawler.signals.connect(spider.start_checkpoints, signals.spider_opened)
+
+        return spider
+
+    def start_requests(self):
+        state = self.checkpoint.load_state() if self.checkpoint is not None else None
+
+        if state is None:
+            for request in super().start_requests():
+                yield self.track(request)
+            return
+
+        self.unique_urls = state["unique_urls"]
+        self.page_count = state["page_count"]
+        self.total_cards_found = state["total_cards_found"]
+        self.logger.info(
+            f"Resuming crawl with {len(state['frontier'])} pending requests "
+            f"and {len(self.unique_urls)} known URLs"
+        )
+
+        for request_dict in state["frontier"]:
+            yield self.track(request_from_dict(request_dict, spider=self))
+
+    def start_checkpoints(self, spider):
+        self.checkpoint_loop = task.LoopingCall(self.save_checkpoint)
+        self.checkpoint_loop.start(self.checkpoint.interval, now=False)
+
+    def save_checkpoint(self):
+        """
+        Save the crawl state. Requests stay in the frontier until their callback
+        finished, so everything they produced is either journaled or refetched.
+        """
+        self.checkpoint.save_state(
+            {
+                "unique_urls": self.unique_urls,
+                "page_count": self.page_count,
+                "total_cards_found": self.total_cards_found,
+                "frontier": [
+                    request.to_dict(spider=self) for request in self.frontier.values()
+                ],
+            }
+        )
+
+    def track(self, request):
+        if self.checkpoint is not None:
+            callback = request.callback.__name__ if request.callback else "parse"
+            key = f"{callback}:{request.url}"
+            request.meta["frontier_key"] = key
+            self.frontier[key] = request
+        return request
+
+    def untrack(self, response):
+        if self.checkpoint is not None:
+            self.frontier.pop(response.meta.get("frontier_key"), None)
+
+    def closed(self, reason):
+        if self.incremental:
+            self.logger.info(
+                f"Incremental crawl: {self.revisited_count} known programs revisited, "
+                f"{self.skipped_count} taken from the previous run"
+            )
+
+        if self.validator_cache is not None:
+            self.validator_cache.close()
+
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(wait=True, cancel_futures=True)
+
+        if self.checkpoint is not None:
+            if self.checkpoint_loop is not None and self.checkpoint_loop.running:
+                self.checkpoint_loop.stop()
+            self.save_checkpoint()
 
     def parse(self, response):
         """
@@ -93,15 +236,142 @@ class FundingSpider(Spider):
                 continue
 
             self.unique_urls[normalized] = (self.page_count, response.url)
-            yield Request(url=normalized, callback=self.parse_details)
+
+            stored = self.stored_item(normalized)
+            if stored is not None:
+                yield stored
+                continue
+
+            yield self.details_request(normalized)
 
         if self.page_count % 10 == 0:
             self.logger.info(f"Total unique URLs found so far: {len(self.unique_urls)}")
 
         next_page = response.css('a.forward.button::attr("href")').get()
 
-        if next_page is not None and next_page != "":
-            yield response.follow(next_page, self.parse)
+        if next_page is None or next_page == "":
+            self.untrack(response)
+            return
+
+        meta = response.request.meta if response.request is not None else {}
+
+        if self.pagination_fanout and "fanout_last" not in meta:
+            page_urls = self.listing_page_urls(response, next_page, len(cards))
+
+            if page_urls:
+                self.logger.info(f"Scheduling {len(page_urls)} listing pages at once")
+                for i, page_url in enumerate(page_urls):
+                    yield self.track(
+                        Request(
+                            url=page_url,
+                            callback=self.parse,
+                            meta={"fanout_last": i == len(page_urls) - 1},
+                        )
+                    )
+                self.untrack(response)
+                return
+
+            self.logger.warning(
+                f"Could not derive pagination pattern from {response.url}, following next page links"
+            )
+
+        # fanned out pages only continue the chain from the last page, in case
+        # the displayed hits count is lower than the actual number of programs
+        if meta.get("fanout_last", True):
+            yield self.track(
+                response.follow(next_page, self.parse, meta={"fanout_last": True})
+            )
+
+        self.untrack(response)
+
+    def listing_page_urls(self, response, next_page, cards_per_page):
+        """
+        Derive the URLs of all remaining listing pages from the total hits count
+        and the page parameter of the next page link.
+
+        Returns:
+            list: URLs of pages 2..n, or None if the pattern could not be derived.
+        """
+        hits = response.css("#hits--count::text").get()
+        match = page_param_pattern.search(next_page)
+
+        if not hits or not match or not cards_per_page:
+            return None
+
+        try:
+            hits_count = int(hits.strip().replace(".", ""))
+        except ValueError:
+            return None
+
+        page_count = math.ceil(hits_count / cards_per_page)
+
+        # the pagination links directly to the last page, trust it if it is larger
+        for number in response.css("div.pagination a.page::text").getall():
+            if number.strip().isdigit():
+                page_count = max(page_count, int(number.strip()))
+
+        return [
+            response.urljoin(
+                next_page[: match.start(2)] + str(page) + next_page[match.end(2) :]
+            )
+            for page in range(2, page_count + 1)
+        ]
+
+    def stored_item(self, url):
+        """
+        In incremental mode, return the stored version of a known program that is
+        not due for a revisit. Yielding it unchanged keeps the program current in
+        the scd2 table without fetching its page.
+
+        Returns:
+            dict: the stored item, or None if the page has to be fetched.
+        """
+        if not self.incremental:
+            return None
+
+        row = self.known_programs.get(url)
+        if row is None:
+            return None
+
+        interval = revisit_interval(
+            row["first_seen"],
+            row["version_count"],
+            self.today,
+            self.revisit_min_days,
+            self.revisit_max_days,
+        )
+        if is_due(row["id_hash"], interval, self.today, self.run_period_days):
+            self.revisited_count += 1
+            return None
+
+        self.skipped_count += 1
+        return {
+            key: value
+            for key, value in row.items()
+            if key in FundingProgramSchema.model_fields
+        }
+
+    def details_request(self, url):
+        """
+        Build the request for a detail page. If a validator cache is configured and
+        holds an entry for the URL, the request is made conditional and a 304 response
+        is passed through to the callback.
+        """
+        callback = (
+            self.parse_details if self.parse_pool is None else self.parse_details_pooled
+        )
+
+        if self.validator_cache is None:
+            return self.track(Request(url=url, callback=callback))
+
+        meta = {"cache_key": url}
+        headers = self.validator_cache.conditional_headers(url)
+        if headers:
+            meta["handle_httpstatus_list"] = [304]
+
+        return self.track(
+            Request(url=url, callback=callback, headers=headers, meta=meta)
+        )
 
     def parse_details(self, response):
         """
@@ -116,156 +386,129 @@ class FundingSpider(Spider):
         Yields:
             dict: A dictionary containing the extracted program details.
         """
-        dct = {}
-
-        dct["title"] = "".join(
-            response.xpath("//h1[@class='title']//text()").getall()
-        ).strip()
-        dct["title"] = dct["title"] if dct["title"] else None
-
-        if not dct["title"]:
-            self.logger.warning(f"No title found on page: {response.url}")
-            return  # Don't yield items without titles
-
-        tab_names = response.xpath(
-            "/html/body/main/div[2]/div/div[1]/h2/span//text()"
-        ).getall()
-
-        if tab_names:
-            article_nodes = response.xpath("//div[@class='content']//article")
+        if self.validator_cache is not None:
+            cached = self.cached_details(response)
+            if cached is not None:
+                yield from cached
+                self.untrack(response)
+                return
+
+        dct = extract_item(
+            self.extractor, response.selector, response.url, self.logger.warning
+        )
 
-            for i, article in enumerate(article_nodes):
-                content = article.get()
-                key = translate_map.get(tab_names[i].strip())
-                dct[key] = content
-        else:
-            content_node = response.xpath(
-                "//main/div[@class='jumbotron']/following-sibling::div/div[@class='content']"
-            ).get()
-            dct["description"] = content_node
+        if dct is None:
+            self.untrack(response)
+            return
 
-            if not content_node:
-                self.logger.warning(
-                    f"No content structure found on page: {response.url}"
-                )
+        if self.validator_cache is not None:
+            self.remember_details(response, dct)
 
-        dt_elements = response.xpath("//dt")
-        dd_elements = response.xpath("//dd")
+        yield dct
+        self.untrack(response)
 
-        if (
-            not dt_elements
-            and not dd_elements
-            and not tab_names
-            and not dct.get("description")
-        ):
-            self.logger.warning(
-                f"No extractable data fields found on page: {response.url}"
+    async def parse_details_pooled(self, response):
+        """
+        Same as `parse_details`, but extraction and checksumming run in the process
+        pool so that the reactor thread keeps downloading in the meantime.
+        """
+        if self.validator_cache is not None:
+            cached = self.cached_details(response)
+            if cached is not None:
+                for item in cached:
+                    yield item
+                self.untrack(response)
+                return
+
+        await maybe_deferred_to_future(self.parse_slots.acquire())
+        try:
+            future = self.parse_pool.submit(
+                extract_item_from_body,
+                self.extraction_engine,
+                response.body,
+                response.url,
+                response.encoding,
             )
+            dct, warnings = await maybe_deferred_to_future(
+                deferred_from_pool_future(future)
+            )
+        finally:
+            self.parse_slots.release()
 
-        for dt, dd in zip(dt_elements, dd_elements):
-            key = dt.xpath("text()").get()
-            if key:
-                key = translate_map.get(key.strip().replace(":", ""))
-                if not key:
-                    continue
-            else:
-                continue
-
-            if key in [
-                "funding_type",
-                "funding_area",
-                "funding_location",
-                "eligible_applicants",
-            ]:
-                lst_str = dd.xpath("text()").get()
-                lst = lst_str.strip().split(", ") if lst_str else []
-                dct[key] = lst if lst else None
-
-            elif key == "funding_body":
-                # /html/body/main/div[1]/div[2]/div/dl/dd[4]/p/a/span
-                str = dd.xpath(
-                    "p[@class='card--title']/a[@title='Öffnet die Einzelsicht']/span[@class='link--label']/text()"
-                ).get()
-                dct[key] = str.strip() if str else None
-
-            elif key == "further_links":
-                links = []
-                for link in dd.xpath(".//a[@href]"):
-                    link_url = link.xpath("@href").get()
-                    if not link_url.startswith("http"):
-                        link_url = "https://www.foerderdatenbank.de/" + link_url
-                    links.append(link_url)
-
-                dct[key] = links if links else None
-
-            elif key == "contact_info":
-                dct["contact_info_institution"] = (
-                    " ".join(
-                        dd.xpath(
-                            ".//a[@title='Öffnet die Einzelsicht']/span[@class='link--label']//text()"
-                        ).getall()
-                    ).strip()
-                    or None
-                )
-
-                dct["contact_info_street"] = (
-                    dd.xpath(".//p[@class='adr']/text()").get() or ""
-                ).strip() or None
+        for message in warnings:
+            self.logger.warning(message)
 
-                dct["contact_info_city"] = (
-                    dd.xpath(".//p[@class='locality']/text()").get() or ""
-                ).strip() or None
+        if dct is None:
+            self.untrack(response)
+            return
 
-                dct["contact_info_fax"] = (
-                    dd.xpath(".//p[@class='fax']/text()").re_first(r"Fax:\s*(.*)")
-                    or None
-                )
+        if self.validator_cache is not None:
+            self.remember_details(response, dct)
 
-                dct["contact_info_phone"] = (
-                    dd.xpath(".//p[@class='tel']/text()").re_first(r"Tel:\s*(.*)")
-                    or None
-                )
+        yield dct
+        self.untrack(response)
 
-                dct["contact_info_email"] = (
-                    dd.xpath(".//p[@class='email']/a[@href]")
-                    .xpath("@href")
-                    .re_first(r"mailto:(.*)")
-                    or None
-                )
+    def cached_details(self, response):
+        """
+        Answer a detail page response from the validator cache.
 
-                dct["contact_info_website"] = (
-                    dd.xpath(".//p[@class='website']/a[@href]").xpath("@href").get()
-                    or None
-                )
+        Returns:
+            list: the cached item, or the page requested again without validators
+                for a 304 without cache entry, or None if the page has to be parsed.
+        """
+        cache_key = response.meta.get("cache_key", canonicalize_url(response.url))
+        cached = self.validator_cache.cached_item(cache_key, response)
 
-            else:
-                value = dd.xpath("text()").get()
-                dct[key] = value.strip() if value else None
+        if cached is not None:
+            cached["license_info"] = gen_license(
+                cached["title"], datetime.today(), cached["url"]
+            )
+            return [cached]
 
-        url_parts = response.url.partition("Foerderprogramm/")
+        if response.status == 304:
+            # the entry was removed or written by another extractor version since
+            # the request was made, dropping the page would retire the program
+            self.logger.warning(
+                f"Got 304 without cached item for: {response.url}, requesting it again"
+            )
+            return [self.unconditional_request(response, cache_key)]
 
-        if url_parts[1] == "":
-            url_parts = response.url.partition(
-                "Archiv/"
-            )  # e.g. 'https://www.foerderdatenbank.de/FDB/Content/DE/Archiv/innovativer-schiffbau-sichert-arbeitsplaetze.html'
+        return None
 
-        foerderprogramm_url_id = (
-            url_parts[2].replace("/", "-").replace(".html", "").lower()
+    def unconditional_request(self, response, cache_key):
+        """
+        Request the page of `response` again without validators. The new request
+        takes the place of the answered one in the frontier.
+        """
+        self.untrack(response)
+        response.meta["frontier_key"] = None
+        return self.track(
+            Request(
+                url=response.url,
+                callback=response.request.callback,
+                meta={"cache_key": cache_key},
+                dont_filter=True,
+            )
         )
-        foerderprogramm_hash_id = hashlib.md5(
-            foerderprogramm_url_id.encode()
-        ).hexdigest()
 
-        dct["url"] = response.url
-        dct["id_hash"] = foerderprogramm_hash_id
-        dct["id_url"] = foerderprogramm_url_id
+    def remember_details(self, response, item):
+        cache_key = response.meta.get("cache_key", canonicalize_url(response.url))
+        self.validator_cache.update(cache_key, response, item)
 
-        ignore_fields = ["url", "id_hash", "id_url"]
-        watch_fields = [x for x in list(dct.keys()) if x not in ignore_fields]
 
-        dct["checksum"] = compute_checksum(dct, watch_fields)
+def deferred_from_pool_future(future):
+    """
+    Wrap a concurrent.futures.Future in a Deferred that fires on the reactor thread.
+    """
+    d = Deferred()
 
-        date = datetime.today()
-        dct["license_info"] = gen_license(dct["title"], date, dct["url"])
+    def fire(f):
+        if f.cancelled():
+            d.cancel()
+        elif f.exception() is not None:
+            d.errback(f.exception())
+        else:
+            d.callback(f.result())
 
-        yield dct
+    future.add_done_callback(lambda f: reactor.callFromThread(fire, f))
+    return d
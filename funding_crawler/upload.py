@@ -0,0 +1,146 @@
+import hashlib
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+# object metadata holding the SHA-256 of the uploaded content
+DIGEST_METADATA_KEY = "sha256"
+
+# parts of 16 MB, up to 8 of them in flight per file
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 2**20,
+    multipart_chunksize=16 * 2**20,
+    max_concurrency=8,
+    use_threads=True,
+)
+
+
+def s3_client():
+    """
+    S3 client for the bucket configured for the dlt filesystem destination.
+    """
+    session = boto3.session.Session()
+    return session.client(
+        "s3",
+        endpoint_url=os.getenv("DESTINATION__FILESYSTEM__CREDENTIALS__ENDPOINT_URL"),
+        aws_access_key_id=os.getenv(
+            "DESTINATION__FILESYSTEM__CREDENTIALS__AWS_ACCESS_KEY_ID"
+        ),
+        aws_secret_access_key=os.getenv(
+            "DESTINATION__FILESYSTEM__CREDENTIALS__AWS_SECRET_ACCESS_KEY"
+        ),
+    )
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def zip_digest(path):
+    """
+    Digest of the names and contents of the entries of a zip archive. Unlike
+    `file_digest` it ignores the modification times of the entries, which differ
+    in every run.
+    """
+    digest = hashlib.sha256()
+    with zipfile.ZipFile(path) as zipf:
+        for info in zipf.infolist():
+            digest.update(info.filename.encode() + b"\0")
+            with zipf.open(info) as entry:
+                while chunk := entry.read(1 << 20):
+                    digest.update(chunk)
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def remote_digest(client, bucket, key):
+    """
+    Digest stored with the object `key` by `upload_if_changed`, None if the object
+    does not exist or was uploaded without it.
+    """
+    try:
+        response = client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return response.get("Metadata", {}).get(DIGEST_METADATA_KEY)
+
+
+def upload_if_changed(
+    client,
+    path,
+    bucket,
+    key,
+    extra_args=None,
+    config=TRANSFER_CONFIG,
+    digest=file_digest,
+):
+    """
+    Upload the file `path` to `key` unless the object already has the same content,
+    as recorded by the result of `digest` in its metadata. Skipped uploads keep the
+    object and its ETag, so CDN caches in front of the bucket stay valid.
+
+    Returns:
+        bool: whether the file was uploaded.
+    """
+    content_digest = digest(path)
+    if remote_digest(client, bucket, key) == content_digest:
+        return False
+
+    extra_args = dict(extra_args or {})
+    extra_args["Metadata"] = {
+        **extra_args.get("Metadata", {}),
+        DIGEST_METADATA_KEY: content_digest,
+    }
+    client.upload_file(path, bucket, key, ExtraArgs=extra_args, Config=config)
+    return True
+
+
+class Uploader:
+    """
+    Runs `upload_if_changed` for each submitted file in a thread pool, so the
+    uploads of a run overlap with each other and with the work between them.
+    """
+
+    def __init__(self, client, max_workers=4, config=TRANSFER_CONFIG):
+        self.client = client
+        self.config = config
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = {}
+
+    def submit(self, path, bucket, key, extra_args=None, digest=file_digest):
+        print(f"Uploading {path} to {key} in bucket {bucket}")
+        self.futures[(bucket, key)] = self.executor.submit(
+            upload_if_changed,
+            self.client,
+            path,
+            bucket,
+            key,
+            extra_args,
+            self.config,
+            digest,
+        )
+
+    def wait(self):
+        """
+        Wait for the submitted uploads and raise the first error.
+
+        Returns:
+            dict: (bucket, key) -> whether the file was uploaded.
+        """
+        try:
+            return {
+                bucket_key: future.result()
+                for bucket_key, future in self.futures.items()
+            }
+        finally:
+            self.futures = {}
+
+    def close(self):
+        self.executor.shutdown()
@@ -0,0 +1,486 @@
+import argparse
+import base64
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+import zlib
+from datetime import datetime, timezone
+from http.client import responses as http_reasons
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from twisted.internet import defer
+from w3lib.url import canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+# hop-by-hop headers that no longer describe the body stored in the archive
+skip_headers = {b"transfer-encoding", b"content-length", b"connection"}
+
+
+def _digest(data):
+    return "sha1:" + base64.b32encode(hashlib.sha1(data).digest()).decode()
+
+
+def _warc_record(headers, block, compresslevel=1):
+    lines = ["WARC/1.0"] + [f"{name}: {value}" for name, value in headers]
+    lines.append(f"Content-Length: {len(block)}")
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+    # every record is its own gzip member, so records can be read from their offset
+    return gzip.compress(head + block + b"\r\n\r\n", compresslevel=compresslevel)
+
+
+def http_response_block(response):
+    """
+    Serialize a response as raw HTTP message, with the body as received.
+    """
+    protocol = response.protocol or "HTTP/1.1"
+    reason = http_reasons.get(response.status, "")
+    lines = [f"{protocol} {response.status} {reason}".strip().encode("latin-1")]
+
+    for name, values in response.headers.items():
+        if name.lower() in skip_headers:
+            continue
+        for value in values:
+            lines.append(name + b": " + value)
+    lines.append(b"Content-Length: " + str(len(response.body)).encode())
+
+    return b"\r\n".join(lines) + b"\r\n\r\n" + response.body
+
+
+def parse_http_response_block(block):
+    """
+    Split a raw HTTP message into status, headers and body.
+    """
+    head, _, body = block.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.split(b"\r\n")
+    status = int(status_line.split(b" ")[1])
+
+    headers = Headers()
+    for line in header_lines:
+        name, _, value = line.partition(b":")
+        headers.appendlist(name.strip(), value.strip())
+
+    return status, headers, body
+
+
+class WarcWriter:
+    """
+    Writes responses as gzip compressed WARC/1.0 records, starting a new file once
+    `max_size` bytes are exceeded. File names start with `prefix` and the time the
+    writer was created, so files of consecutive crawls sort chronologically.
+    Records are compressed on the reactor thread, at gzip level `compresslevel`.
+    """
+
+    def __init__(
+        self,
+        directory,
+        prefix="funding",
+        max_size=100 * 1024 * 1024,
+        compresslevel=1,
+    ):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_size = max_size
+        self.compresslevel = compresslevel
+        self.started = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        self.serial = 0
+        self.file = None
+        self.record_count = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        self.serial += 1
+        file_name = f"{self.prefix}-{self.started}-{self.serial:05d}.warc.gz"
+        self.file = open(os.path.join(self.directory, file_name), "wb")
+
+        info = b"software: funding_crawler\r\nformat: WARC File Format 1.0\r\n"
+        self.file.write(
+            _warc_record(
+                [
+                    ("WARC-Type", "warcinfo"),
+                    ("WARC-Record-ID", f"<urn:uuid:{uuid.uuid4()}>"),
+                    ("WARC-Date", self._now()),
+                    ("WARC-Filename", file_name),
+                    ("Content-Type", "application/warc-fields"),
+                ],
+                info,
+                self.compresslevel,
+            )
+        )
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def write_response(self, response):
+        if self.file is None or self.file.tell() >= self.max_size:
+            self.close()
+            self._open()
+
+        block = http_response_block(response)
+        headers = [
+            ("WARC-Type", "response"),
+            ("WARC-Record-ID", f"<urn:uuid:{uuid.uuid4()}>"),
+            ("WARC-Date", self._now()),
+            ("WARC-Target-URI", response.url),
+        ]
+        if response.ip_address is not None:
+            headers.append(("WARC-IP-Address", str(response.ip_address)))
+        headers += [
+            ("Content-Type", "application/http;msgtype=response"),
+            ("WARC-Block-Digest", _digest(block)),
+            ("WARC-Payload-Digest", _digest(response.body)),
+        ]
+
+        self.file.write(_warc_record(headers, block, self.compresslevel))
+        self.record_count += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def _read_member(f):
+    """
+    Decompress the gzip member starting at the current position of `f`.
+
+    Returns:
+        bytes: the decompressed member, or None at the end of the file.
+    """
+    decompressor = zlib.decompressobj(wbits=31)
+    data = []
+    while not decompressor.eof:
+        chunk = f.read(64 * 1024)
+        if not chunk:
+            if data or decompressor.unconsumed_tail:
+                raise EOFError("Truncated WARC record")
+            return None
+        data.append(decompressor.decompress(chunk))
+        if decompressor.eof:
+            # rewind to the start of the next member
+            f.seek(-len(decompressor.unused_data), os.SEEK_CUR)
+    return b"".join(data)
+
+
+def _parse_record(data):
+    head, _, rest = data.partition(b"\r\n\r\n")
+    headers = {}
+    for line in head.decode("utf-8").split("\r\n")[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip()] = value.strip()
+    block = rest[: int(headers.get("Content-Length", len(rest)))]
+    return headers, block
+
+
+def iter_records(path):
+    """
+    Yields (offset, WARC headers, block) of every record in a .warc.gz file.
+    """
+    with open(path, "rb") as f:
+        while True:
+            offset = f.tell()
+            try:
+                data = _read_member(f)
+            except EOFError:
+                logger.warning(f"Skipping truncated record at {offset} in {path}")
+                return
+            if data is None:
+                return
+            headers, block = _parse_record(data)
+            yield offset, headers, block
+
+
+def _run_id():
+    return datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+
+
+def run_ids(directory):
+    """
+    IDs of the crawls archived in `directory`, oldest first. Each crawl writes its
+    files to a subdirectory named after the time it started, see
+    `WarcArchiveMiddleware`.
+    """
+    return sorted(
+        name
+        for name in os.listdir(directory)
+        if name.isdigit() and os.path.isdir(os.path.join(directory, name))
+    )
+
+
+def _files(directory):
+    return sorted(
+        os.path.join(directory, file_name)
+        for file_name in os.listdir(directory)
+        if file_name.endswith(".warc.gz")
+    )
+
+
+def warc_files(directory, until=None):
+    """
+    WARC files in `directory` in the order they were written: files directly in it,
+    written before crawls had their own subdirectory, then the files of each crawl
+    up to and including the run `until`, all crawls if it is None.
+    """
+    if until is not None and until not in run_ids(directory):
+        raise ValueError(f"No archived run {until} in {directory}")
+    files = _files(directory)
+    for run_id in run_ids(directory):
+        if until is not None and run_id > until:
+            break
+        files += _files(os.path.join(directory, run_id))
+    return files
+
+
+def prune_runs(directory, keep):
+    """
+    Remove all but the latest `keep` crawls from `directory`.
+
+    Returns:
+        list: IDs of the removed runs.
+    """
+    runs = run_ids(directory)
+    removed = runs[: max(len(runs) - keep, 0)]
+    for run_id in removed:
+        shutil.rmtree(os.path.join(directory, run_id))
+    return removed
+
+
+class WarcIndex:
+    """
+    Maps canonical URLs to the location of their latest archived response, in the
+    crawls up to and including the run `until`, see `warc_files`.
+
+    304 responses are not indexed, so a URL resolves to the last response with a body.
+    Pages that were not modified in a run are therefore served from the run that
+    last fetched them.
+    """
+
+    def __init__(self, directory, until=None):
+        self.locations = {}
+        self.first_url = None
+        files = warc_files(directory, until)
+
+        # the start page of the crawl that is replayed
+        if until is None and run_ids(directory):
+            until = run_ids(directory)[-1]
+        if until is not None:
+            first_files = _files(os.path.join(directory, until))
+        else:
+            first_files = files
+
+        for path in files:
+            for offset, headers, block in iter_records(path):
+                if headers.get("WARC-Type") != "response":
+                    continue
+                if block.split(b" ", 2)[1:2] == [b"304"]:
+                    continue
+
+                url = headers["WARC-Target-URI"]
+                if self.first_url is None and path in first_files:
+                    self.first_url = url
+                self.locations[canonicalize_url(url)] = (path, offset)
+
+        logger.info(f"Indexed {len(self.locations)} archived responses in {directory}")
+
+    def __len__(self):
+        return len(self.locations)
+
+    def get(self, url):
+        """
+        Returns:
+            tuple: status, headers and body of the archived response, or None.
+        """
+        location = self.locations.get(canonicalize_url(url))
+        if location is None:
+            return None
+
+        path, offset = location
+        with open(path, "rb") as f:
+            f.seek(offset)
+            _, block = _parse_record(_read_member(f))
+        return parse_http_response_block(block)
+
+
+class WarcArchiveMiddleware:
+    """
+    Downloader middleware writing every response to WARC files in a subdirectory of
+    `WARC_ARCHIVE_DIR` per crawl, named after the time the crawl started. Only the
+    latest `WARC_KEEP_RUNS` crawls are kept, older ones are removed when a crawl
+    starts.
+
+    Runs between the redirect (600) and compression (590) middlewares of the
+    downloader side, so redirects are archived and bodies are stored as received.
+    Responses served by the replay handler are not archived again.
+    """
+
+    def __init__(self, crawler):
+        directory = crawler.settings.get("WARC_ARCHIVE_DIR")
+        if not directory:
+            raise NotConfigured
+
+        self.stats = crawler.stats
+        os.makedirs(directory, exist_ok=True)
+        keep = crawler.settings.getint("WARC_KEEP_RUNS", 10)
+        # the crawl that starts now is one of the kept runs
+        removed = prune_runs(directory, max(keep - 1, 0))
+        if removed:
+            logger.info(f"Removed archived runs {', '.join(removed)}")
+
+        self.run_id = _run_id()
+        self.writer = WarcWriter(
+            os.path.join(directory, self.run_id),
+            prefix=crawler.settings.get("WARC_PREFIX", "funding"),
+            max_size=crawler.settings.getint("WARC_MAX_FILE_SIZE", 100 * 1024 * 1024),
+            compresslevel=crawler.settings.getint("WARC_COMPRESS_LEVEL", 1),
+        )
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_response(self, request, response, spider):
+        if "warc" not in response.flags:
+            self.writer.write_response(response)
+            self.stats.inc_value("warc/response_count")
+            self.stats.inc_value("warc/response_bytes", len(response.body))
+        return response
+
+    def spider_closed(self, spider):
+        self.writer.close()
+
+
+class WarcReplayDownloadHandler:
+    """
+    Download handler answering requests from the WARC files in `WARC_REPLAY_DIR`
+    instead of the network. URLs missing from the archive get an empty 404 response.
+    Register it for http and https, see `replay_settings`.
+    """
+
+    lazy = False
+
+    def __init__(self, settings, crawler=None):
+        directory = settings.get("WARC_REPLAY_DIR")
+        if not directory:
+            raise NotConfigured
+
+        self.stats = crawler.stats if crawler is not None else None
+        self.index = WarcIndex(directory, settings.get("WARC_REPLAY_UNTIL"))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler)
+
+    def download_request(self, request, spider):
+        archived = self.index.get(request.url)
+
+        if archived is None:
+            logger.debug(f"Not archived: {request.url}")
+            if self.stats is not None:
+                self.stats.inc_value("warc/replay_missing_count")
+            return defer.succeed(
+                responsetypes.from_args(url=request.url)(
+                    url=request.url, status=404, request=request, flags=["warc"]
+                )
+            )
+
+        status, headers, body = archived
+        if self.stats is not None:
+            self.stats.inc_value("warc/replay_count")
+
+        respcls = responsetypes.from_args(headers=headers, url=request.url, body=body)
+        return defer.succeed(
+            respcls(
+                url=request.url,
+                status=status,
+                headers=headers,
+                body=body,
+                request=request,
+                flags=["warc"],
+            )
+        )
+
+    def close(self):
+        pass
+
+
+def replay_settings(directory, until=None):
+    """
+    Scrapy settings to run a crawl from the WARC files in `directory` as of the run
+    `until`, the latest if None, without network access, delays or throttling.
+    """
+    handler = "funding_crawler.warc.WarcReplayDownloadHandler"
+    return {
+        "WARC_REPLAY_DIR": directory,
+        "WARC_REPLAY_UNTIL": until,
+        "WARC_ARCHIVE_DIR": None,
+        "DOWNLOAD_HANDLERS": {"http": handler, "https": handler},
+        "DOWNLOAD_DELAY": 0,
+        "RANDOMIZE_DOWNLOAD_DELAY": False,
+        "CONCURRENT_REQUESTS": 64,
+        "CONCURRENT_REQUESTS_PER_DOMAIN": 64,
+        "ADAPTIVE_CONCURRENCY_ENABLED": False,
+        "ROBOTSTXT_OBEY": False,
+        "RETRY_ENABLED": False,
+        "FUNDING_VALIDATOR_CACHE": None,
+        "FUNDING_INCREMENTAL": False,
+    }
+
+
+def main():
+    """
+    Re-run the spider over an archived crawl and write the items as JSON lines, e.g.
+    to check a parser fix against the pages of a past run.
+    """
+    from scrapy.crawler import CrawlerProcess
+
+    from funding_crawler.spider import FundingSpider
+    from scrapy_settings import scrapy_settings
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("warc_dir", help="WARC_ARCHIVE_DIR of the crawls")
+    parser.add_argument(
+        "--run",
+        help="ID of the crawl to replay, defaults to the latest, see --list",
+    )
+    parser.add_argument(
+        "--list", action="store_true", help="print the IDs of the archived crawls"
+    )
+    parser.add_argument("--output", default="items.jsonl", help="JSON lines file")
+    parser.add_argument(
+        "--start-url",
+        help="first listing page, defaults to the first archived response",
+    )
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(run_ids(args.warc_dir)))
+        return
+
+    try:
+        index = WarcIndex(args.warc_dir, args.run)
+    except ValueError as e:
+        parser.error(str(e))
+    start_url = args.start_url or index.first_url
+    if start_url is None:
+        parser.error(f"No archived responses in {args.warc_dir}")
+
+    settings = {
+        **scrapy_settings,
+        **replay_settings(args.warc_dir, args.run),
+        "FEEDS": {args.output: {"format": "jsonlines", "overwrite": True}},
+    }
+    process = CrawlerProcess(settings=settings)
+    process.crawl(FundingSpider, start_urls=[start_url])
+    process.start()
+
+
+if __name__ == "__main__":
+    main()
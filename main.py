@@ -2,16 +2,33 @@ import dlt
 import modal.mount
 from funding_crawler.spider import FundingSpider
 from funding_crawler.dlt_utils.helpers import create_pipeline_runner, cfg_provider
-from funding_crawler.helpers import gen_query, pydantic_to_polars_schema
+from funding_crawler.backup import stream_backup
+from funding_crawler.cache import MarkdownCache, open_store
+from funding_crawler.current_state import current_table_name, refresh_current_state
+from funding_crawler.export import (
+    DATA_FILE,
+    MIN_CSV_FILE,
+    MIN_PARQUET_FILE,
+    copy_batches,
+    export_schema,
+    read_batches,
+    write_export_archives,
+)
+from funding_crawler.helpers import add_markdown, pydantic_to_arrow_schema
+from funding_crawler.incremental import fetch_known_programs
+from funding_crawler.maintenance import (
+    CONTENT_COLUMNS,
+    backfill_markdown,
+    compact_duplicates,
+    ensure_indexes,
+)
 from scrapy_settings import scrapy_settings
 
 # from funding_crawler.helpers import get_hits_count
 from funding_crawler.models import FundingProgramSchema
-import polars as pl
-import boto3
-from markdownify import markdownify as md
-import zipfile
-import subprocess
+from funding_crawler.upload import Uploader, s3_client, zip_digest
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from sqlalchemy import create_engine
 import os
 import modal
@@ -51,6 +68,25 @@ bucket_name = "foerderdatenbankdump"
 
 backup_bucket_name = "foerderdatenbankbackup"
 
+# "custom" streams a single pg_dump archive into the bucket, "directory" dumps
+# with backup_jobs connections into a temporary directory and uploads it as tar
+backup_format = "custom"
+backup_jobs = 4
+
+# "csv" stages the batches as csv, which postgres loads with COPY, None keeps the
+# default INSERT statements; see benchmarks/bench_postgres_load.py, csv halves
+# normalize and load of a 10% change set from Arrow batches
+loader_file_format = "csv"
+
+# "cursor" reads the export through pl.read_database, "copy" with COPY into Arrow,
+# about three times faster, see benchmarks/bench_export_readers.py
+export_reader = "copy"
+
+cache_dir = "/cache"
+cache_volume = modal.Volume.from_name(
+    "cdl-awo-funding-crawler-cache", create_if_missing=True
+)
+
 
 @app.function(
     secrets=[
@@ -65,6 +101,7 @@ backup_bucket_name = "foerderdatenbankbackup"
     ],
     schedule=modal.Cron("0 2 */2 * *"),
     timeout=3600,
+    volumes={cache_dir: cache_volume},
 )
 def crawl():
     local_license_file_name = "LICENSE-DATA"
@@ -76,41 +113,27 @@ def crawl():
 
     # https://neon.com/docs/manage/backup-pg-dump
     date = datetime.now().strftime("%Y%m%d_%H%M%S")
-    local_dump_file_name = "dump"
-    remote_dump_file_name = f"{local_dump_file_name}_{date}"
+    remote_dump_file_name = f"dump_{date}"
+    if backup_format == "directory":
+        remote_dump_file_name += ".tar"
+    client = s3_client()
 
     print("dumping...")
-    pg_dump_cmd = (
-        f"pg_dump -Fc -v -d {postgres_conn_str} -f {local_dump_file_name} -Z zstd:12"
+    # streamed into the bucket while pg_dump runs, see funding_crawler/backup.py
+    backup = stream_backup(
+        client,
+        postgres_conn_str,
+        backup_bucket_name,
+        remote_dump_file_name,
+        output_format=backup_format,
+        jobs=backup_jobs,
     )
-    result = subprocess.run(pg_dump_cmd, shell=True, capture_output=True, text=True)
-
-    if result.returncode != 0:
-        print(f"pg_dump failed with return code {result.returncode}")
-        print(f"STDERR: {result.stderr}")
-        print(f"STDOUT: {result.stdout}")
-        raise Exception(f"pg_dump failed with return code {result.returncode}")
-
-    session = boto3.session.Session()
-    client = session.client(
-        "s3",
-        endpoint_url=os.getenv("DESTINATION__FILESYSTEM__CREDENTIALS__ENDPOINT_URL"),
-        aws_access_key_id=os.getenv(
-            "DESTINATION__FILESYSTEM__CREDENTIALS__AWS_ACCESS_KEY_ID"
-        ),
-        aws_secret_access_key=os.getenv(
-            "DESTINATION__FILESYSTEM__CREDENTIALS__AWS_SECRET_ACCESS_KEY"
-        ),
-    )
-
     print(
-        f"Uploading {local_dump_file_name} to {remote_dump_file_name} in bucket {backup_bucket_name}"
+        f"Uploaded {remote_dump_file_name} to bucket {backup_bucket_name}:"
+        f" {backup['bytes'] / 2**20:.0f} MB in {backup['seconds']:.0f}s"
+        f" ({backup['mb_per_second']:.1f} MB/s)"
     )
 
-    client.upload_file(local_dump_file_name, backup_bucket_name, remote_dump_file_name)
-
-    os.remove(local_dump_file_name)
-
     dlt.config.register_provider(cfg_provider)
 
     pipeline = dlt.pipeline(
@@ -119,8 +142,38 @@ def crawl():
         dataset_name=dataset_name,
     )
 
+    crawl_settings = {
+        **scrapy_settings,
+        "FUNDING_VALIDATOR_CACHE": f"{cache_dir}/validators.sqlite",
+        "WARC_ARCHIVE_DIR": f"{cache_dir}/warc",
+    }
+
+    columns = list(FundingProgramSchema.__annotations__.keys())
+
+    known_programs = None
+    if crawl_settings.get("FUNDING_INCREMENTAL"):
+        known_programs = fetch_known_programs(
+            engine, f"{dataset_name}.{dataset_name}", columns, CONTENT_COLUMNS
+        )
+        print(f"{len(known_programs)} known programs")
+
     scraping_host = create_pipeline_runner(
-        pipeline, FundingSpider, batch_size=50, scrapy_settings=scrapy_settings
+        pipeline,
+        FundingSpider,
+        batch_size=50,
+        scrapy_settings=crawl_settings,
+        checkpoint_dir=f"{cache_dir}/checkpoint",
+        # longer than the two days between scheduled runs, so the next run resumes
+        checkpoint_max_age=72.0,
+        spider_kwargs={"known_programs": known_programs},
+        arrow_schema=pydantic_to_arrow_schema(FundingProgramSchema),
+        loader_file_format=loader_file_format,
+        # only load new and changed programs, retire the ones no longer listed
+        change_key="id_hash",
+        # store the HTML columns once per distinct value instead of in every version
+        content_columns=CONTENT_COLUMNS,
+        # markdown of the HTML columns, converted on the pipeline thread
+        batch_transform=add_markdown,
     )
 
     # https://dlthub.com/docs/general-usage/incremental-loading#scd2-strategy
@@ -134,18 +187,57 @@ def crawl():
         },
     )
 
-    columns = list(FundingProgramSchema.__annotations__.keys())
+    cache_volume.commit()
 
-    df = pl.read_database(
-        query=gen_query(f"{dataset_name}.{dataset_name}", columns),
-        connection=engine.connect(),
-        execute_options={"parameters": []},
-        schema_overrides=pydantic_to_polars_schema(FundingProgramSchema),
-        infer_schema_length=None,
-        batch_size=10000,
-    )
+    created = ensure_indexes(pipeline, dataset_name)
+    if created:
+        print(f"Created indexes {', '.join(created)}")
+
+    duplicates = compact_duplicates(pipeline, dataset_name)
+    if duplicates:
+        print(f"Deleted {len(duplicates)} duplicate versions")
 
-    assert len(list(df["id_hash"].unique())) == len(df), "id_hash is not unique!"
+    # markdown of the versions loaded before the *_md columns existed, converted
+    # once in a process pool and cached on the volume until it is stored
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as pool:
+        markdown_cache = MarkdownCache(open_store(f"{cache_dir}/markdown.sqlite"), pool)
+        try:
+            backfilled = backfill_markdown(
+                pipeline, dataset_name, convert=markdown_cache.convert
+            )
+            evicted = markdown_cache.evict()
+        finally:
+            markdown_cache.close()
+    if backfilled:
+        print(
+            f"Backfilled markdown of {len(backfilled)} programs:"
+            f" {markdown_cache.hits} cached, {markdown_cache.misses} converted,"
+            f" {evicted} evicted"
+        )
+    cache_volume.commit()
+
+    refreshed = refresh_current_state(
+        pipeline,
+        dataset_name,
+        columns,
+        id_hashes={row[0] for row in duplicates} | backfilled,
+        content_columns=CONTENT_COLUMNS,
+    )
+    print(f"{refreshed} programs refreshed in {current_table_name(dataset_name)}")
+
+    print("exporting...")
+    archives = {"csv": [MIN_CSV_FILE], "parquet": [DATA_FILE, MIN_PARQUET_FILE]}
+    read = copy_batches if export_reader == "copy" else read_batches
+    # the files are written straight into the zip archives, one thread each
+    write_export_archives(
+        read(
+            engine,
+            f"SELECT * FROM {dataset_name}.{current_table_name(dataset_name)}",
+            export_schema(FundingProgramSchema),
+        ),
+        {f"{ext}_data.zip": file_names for ext, file_names in archives.items()},
+        extra_files={local_license_file_name: license_content},
+    )
 
     # this does not work, because the displayed number of search hits seems to be wrong?
     # search_url = "https://www.foerderdatenbank.de/SiteGlobals/FDB/Forms/Suche/Foederprogrammsuche_Formular.html?resourceId=0065e6ec-5c0a-4678-b503-b7e7ec435dfd&input_=23adddb0-dcf7-4e32-96f5-93aec5db2716&pageLocale=de&filterCategories=FundingProgram"
@@ -154,69 +246,22 @@ def crawl():
     #     abs(len(df.filter(pl.col("deleted") == False)) - hits_count) <= 2  # noqa: E712
     # ), f"Scraped items do not approx. equal amount displayed on website {len(df.filter(pl.col("deleted") == False))}, {hits_count}"  # noqa: E712
 
-    min_cols = [
-        "id_hash",
-        "deleted",
-        "on_website_from",
-        "url",
-        "title",
-        "description",
-        "more_info",
-        "legal_basis",
-        "funding_type",
-        "funding_area",
-        "funding_location",
-        "eligible_applicants",
-        "funding_body",
-    ]
-    format_cols = ["description", "more_info", "legal_basis"]
-
-    mindf = df[min_cols]
-    print("formatting columns...")
-    for col in format_cols:
-        mindf = mindf.with_columns(pl.col(col).map_elements(md, return_dtype=pl.String))
-
-    with open(local_license_file_name, "w") as f:
-        f.write(license_content)
-
-    for ext in ["csv", "parquet"]:
-        local_data_name = f"data.{ext}"
-        local_data_min_format = f"min_data_format.{ext}"
+    uploader = Uploader(client)
+    for ext in archives:
         local_zip_name = f"{ext}_data.zip"
-        remote_zip_name = f"data/{local_zip_name}"
-
-        if ext == "csv":
-            print("handling list columns")
-            for col in mindf.columns:
-                if mindf[col].dtype == pl.List:
-                    mindf = mindf.with_columns(
-                        pl.col(col)
-                        .list.join(", ")
-                        .alias(col)  # Use original column name
-                    )
-
-            mindf.write_csv(local_data_min_format)
-        elif ext == "parquet":
-            df.write_parquet(local_data_name)
-            mindf.write_parquet(local_data_min_format)
-        else:
-            raise
-
-        with zipfile.ZipFile(local_zip_name, "w") as zipf:
-            if ext != "csv":
-                zipf.write(local_data_name, os.path.basename(local_data_name))
-            zipf.write(local_data_min_format, os.path.basename(local_data_min_format))
-            zipf.write(
-                local_license_file_name, os.path.basename(local_license_file_name)
-            )
-
-        print(
-            f"Uploading {local_zip_name} to {remote_zip_name} in bucket {bucket_name}"
-        )
-
-        client.upload_file(
+        # zips with the same entries as the published ones are not uploaded again
+        uploader.submit(
             local_zip_name,
             bucket_name,
-            remote_zip_name,
-            ExtraArgs={"ACL": "public-read"},
+            f"data/{local_zip_name}",
+            extra_args={"ACL": "public-read"},
+            digest=zip_digest,
         )
+
+    try:
+        uploaded = uploader.wait()
+    finally:
+        uploader.close()
+    skipped = [key for (_, key), changed in uploaded.items() if not changed]
+    if skipped:
+        print(f"Skipped unchanged {', '.join(skipped)}")
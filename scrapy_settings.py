@@ -2,7 +2,11 @@ scrapy_settings = {
     "HTTPERROR_ALLOW_ALL": False,
     "BOT_NAME": "cdl_awo_funding_crawler",
     "LOG_LEVEL": "INFO",
+    # upper bound for all requests, the per-domain values below are only the starting
+    # point for the adaptive concurrency middleware; kept at the original concurrency
+    # and delay until faster settings are measured against the site
     "CONCURRENT_REQUESTS": 7,
+    "CONCURRENT_REQUESTS_PER_DOMAIN": 7,
     "LOGSTATS_INTERVAL": 20.0,
     "COOKIES_ENABLED": True,
     "DOWNLOAD_DELAY": 0.7,
@@ -14,4 +18,48 @@ scrapy_settings = {
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
         "Accept-Language": "de-DE,de;q=0.9,en-US;q=0.8,en;q=0.7",
     },
+    "DOWNLOADER_MIDDLEWARES": {
+        "funding_crawler.middlewares.AdaptiveConcurrencyMiddleware": 650,
+        "funding_crawler.warc.WarcArchiveMiddleware": 610,
+    },
+    # directory to archive every raw response to as .warc.gz, None disables archiving,
+    # see `python -m funding_crawler.warc` to replay an archived crawl offline
+    "WARC_ARCHIVE_DIR": None,
+    "WARC_MAX_FILE_SIZE": 100 * 1024 * 1024,
+    # gzip level of the records, compressed on the reactor thread: level 1 takes half
+    # the time of level 9 for 15% larger files
+    "WARC_COMPRESS_LEVEL": 1,
+    # each crawl is archived in its own subdirectory, older crawls are removed
+    "WARC_KEEP_RUNS": 10,
+    # AIMD control of per-domain concurrency and delay, see funding_crawler/middlewares.py
+    "ADAPTIVE_CONCURRENCY_ENABLED": True,
+    "ADAPTIVE_CONCURRENCY_MIN": 2,
+    "ADAPTIVE_CONCURRENCY_MAX": 7,
+    "ADAPTIVE_DELAY_MIN": 0.7,
+    "ADAPTIVE_DELAY_MAX": 30.0,
+    "ADAPTIVE_TARGET_LATENCY": 2.0,
+    "ADAPTIVE_MAX_ERROR_RATE": 0.05,
+    "ADAPTIVE_WINDOW": 20,
+    # path to a directory or .sqlite file storing ETag/Last-Modified and items of detail pages
+    # between runs, None disables conditional requests
+    "FUNDING_VALIDATOR_CACHE": None,
+    # schedule all listing pages at once based on the hits count of the first page,
+    # instead of following the "next page" links one by one, off until measured
+    "FUNDING_PAGINATION_FANOUT": False,
+    # only fetch new programs and known programs that are due for a revisit based on
+    # their change history, known programs are passed to the spider as `known_programs`
+    "FUNDING_INCREMENTAL": False,
+    # days between scheduled runs, bounds for the revisit interval of known programs
+    # and days between full sweeps fetching every program
+    "FUNDING_RUN_PERIOD_DAYS": 2,
+    "FUNDING_REVISIT_MIN_DAYS": 2,
+    "FUNDING_REVISIT_MAX_DAYS": 30,
+    "FUNDING_FULL_SWEEP_DAYS": 14,
+    # "compiled" (precompiled lxml XPath, single pass) or "selectors" (parsel reference)
+    "FUNDING_EXTRACTION_ENGINE": "compiled",
+    # number of worker processes parsing and checksumming detail pages off the reactor
+    # thread, 0 parses in the crawler process
+    "FUNDING_PARSE_WORKERS": 0,
+    # max. pages handed to the workers at once, defaults to twice the number of workers
+    "FUNDING_PARSE_CONCURRENCY": 0,
 }
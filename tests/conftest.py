@@ -0,0 +1,70 @@
+import dlt
+import pytest
+
+from funding_crawler.models import FundingProgramSchema
+
+
+@pytest.fixture
+def write_disposition():
+    """scd2 write disposition of the history table, as in main.py"""
+    return {
+        "disposition": "merge",
+        "strategy": "scd2",
+        "validity_column_names": ["on_website_from", "on_website_to"],
+        "row_version_column_name": "checksum",
+    }
+
+
+@pytest.fixture
+def program():
+    """
+    Factory for program `number` in `revision`, the checksum changes with the
+    revision. `fields` replace or add columns.
+    """
+
+    def program(number, revision, **fields):
+        return {
+            "id_hash": f"id-{number}",
+            "id_url": f"program-{number}",
+            "url": f"https://example.org/program-{number}.html",
+            "title": f"Program {number}",
+            "description": f"Revision {revision}",
+            "checksum": f"{number}-{revision}",
+            "license_info": "CC BY-ND 3.0 DE",
+            **fields,
+        }
+
+    return program
+
+
+@pytest.fixture
+def duckdb_pipeline(tmp_path, monkeypatch):
+    """
+    Factory for a dlt pipeline named `name` loading the dataset "programs" into
+    its own duckdb file in tmp_path.
+    """
+    monkeypatch.setenv("RUNTIME__DLTHUB_TELEMETRY", "false")
+
+    def duckdb_pipeline(name):
+        return dlt.pipeline(
+            pipeline_name=name,
+            pipelines_dir=str(tmp_path / "pipelines"),
+            destination=dlt.destinations.duckdb(str(tmp_path / f"{name}.duckdb")),
+            dataset_name="programs",
+        )
+
+    return duckdb_pipeline
+
+
+@pytest.fixture
+def load_programs(write_disposition):
+    """Loads `items` into the history table "programs" of `pipeline`."""
+
+    def load_programs(pipeline, items):
+        pipeline.run(
+            dlt.resource(items, name="programs"),
+            columns=FundingProgramSchema,
+            write_disposition=write_disposition,
+        )
+
+    return load_programs
@@ -0,0 +1,148 @@
+"""In-memory stand-in for the parts of the boto3 S3 client used by
+funding_crawler.upload and funding_crawler.backup.
+
+    client = FakeS3Client("dump")
+    upload_if_changed(client, path, "dump", "data/csv_data.zip")
+    client.objects["dump", "data/csv_data.zip"]["Body"]
+"""
+
+import hashlib
+import io
+import itertools
+import threading
+
+from botocore.exceptions import ClientError
+
+
+def _error(code, operation):
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+class FakeS3Client:
+    """
+    Objects are kept in `objects` by (bucket, key), multipart uploads in `uploads`
+    by upload id. Every stored object gets a new ETag, so a skipped upload can be
+    told from an upload of the same content. Uploaded files are also recorded in
+    `upload_file_calls`, with the arguments besides the content.
+    """
+
+    def __init__(self, *buckets):
+        self.buckets = set(buckets)
+        self.objects = {}
+        self.uploads = {}
+        self.upload_file_calls = []
+        self.lock = threading.Lock()
+        self.versions = itertools.count()
+
+    def _check_bucket(self, bucket, operation):
+        if bucket not in self.buckets:
+            raise _error("NoSuchBucket", operation)
+
+    def _put(self, bucket, key, body, metadata=None, parts_count=None):
+        with self.lock:
+            etag = f'"{hashlib.md5(body).hexdigest()}-{next(self.versions)}"'
+            self.objects[bucket, key] = {
+                "Body": body,
+                "ETag": etag,
+                "Metadata": dict(metadata or {}),
+                "PartsCount": parts_count,
+            }
+
+    def head_object(self, Bucket, Key, PartNumber=None):
+        self._check_bucket(Bucket, "HeadObject")
+        if (Bucket, Key) not in self.objects:
+            # HEAD responses have no body, botocore only has the status code
+            raise _error("404", "HeadObject")
+        obj = self.objects[Bucket, Key]
+        response = {
+            "ContentLength": len(obj["Body"]),
+            "ETag": obj["ETag"],
+            "Metadata": obj["Metadata"],
+        }
+        if PartNumber is not None and obj["PartsCount"] is not None:
+            response["PartsCount"] = obj["PartsCount"]
+        return response
+
+    def get_object(self, Bucket, Key):
+        self._check_bucket(Bucket, "GetObject")
+        if (Bucket, Key) not in self.objects:
+            raise _error("NoSuchKey", "GetObject")
+        obj = self.objects[Bucket, Key]
+        return {"Body": io.BytesIO(obj["Body"]), "ETag": obj["ETag"]}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None):
+        self._check_bucket(Bucket, "PutObject")
+        with open(Filename, "rb") as f:
+            body = f.read()
+        extra_args = dict(ExtraArgs or {})
+        with self.lock:
+            self.upload_file_calls.append((Filename, Bucket, Key, extra_args, Config))
+        self._put(Bucket, Key, body, extra_args.get("Metadata"))
+
+    def list_objects_v2(self, Bucket):
+        self._check_bucket(Bucket, "ListObjectsV2")
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket)
+        response = {"Name": Bucket, "KeyCount": len(keys)}
+        if keys:
+            response["Contents"] = [
+                {"Key": key, "Size": len(self.objects[Bucket, key]["Body"])}
+                for key in keys
+            ]
+        return response
+
+    def create_multipart_upload(self, Bucket, Key):
+        self._check_bucket(Bucket, "CreateMultipartUpload")
+        with self.lock:
+            upload_id = f"upload-{next(self.versions)}"
+            self.uploads[upload_id] = {"Bucket": Bucket, "Key": Key, "Parts": {}}
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def _upload(self, Bucket, Key, UploadId, operation):
+        upload = self.uploads.get(UploadId)
+        if upload is None or (upload["Bucket"], upload["Key"]) != (Bucket, Key):
+            raise _error("NoSuchUpload", operation)
+        return upload
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        upload = self._upload(Bucket, Key, UploadId, "UploadPart")
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        with self.lock:
+            upload["Parts"][PartNumber] = (bytes(Body), etag)
+        return {"ETag": etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self._upload(Bucket, Key, UploadId, "CompleteMultipartUpload")
+        parts = MultipartUpload["Parts"]
+        numbers = [part["PartNumber"] for part in parts]
+        if not parts or numbers != sorted(set(numbers)):
+            raise _error("InvalidPartOrder", "CompleteMultipartUpload")
+        for i, part in enumerate(parts):
+            if upload["Parts"].get(part["PartNumber"], (None, None))[1] != part["ETag"]:
+                raise _error("InvalidPart", "CompleteMultipartUpload")
+            # like S3, only the last part may be smaller than 5 MB
+            data = upload["Parts"][part["PartNumber"]][0]
+            if i < len(parts) - 1 and len(data) < 5 * 2**20:
+                raise _error("EntityTooSmall", "CompleteMultipartUpload")
+        body = b"".join(upload["Parts"][number][0] for number in numbers)
+        with self.lock:
+            del self.uploads[UploadId]
+        self._put(Bucket, Key, body, parts_count=len(parts))
+        return {"Bucket": Bucket, "Key": Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._upload(Bucket, Key, UploadId, "AbortMultipartUpload")
+        with self.lock:
+            del self.uploads[UploadId]
+        return {}
+
+    def list_multipart_uploads(self, Bucket):
+        self._check_bucket(Bucket, "ListMultipartUploads")
+        response = {"Bucket": Bucket}
+        uploads = [
+            {"Key": upload["Key"], "UploadId": upload_id}
+            for upload_id, upload in self.uploads.items()
+            if upload["Bucket"] == Bucket
+        ]
+        if uploads:
+            response["Uploads"] = uploads
+        return response
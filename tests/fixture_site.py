@@ -0,0 +1,226 @@
+"""Local stand-in for foerderdatenbank.de, serving listing and detail pages generated
+from the HTML fixtures in tests/test_scrapy/.
+
+    with FixtureSite(programs=500, latency=0.05, error_rate=0.01) as site:
+        start_url = site.start_url
+        ...
+        site.advance(change_rate=0.1, removed=5, added=5)  # next "day"
+"""
+
+import copy
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from lxml import html
+
+FIXTURES = "tests/test_scrapy"
+DETAIL_TEMPLATES = [
+    "detail_multi_desc.html",
+    "detail_single_desc.html",
+    "details_single_desc_alt.html",
+]
+LIVE_BASE = "https://www.foerderdatenbank.de/"
+LISTING_PATH = "SiteGlobals/FDB/Forms/Suche/Foederprogrammsuche_Formular.html"
+DETAIL_PATH = "FDB/Content/DE/Foerderprogramm/Bund/"
+
+title_pattern = re.compile(rb'(<h1 class="title">)(.*?)(</h1>)', re.DOTALL)
+base_pattern = re.compile(rb'<base href="[^"]*"\s*/?>')
+
+
+class FixtureSite:
+    """
+    Synthetic Förderdatenbank with `programs` detail pages listed `per_page` per
+    listing page.
+
+    Args:
+        programs (int): number of funding programs on the site.
+        per_page (int): cards per listing page.
+        latency (float): seconds every response is delayed.
+        error_rate (float): share of requests answered with 503.
+        seed (int): seed for errors and churn, for reproducible runs.
+    """
+
+    def __init__(self, programs=100, per_page=10, latency=0.0, error_rate=0.0, seed=0):
+        self.per_page = per_page
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+        # program number -> revision, changed revisions change the title and checksum
+        self.programs = {number: 0 for number in range(programs)}
+        self.next_number = programs
+        self.request_count = 0
+        self.error_count = 0
+
+        self.detail_templates = []
+        for file_name in DETAIL_TEMPLATES:
+            with open(f"{FIXTURES}/{file_name}", "rb") as f:
+                self.detail_templates.append(f.read())
+
+        with open(f"{FIXTURES}/overview.html", "rb") as f:
+            self.overview_template = html.fromstring(f.read())
+
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def start_url(self):
+        return f"{self.base_url}{LISTING_PATH}?filterCategories=FundingProgram"
+
+    def detail_url(self, number):
+        return f"{self.base_url}{DETAIL_PATH}program-{number:05d}.html"
+
+    def listing_url(self, page):
+        return (
+            f"{self.base_url}{LISTING_PATH}"
+            f"?gtp=%2526fixture_list%253D{page}&filterCategories=FundingProgram"
+        )
+
+    @property
+    def page_count(self):
+        return max(1, -(-len(self.programs) // self.per_page))
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def advance(self, change_rate=0.0, removed=0, added=0):
+        """
+        Simulate the site changing between two crawls: change the content of a share
+        of the programs, remove some and add new ones.
+        """
+        with self.lock:
+            numbers = list(self.programs)
+            for number in self.random.sample(numbers, int(len(numbers) * change_rate)):
+                self.programs[number] += 1
+            for number in self.random.sample(numbers, min(removed, len(numbers))):
+                del self.programs[number]
+            for _ in range(added):
+                self.programs[self.next_number] = 0
+                self.next_number += 1
+
+    def render_detail(self, number):
+        revision = self.programs[number]
+        template = self.detail_templates[number % len(self.detail_templates)]
+        title = f" Förderprogramm {number:05d} (Stand {revision}) ".encode()
+        body = title_pattern.sub(lambda m: m[1] + title + m[3], template, count=1)
+        return base_pattern.sub(f'<base href="{self.base_url}"/>'.encode(), body)
+
+    def render_listing(self, page):
+        with self.lock:
+            numbers = sorted(self.programs)
+        page_numbers = numbers[(page - 1) * self.per_page : page * self.per_page]
+
+        root = copy.deepcopy(self.overview_template)
+        root.find(".//base").set("href", self.base_url)
+        root.get_element_by_id("hits--count").text = str(len(numbers))
+
+        cards = root.find_class("card--fundingprogram")
+        parent = cards[0].getparent()
+        index = parent.index(cards[0])
+        for card in cards:
+            card.getparent().remove(card)
+
+        for offset, number in enumerate(page_numbers):
+            card = copy.deepcopy(cards[0])
+            link = card.find_class("card--title")[0].find("a")
+            link.set("href", f"{DETAIL_PATH}program-{number:05d}.html")
+            link.find("span").text = f" Förderprogramm {number:05d} "
+            parent.insert(index + offset, card)
+
+        pagination = root.find_class("pagination")[0].find("ul")
+        for item in list(pagination):
+            pagination.remove(item)
+        last_page = self.page_count
+        for number in sorted({1, page, last_page}):
+            pagination.append(
+                html.fromstring(
+                    f'<li><a href="{self._listing_href(number)}" class="page">{number}</a></li>'
+                )
+            )
+        if page < last_page:
+            pagination.append(
+                html.fromstring(
+                    f'<li><a href="{self._listing_href(page + 1)}" class="forward button">weiter</a></li>'
+                )
+            )
+
+        return html.tostring(root, encoding="utf-8", doctype="<!doctype html>")
+
+    def _listing_href(self, page):
+        return self.listing_url(page)[len(self.base_url) :].replace("&", "&amp;")
+
+    def respond(self, path):
+        """
+        Returns:
+            tuple: status and body for a request path.
+        """
+        with self.lock:
+            self.request_count += 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.error_count += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            return 503, b"Service Unavailable"
+
+        url = urlsplit(path)
+        if url.path == f"/{LISTING_PATH}":
+            gtp = parse_qs(url.query).get("gtp", [""])[0]
+            match = re.search(r"list%3D(\d+)", gtp)
+            page = int(match[1]) if match else 1
+            if page > self.page_count:
+                return 404, b"Not Found"
+            return 200, self.render_listing(page)
+
+        match = re.fullmatch(rf"/{DETAIL_PATH}program-(\d+)\.html", url.path)
+        if match and int(match[1]) in self.programs:
+            return 200, self.render_detail(int(match[1]))
+
+        return 404, b"Not Found"
+
+
+def _handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            status, body = site.respond(self.path)
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            if status == 503:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
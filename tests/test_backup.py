@@ -0,0 +1,146 @@
+import sys
+
+import tarfile
+
+import pytest
+
+from funding_crawler.backup import MultipartUploadWriter, stream_backup
+from tests.fake_s3 import FakeS3Client
+
+MB = 2**20
+
+
+@pytest.fixture
+def client():
+    return FakeS3Client("backup")
+
+
+def dump_command(size, returncode=0):
+    # writes `size` bytes to stdout in odd chunks, like pg_dump -Fc
+    return [
+        sys.executable,
+        "-c",
+        "import sys\n"
+        f"for offset in range(0, {size}, 777777):\n"
+        f"    sys.stdout.buffer.write(bytes([offset % 251]) * min(777777, {size} - offset))\n"
+        "print('pg_dump: error: connection lost', file=sys.stderr)\n"
+        f"sys.exit({returncode})",
+    ]
+
+
+def expected_dump(size):
+    return b"".join(
+        bytes([offset % 251]) * min(777777, size - offset)
+        for offset in range(0, size, 777777)
+    )
+
+
+def test_stream_backup(client):
+    size = 12 * MB + 3
+    stats = stream_backup(
+        client,
+        None,
+        "backup",
+        "dump_20250101",
+        command=dump_command(size),
+        part_size=5 * MB,
+        max_in_flight=2,
+    )
+
+    assert stats["bytes"] == size
+    body = client.get_object(Bucket="backup", Key="dump_20250101")["Body"].read()
+    assert body == expected_dump(size)
+    assert (
+        client.head_object(Bucket="backup", Key="dump_20250101", PartNumber=1)[
+            "PartsCount"
+        ]
+        == 3
+    )
+
+
+def test_stream_backup_fails_on_exit_code(client):
+    with pytest.raises(RuntimeError, match="connection lost"):
+        stream_backup(
+            client,
+            None,
+            "backup",
+            "dump_20250101",
+            command=dump_command(6 * MB, returncode=1),
+            part_size=5 * MB,
+        )
+
+    assert "Contents" not in client.list_objects_v2(Bucket="backup")
+    assert "Uploads" not in client.list_multipart_uploads(Bucket="backup")
+
+
+def test_empty_upload(client):
+    writer = MultipartUploadWriter(client, "backup", "empty")
+    writer.close()
+    assert client.get_object(Bucket="backup", Key="empty")["Body"].read() == b""
+
+
+def test_stream_backup_directory_format(monkeypatch, client):
+    def fake_pg_dump(conn_str, output_format, jobs, file):
+        # writes a dump directory like pg_dump -Fd -f file
+        return [
+            sys.executable,
+            "-c",
+            "import os, sys\n"
+            "os.makedirs(sys.argv[1])\n"
+            "open(os.path.join(sys.argv[1], 'toc.dat'), 'wb').write(b'toc')\n"
+            "open(os.path.join(sys.argv[1], '3001.dat.zst'), 'wb').write(b'x' * 6000000)",
+            file,
+        ]
+
+    monkeypatch.setattr("funding_crawler.backup.pg_dump_command", fake_pg_dump)
+    stats = stream_backup(
+        client,
+        None,
+        "backup",
+        "dump_20250101.tar",
+        output_format="directory",
+        jobs=4,
+        part_size=5 * MB,
+    )
+
+    body = client.get_object(Bucket="backup", Key="dump_20250101.tar")["Body"]
+    with tarfile.open(fileobj=body, mode="r|") as tar:
+        files = {
+            member.name: tar.extractfile(member).read()
+            for member in tar
+            if member.isfile()
+        }
+    assert files == {
+        "dump_20250101/toc.dat": b"toc",
+        "dump_20250101/3001.dat.zst": b"x" * 6000000,
+    }
+    assert (
+        stats["bytes"]
+        == client.head_object(Bucket="backup", Key="dump_20250101.tar")["ContentLength"]
+    )
+
+
+def test_part_upload_error(monkeypatch, client):
+    with pytest.raises(ValueError):
+        MultipartUploadWriter(client, "backup", "dump", part_size=MB)
+
+    upload_part = client.upload_part
+
+    def fail_second_part(**kwargs):
+        if kwargs["PartNumber"] == 2:
+            raise ConnectionError("connection reset")
+        return upload_part(**kwargs)
+
+    monkeypatch.setattr(client, "upload_part", fail_second_part)
+    with pytest.raises(ConnectionError):
+        stream_backup(
+            client,
+            None,
+            "backup",
+            "dump_20250101",
+            command=dump_command(12 * MB),
+            part_size=5 * MB,
+        )
+
+    assert "Contents" not in client.list_objects_v2(Bucket="backup")
+    assert "Uploads" not in client.list_multipart_uploads(Bucket="backup")
@@ -0,0 +1,64 @@
+from funding_crawler.current_state import (
+    current_table_name,
+    refresh_current_state,
+    verify_current_state,
+)
+from funding_crawler.models import FundingProgramSchema
+
+columns = list(FundingProgramSchema.__annotations__.keys())
+
+
+def test_current_state_matches_gen_query(duckdb_pipeline, program, load_programs):
+    pipeline = duckdb_pipeline("current_state")
+
+    day_1 = {number: 0 for number in range(10)}
+    # 2 changed, 2 removed, 1 added
+    day_2 = {**{n: r for n, r in day_1.items() if n not in (3, 4)}, 0: 1, 1: 1, 10: 0}
+    # unchanged
+    day_3 = day_2
+    # one program comes back, another changes again
+    day_4 = {**day_2, 3: 0, 0: 2}
+
+    refreshed = []
+    for day in (day_1, day_2, day_3, day_4):
+        load_programs(
+            pipeline,
+            [
+                program(
+                    number,
+                    revision,
+                    # set in the first revision only, gen_query falls back to
+                    # retired values
+                    more_info="Details" if revision == 0 else None,
+                    funding_type=["Zuschuss", f"Typ {revision}"],
+                )
+                for number, revision in day.items()
+            ],
+        )
+        refreshed.append(refresh_current_state(pipeline, "programs", columns))
+        assert verify_current_state(pipeline, "programs", columns) == 0
+
+    # built once, then only the touched programs
+    assert refreshed == [10, 5, 0, 2]
+
+    with pipeline.sql_client() as client:
+        rows = client.execute_sql(
+            f"SELECT id_hash, deleted FROM {current_table_name('programs')}"
+            " ORDER BY id_hash"
+        )
+    assert len(rows) == 11
+    assert [id_hash for id_hash, deleted in rows if deleted] == ["id-4"]
+
+    with pipeline.sql_client() as client:
+        client.execute_sql(
+            f"UPDATE {current_table_name('programs')} SET title = 'Stale'"
+            " WHERE id_hash = 'id-5'"
+        )
+    assert verify_current_state(pipeline, "programs", columns) == 2
+
+    # a new column rebuilds the table instead of inserting by position
+    older_columns = [col for col in columns if not col.endswith("_md")]
+    assert refresh_current_state(pipeline, "programs", older_columns) == 11
+    assert refresh_current_state(pipeline, "programs", columns) == 11
+    assert refresh_current_state(pipeline, "programs", columns) == 0
+    assert verify_current_state(pipeline, "programs", columns) == 0
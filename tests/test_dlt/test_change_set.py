@@ -0,0 +1,66 @@
+import dlt
+
+from funding_crawler.dlt_utils.changes import ChangeSet
+
+
+def load(pipeline, items, write_disposition, change_set=None):
+    resource = dlt.resource(items, name="programs")
+    disposition = write_disposition
+    if change_set is not None:
+        disposition = change_set.prepare(pipeline, "programs", write_disposition)
+        items = [item for item in items if change_set(item)]
+        resource = dlt.resource(items, name="programs", merge_key=change_set.key)
+    pipeline.run(resource, write_disposition=disposition)
+    if change_set is not None:
+        change_set.retire_absent(pipeline, "programs")
+
+
+def active_rows(pipeline):
+    with pipeline.sql_client() as client:
+        return sorted(
+            client.execute_sql(
+                "SELECT id_hash, checksum FROM programs WHERE on_website_to IS NULL"
+            )
+        )
+
+
+def version_counts(pipeline):
+    with pipeline.sql_client() as client:
+        return sorted(
+            client.execute_sql(
+                "SELECT id_hash, COUNT(*), COUNT(on_website_to) FROM programs"
+                " GROUP BY id_hash"
+            )
+        )
+
+
+def test_change_set_matches_full_load(duckdb_pipeline, program, write_disposition):
+    full, changes = duckdb_pipeline("full"), duckdb_pipeline("changes")
+
+    def snapshot(revisions):
+        return [program(number, revision) for number, revision in revisions.items()]
+
+    day_1 = {number: 0 for number in range(10)}
+    # 2 changed, 2 removed, 1 added
+    day_2 = {**{n: r for n, r in day_1.items() if n not in (3, 4)}, 0: 1, 1: 1, 10: 0}
+    # one program comes back, another changes again
+    day_3 = {**day_2, 3: 0, 0: 2}
+
+    change_sets = []
+    for day in (day_1, day_2, day_3):
+        load(full, snapshot(day), write_disposition)
+        change_sets.append(ChangeSet("id_hash"))
+        load(changes, snapshot(day), write_disposition, change_sets[-1])
+
+    assert active_rows(changes) == active_rows(full)
+    assert version_counts(changes) == version_counts(full)
+
+    assert change_sets[0].stats["forwarded"] == 10
+    assert change_sets[1].stats == {
+        "known": 10,
+        "seen": 9,
+        "forwarded": 3,
+        "skipped": 6,
+        "retired": 2,
+    }
+    assert change_sets[2].stats["forwarded"] == 2
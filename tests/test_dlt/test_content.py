@@ -0,0 +1,90 @@
+import pyarrow as pa
+
+from funding_crawler.current_state import (
+    current_table_name,
+    refresh_current_state,
+    verify_current_state,
+)
+from funding_crawler.dlt_utils.content import ContentStore, content_hash
+from funding_crawler.maintenance import externalize_content
+from funding_crawler.models import FundingProgramSchema
+
+columns = list(FundingProgramSchema.__annotations__.keys())
+content_columns = ["description", "more_info"]
+
+
+def revision_of(program, number, revision):
+    return program(
+        number,
+        revision,
+        # the description only changes in the third revision
+        description=f"<p>Program {number}</p>" + ("<p>New</p>" * (revision > 1)),
+        more_info="<p>Details</p>" if number % 2 else None,
+    )
+
+
+def current_rows(pipeline):
+    # validity timestamps differ between pipelines
+    with pipeline.sql_client() as client:
+        return client.execute_sql(
+            "SELECT * EXCLUDE (previous_update_dates, last_updated, on_website_from)"
+            f" FROM {current_table_name('programs')} ORDER BY id_hash"
+        )
+
+
+def test_content_store_matches_inline_columns(duckdb_pipeline, program, load_programs):
+    inline, stored = duckdb_pipeline("inline"), duckdb_pipeline("stored")
+
+    day_1 = {number: 0 for number in range(10)}
+    day_2 = {**day_1, 0: 1, 1: 1}
+    day_3 = {**day_2, 0: 2}
+
+    stores = []
+    for day in (day_1, day_2, day_3):
+        items = [
+            revision_of(program, number, revision) for number, revision in day.items()
+        ]
+        load_programs(inline, items)
+        stores.append(ContentStore(content_columns))
+        stores[-1].prepare(stored, "programs")
+        load_programs(stored, stores[-1].externalize(items))
+        refresh_current_state(inline, "programs", columns)
+        refresh_current_state(
+            stored, "programs", columns, content_columns=content_columns
+        )
+
+    assert current_rows(stored) == current_rows(inline)
+    assert verify_current_state(stored, "programs", columns, content_columns) == 0
+
+    # 10 descriptions and one shared more_info, then only the changed description
+    assert [store.stats["stored"] for store in stores] == [11, 0, 1]
+    with stored.sql_client() as client:
+        assert client.execute_sql(
+            "SELECT DISTINCT description FROM programs WHERE id_hash = 'id-1'"
+        ) == [(content_hash("<p>Program 1</p>"),)]
+
+    # 13 versions, 6 of them with more_info, loaded without the store
+    assert externalize_content(inline, "programs", content_columns) == 13 + 6
+    assert externalize_content(inline, "programs", content_columns) == 0
+    assert verify_current_state(inline, "programs", columns, content_columns) == 0
+    with inline.sql_client() as client, stored.sql_client() as stored_client:
+        query = "SELECT * FROM programs_content ORDER BY content_hash"
+        assert client.execute_sql(query) == stored_client.execute_sql(query)
+
+
+def test_content_store_arrow_tables(duckdb_pipeline, program):
+    store = ContentStore(content_columns)
+    store.prepare(duckdb_pipeline("arrow"), "programs")
+
+    items = [revision_of(program, number, 0) for number in range(3)]
+    table = store.externalize(pa.Table.from_pylist(items))
+
+    assert table.column("description").to_pylist() == [
+        content_hash(item["description"]) for item in items
+    ]
+    assert table.column("more_info").to_pylist() == [
+        None,
+        content_hash("<p>Details</p>"),
+        None,
+    ]
+    assert store.stats == {"known": 4, "stored": 4, "reused": 0}
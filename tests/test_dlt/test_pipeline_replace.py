@@ -7,6 +7,7 @@ from funding_crawler.models import FundingProgramSchema
 import warnings
 
 
+@pytest.mark.network
 @pytest.mark.filterwarnings(
     "error::pytest.PytestUnhandledThreadExceptionWarning"
 )  # validation is not catched otherwise
@@ -10,6 +10,7 @@ import warnings
 import duckdb
 
 
+@pytest.mark.network
 @pytest.mark.filterwarnings(
     "error::pytest.PytestUnhandledThreadExceptionWarning"
 )  # validation is not catched otherwise
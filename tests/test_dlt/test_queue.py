@@ -0,0 +1,125 @@
+import threading
+import time
+import os
+
+import pytest
+
+from funding_crawler.dlt_utils.queue import ScrapingQueue
+from funding_crawler.helpers import pydantic_to_arrow_schema
+from funding_crawler.models import FundingProgramSchema
+
+
+def test_queue_spills_to_disk_in_order(tmp_path):
+    queue = ScrapingQueue(
+        batch_size=5, read_timeout=0.01, max_bytes=1000, spill_dir=str(tmp_path)
+    )
+
+    for i in range(53):
+        queue.put({"i": i, "description": "x" * 100})
+
+    assert queue.qsize() == 53
+    assert queue.stats["memory_bytes_high_water"] <= 1000
+    assert queue.stats["spilled_items"] > 0
+    assert len(os.listdir(tmp_path)) == queue.stats["spill_files_high_water"]
+
+    # items still queued on close are consumed before the batches end
+    queue.close()
+    items = [item["i"] for batch in queue.get_batches() for item in batch]
+
+    assert items == list(range(53))
+    assert os.listdir(tmp_path) == []
+    assert queue.unfinished_tasks == 0
+
+
+def test_queue_bounded_by_items():
+    queue = ScrapingQueue(maxsize=3, batch_size=2, read_timeout=0.01)
+
+    for i in range(3):
+        queue.put(i)
+
+    assert queue.full()
+
+    queue.close()
+    assert list(queue.get_batches()) == [[0, 1], [2]]
+
+
+def consume(queue, batches):
+    for batch in queue.get_batches():
+        batches.append((time.monotonic(), batch))
+
+
+def test_queue_flushes_partial_batch_on_age():
+    queue = ScrapingQueue(batch_size=100, read_timeout=0.4)
+    batches = []
+    consumer = threading.Thread(target=consume, args=(queue, batches), daemon=True)
+    consumer.start()
+
+    # a slow trickle never fills the batch, it is flushed by age
+    for i in range(3):
+        queue.put(i)
+        time.sleep(0.05)
+    time.sleep(0.5)
+    assert [batch for _, batch in batches] == [[0, 1, 2]]
+
+    # close wakes the consumer right away
+    closed = time.monotonic()
+    queue.close()
+    consumer.join(timeout=1)
+    assert not consumer.is_alive()
+    assert time.monotonic() - closed < 0.1
+    assert queue.stats["flushed_on_age"] == 1
+    assert queue.stats["batch_latency_seconds_max"] >= 0.4
+
+
+def test_queue_flushes_on_bytes():
+    queue = ScrapingQueue(batch_size=100, read_timeout=10, batch_max_bytes=250)
+
+    for i in range(5):
+        queue.put({"description": "x" * 100})
+    queue.close()
+
+    assert [len(batch) for batch in queue.get_batches()] == [3, 2]
+    assert queue.stats["flushed_on_bytes"] == 1
+    assert queue.stats["flushed_on_close"] == 1
+
+
+def test_queue_yields_arrow_batches():
+    schema = pydantic_to_arrow_schema(FundingProgramSchema)
+    assert not schema.field("id_hash").nullable
+    assert schema.field("funding_type").nullable
+
+    queue = ScrapingQueue(batch_size=2, read_timeout=10, arrow_schema=schema)
+    for i in range(3):
+        queue.put(
+            {
+                "id_hash": str(i),
+                "id_url": f"program-{i}",
+                "url": f"https://example.org/program-{i}.html",
+                "title": f"Program {i}",
+                "description": "",
+                "funding_type": ["Zuschuss"] if i < 2 else None,
+                "checksum": str(i),
+                "license_info": "CC BY-ND 4.0",
+            }
+        )
+    queue.close()
+
+    batches = list(queue.get_batches())
+    assert [batch.num_rows for batch in batches] == [2, 1]
+    assert batches[0].schema == schema
+    assert batches[0].column("funding_type").to_pylist() == [
+        ["Zuschuss"],
+        ["Zuschuss"],
+    ]
+    assert batches[1].column("funding_type").to_pylist() == [None]
+    assert batches[1].column("more_info").to_pylist() == [None]
+
+
+def test_queue_rejects_missing_required_value_in_arrow_batch():
+    schema = pydantic_to_arrow_schema(FundingProgramSchema)
+    queue = ScrapingQueue(batch_size=1, read_timeout=10, arrow_schema=schema)
+    queue.put({"title": "Program without id"})
+    queue.close()
+
+    with pytest.raises(ValueError, match="id_hash"):
+        list(queue.get_batches())
@@ -0,0 +1,74 @@
+import json
+
+import pyarrow as pa
+
+from funding_crawler.dlt_utils.queue import ScrapingQueue
+from funding_crawler.dlt_utils.runner import PipelineRunner, nested_to_json
+from funding_crawler.helpers import add_markdown, pydantic_to_arrow_schema
+from funding_crawler.models import FundingProgramSchema
+
+
+def test_nested_to_json():
+    table = pa.table(
+        {
+            "id_hash": ["a", "b", "c"],
+            "funding_type": [["Zuschuss", "Darlehen, Kredit"], [], None],
+            "title": ["Ä", None, "c"],
+        }
+    )
+
+    converted = nested_to_json(table)
+
+    assert converted.schema.field("funding_type").type == pa.string()
+    assert converted.column("funding_type").to_pylist() == [
+        '["Zuschuss","Darlehen, Kredit"]',
+        "[]",
+        None,
+    ]
+    # other columns are unchanged
+    assert converted.select(["id_hash", "title"]) == table.select(["id_hash", "title"])
+
+
+def test_stream_serializes_lists_for_csv(duckdb_pipeline, program):
+    pipeline = duckdb_pipeline("runner")
+    schema = pydantic_to_arrow_schema(FundingProgramSchema)
+
+    def stream(loader_file_format, batch_transform=None):
+        queue = ScrapingQueue(batch_size=10, read_timeout=10, arrow_schema=schema)
+        for number in range(2):
+            queue.put(
+                program(
+                    number,
+                    0,
+                    description=f"<p>Program <b>{number}</b></p>",
+                    funding_type=["Zuschuss"] if number else None,
+                )
+            )
+        queue.close()
+        runner = PipelineRunner(
+            pipeline,
+            queue,
+            loader_file_format=loader_file_format,
+            batch_transform=batch_transform,
+        )
+        return list(runner.stream())
+
+    (table,) = stream("csv")
+    assert [
+        json.loads(value) if value else value
+        for value in table.column("funding_type").to_pylist()
+    ] == [None, ["Zuschuss"]]
+    assert all(not pa.types.is_list(field.type) for field in table.schema)
+
+    # other formats keep the list columns
+    (table,) = stream(None)
+    assert table.schema.field("funding_type").type == schema.field("funding_type").type
+
+    assert table.column("description_md").to_pylist() == [None, None]
+
+    # the transform runs on the pipeline thread, before the csv conversion
+    (table,) = stream("csv", add_markdown)
+    assert table.column("description_md").to_pylist() == [
+        "Program **0**",
+        "Program **1**",
+    ]
@@ -0,0 +1,218 @@
+import io
+import multiprocessing
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import polars as pl
+import pytest
+from markdownify import markdownify as md
+from sqlalchemy import create_engine, text
+
+from funding_crawler.cache import MarkdownCache, body_hash, open_store
+from funding_crawler.export import (
+    DATA_FILE,
+    FORMAT_COLUMNS,
+    MIN_COLUMNS,
+    MIN_CSV_FILE,
+    MIN_PARQUET_FILE,
+    export_schema,
+    format_batch,
+    read_batches,
+    read_csv_batches,
+    write_export,
+    write_export_archives,
+)
+from funding_crawler.models import FundingProgramSchema
+
+schema = export_schema(FundingProgramSchema)
+
+
+def current_state(count):
+    rows = []
+    for number in range(count):
+        updated = datetime(2025, 1, 1 + number % 28, tzinfo=timezone.utc)
+        description = f"<p>Program <b>{number}</b></p>"
+        # only set in some batches
+        more_info = "<ul><li>Details</li></ul>" if number > 20 else None
+        rows.append(
+            {
+                **dict.fromkeys(schema),
+                "id_hash": f"id-{number}",
+                "id_url": f"program-{number}",
+                "url": f"https://example.org/program-{number}.html",
+                "title": f"Program {number}",
+                "description": description,
+                "description_md": md(description),
+                "more_info": more_info,
+                "more_info_md": more_info and md(more_info),
+                "funding_type": ["Zuschuss", "Darlehen"] if number % 3 else None,
+                "checksum": f"checksum-{number}",
+                "license_info": "CC BY-ND 3.0 DE",
+                "previous_update_dates": [updated] if number % 2 else None,
+                "last_updated": updated if number % 2 else None,
+                "on_website_from": updated,
+                "deleted": number % 5 == 0,
+            }
+        )
+    return pl.DataFrame(rows, schema=schema)
+
+
+def test_write_export_matches_single_frame(tmp_path):
+    df = current_state(50)
+    batches = (df.slice(offset, 10) for offset in range(0, len(df), 10))
+    paths = write_export(batches, str(tmp_path))
+
+    # the export as a single DataFrame
+    mindf = df[MIN_COLUMNS]
+    for col in FORMAT_COLUMNS:
+        mindf = mindf.with_columns(pl.col(col).map_elements(md, return_dtype=pl.String))
+    for col in mindf.columns:
+        if mindf[col].dtype == pl.List:
+            mindf = mindf.with_columns(pl.col(col).list.join(", "))
+
+    assert pl.read_parquet(paths[DATA_FILE]).equals(df)
+    assert pl.read_parquet(paths[MIN_PARQUET_FILE]).equals(mindf)
+    with open(paths[MIN_CSV_FILE]) as f:
+        assert f.read() == mindf.write_csv()
+
+
+def test_read_batches(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'current.sqlite'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE current (id_hash TEXT, more_info TEXT)"))
+        for number in range(25):
+            conn.execute(
+                text("INSERT INTO current VALUES (:id_hash, :more_info)"),
+                {"id_hash": f"id-{number}", "more_info": None},
+            )
+
+    batches = list(read_batches(engine, "SELECT * FROM current", schema, batch_size=10))
+
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert all(batch.schema["more_info"] == pl.String for batch in batches)
+
+
+def test_read_csv_batches():
+    # as written by COPY (SELECT ..., to_json(<list column>) ...) TO STDOUT (FORMAT csv)
+    rows = [
+        "id_hash,description,more_info,funding_type,previous_update_dates,"
+        "on_website_from,deleted",
+        'id-0,"<p>Zeile 1</p>\n<p>Zeile 2</p>",,"[""Zuschuss"", ""Darlehen, Kredit""]",'
+        '"[""2025-01-01T00:00:00.5+00:00"",""2025-01-03T01:00:00+01:00""]",'
+        "2024-12-01 12:00:00+00,f",
+        'id-1,"",,,,2024-12-02 12:00:00.123456+00,t',
+    ]
+    source = io.BytesIO("\n".join([rows[0], *rows[1:] * 10]).encode() + b"\n")
+
+    batches = list(read_csv_batches(source, schema, block_size=150))
+    df = pl.concat(batches)
+
+    assert len(batches) > 1
+    assert df.schema == {col: schema[col] for col in df.columns}
+    assert df.to_dicts() == 10 * [
+        {
+            "id_hash": "id-0",
+            "description": "<p>Zeile 1</p>\n<p>Zeile 2</p>",
+            "more_info": None,
+            "funding_type": ["Zuschuss", "Darlehen, Kredit"],
+            "previous_update_dates": [
+                datetime(2025, 1, 1, 0, 0, 0, 500000, tzinfo=timezone.utc),
+                datetime(2025, 1, 3, 0, 0, tzinfo=timezone.utc),
+            ],
+            "on_website_from": datetime(2024, 12, 1, 12, tzinfo=timezone.utc),
+            "deleted": False,
+        },
+        {
+            "id_hash": "id-1",
+            "description": "",
+            "more_info": None,
+            "funding_type": None,
+            "previous_update_dates": None,
+            "on_website_from": datetime(
+                2024, 12, 2, 12, 0, 0, 123456, tzinfo=timezone.utc
+            ),
+            "deleted": True,
+        },
+    ]
+
+
+def test_markdown_cache(tmp_path):
+    store = str(tmp_path / "markdown.sqlite")
+    values = ["<p>Kurztext</p>", None, "<ul><li>Zuschuss</li></ul>", "<p>Kurztext</p>"]
+
+    with ProcessPoolExecutor(
+        max_workers=2, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        cache = MarkdownCache(open_store(store), pool)
+        assert cache.convert(values) == [
+            None if value is None else md(value) for value in values
+        ]
+        assert (cache.hits, cache.misses) == (0, 2)
+        cache.close()
+
+    # the next run only exports the list, the paragraph is evicted
+    cache = MarkdownCache(open_store(store))
+    assert cache.convert(["<ul><li>Zuschuss</li></ul>"]) == [
+        md("<ul><li>Zuschuss</li></ul>")
+    ]
+    assert (cache.hits, cache.misses) == (1, 0)
+    assert cache.evict() == 1
+    assert list(cache.store.keys()) == [body_hash(b"<ul><li>Zuschuss</li></ul>")]
+    cache.close()
+
+
+def test_format_batch_uses_stored_markdown():
+    df = current_state(10).with_columns(
+        # not backfilled for every other program
+        pl.when(pl.int_range(pl.len()) % 2 == 0)
+        .then(pl.col("description_md"))
+        .alias("description_md")
+    )
+
+    mindf = format_batch(df.drop("more_info_md"))
+
+    # the HTML is never converted during the export
+    assert mindf["description"].to_list() == [
+        md(f"<p>Program <b>{number}</b></p>") if number % 2 == 0 else None
+        for number in range(10)
+    ]
+    assert mindf["more_info"].to_list() == [None] * 10
+
+
+def test_write_export_archives_match_files(tmp_path):
+    df = current_state(50)
+    paths = write_export([df], str(tmp_path))
+
+    archives = {
+        str(tmp_path / "csv_data.zip"): [MIN_CSV_FILE],
+        str(tmp_path / "parquet_data.zip"): [DATA_FILE, MIN_PARQUET_FILE],
+    }
+    batches = (df.slice(offset, 10) for offset in range(0, len(df), 10))
+    write_export_archives(batches, archives, extra_files={"LICENSE-DATA": "CC"})
+
+    for archive, file_names in archives.items():
+        with zipfile.ZipFile(archive) as zipf:
+            assert zipf.namelist() == [*file_names, "LICENSE-DATA"]
+            assert zipf.read("LICENSE-DATA") == b"CC"
+            for name in file_names:
+                if name == MIN_CSV_FILE:
+                    assert zipf.read(name) == Path(paths[name]).read_bytes()
+                else:
+                    expected = pl.read_parquet(paths[name])
+                    assert pl.read_parquet(zipf.read(name)).equals(expected)
+
+
+def test_write_export_archives_errors(tmp_path):
+    df = current_state(10)
+    archives = {str(tmp_path / "csv_data.zip"): [MIN_CSV_FILE]}
+
+    with pytest.raises(ValueError, match="not unique"):
+        write_export_archives([df, df], archives)
+
+    # a failing archive stops the export instead of blocking the reader
+    missing = {str(tmp_path / "missing" / "parquet_data.zip"): [DATA_FILE]}
+    batches = (df for _ in range(20))
+    with pytest.raises(FileNotFoundError):
+        write_export_archives(batches, {**archives, **missing}, queue_size=1)
@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+from scrapy.http import HtmlResponse, Request
+from funding_crawler.incremental import is_due, is_full_sweep, revisit_interval
+from funding_crawler.spider import FundingSpider
+
+
+def test_revisit_interval():
+    today = date(2025, 9, 1)
+
+    # never changed
+    assert revisit_interval(today - timedelta(days=60), 1, today, 2, 30) == 30
+    # changed every 10 days on average
+    assert revisit_interval(today - timedelta(days=60), 7, today, 2, 30) == 5
+    # changes more often than the minimum interval
+    assert revisit_interval(today - timedelta(days=10), 11, today, 2, 30) == 2
+
+
+def test_is_due_spreads_revisits():
+    id_hash = "0123456789abcdef0123456789abcdef"
+    start = date(2025, 9, 1)
+    runs = [start + timedelta(days=2 * i) for i in range(30)]
+
+    due_runs = [day for day in runs if is_due(id_hash, 10, day, 2)]
+    assert len(due_runs) == 6
+
+    assert all(is_due(id_hash, 2, day, 2) for day in runs)
+
+    sweeps = [day for day in runs if is_full_sweep(day, 14, 2)]
+    assert 3 <= len(sweeps) <= 5
+
+
+def test_parse_incremental():
+    url = "https://www.foerderdatenbank.de/FDB/Content/DE/Foerderprogramm/Land/Sachsen/buergschaft-sachsen-beteiligung.html"
+    stored = {
+        "id_hash": "0123456789abcdef0123456789abcdef",
+        "id_url": "land-sachsen-buergschaft-sachsen-beteiligung",
+        "url": url,
+        "title": "Bürgschaft",
+        "checksum": "abc",
+        "license_info": "license",
+        "first_seen": date(2025, 6, 19),
+        "version_count": 1,
+    }
+
+    spider = FundingSpider(known_programs={url: stored})
+    spider.incremental = True
+    # pick a day on which the stored program is not due
+    spider.today = date(2025, 9, 1)
+    while is_due(stored["id_hash"], 30, spider.today, 2):
+        spider.today += timedelta(days=1)
+
+    with open("tests/test_scrapy/overview.html") as f:
+        html = f.read()
+
+    response = HtmlResponse(
+        url="https://www.foerderdatenbank.de/",
+        body=html,
+        encoding="utf-8",
+        request=Request(url="https://www.foerderdatenbank.de/"),
+    )
+    results = list(spider.parse(response))
+
+    items = [result for result in results if isinstance(result, dict)]
+    assert len(items) == 1
+    assert items[0]["checksum"] == "abc"
+    assert "first_seen" not in items[0]
+    assert len([result for result in results if isinstance(result, Request)]) == 10
+    assert spider.skipped_count == 1
@@ -0,0 +1,147 @@
+from markdownify import markdownify as md
+
+from funding_crawler.current_state import refresh_current_state, verify_current_state
+from funding_crawler.maintenance import (
+    CONTENT_COLUMNS,
+    backfill_markdown,
+    compact_duplicates,
+    externalize_content,
+)
+from funding_crawler.models import FundingProgramSchema
+
+columns = list(FundingProgramSchema.__annotations__.keys())
+
+
+def duplicate(client, checksum):
+    # store a version again, as a later load would
+    client.execute_sql(
+        "INSERT INTO programs SELECT * REPLACE ("
+        " _dlt_id || '-copy' AS _dlt_id,"
+        " CAST(CAST(_dlt_load_id AS DOUBLE) + 1 AS VARCHAR) AS _dlt_load_id)"
+        " FROM programs WHERE checksum = %s",
+        checksum,
+    )
+
+
+def reinsert(client, id_hash):
+    # retire the current version and insert it again from the same moment, as a
+    # crawl that missed the program once would
+    client.execute_sql(
+        "UPDATE programs SET on_website_to = on_website_from + INTERVAL 1 HOUR"
+        " WHERE id_hash = %s",
+        id_hash,
+    )
+    client.execute_sql(
+        "INSERT INTO programs SELECT * REPLACE ("
+        " _dlt_id || '-again' AS _dlt_id,"
+        " on_website_to AS on_website_from,"
+        " NULL AS on_website_to)"
+        " FROM programs WHERE id_hash = %s",
+        id_hash,
+    )
+
+
+def test_compact_duplicates(duckdb_pipeline, program, load_programs):
+    pipeline = duckdb_pipeline("maintenance")
+    # id-0 changes back to its first version
+    for revisions in ({0: 0, 1: 0, 2: 0}, {0: 1, 1: 0, 2: 0}, {0: 0, 1: 0, 2: 0}):
+        load_programs(
+            pipeline,
+            [program(number, revision) for number, revision in revisions.items()],
+        )
+    refresh_current_state(pipeline, "programs", columns)
+
+    with pipeline.sql_client() as client:
+        first_version = client.execute_sql(
+            "SELECT _dlt_id FROM programs WHERE checksum = '0-0'"
+            " ORDER BY on_website_from LIMIT 1"
+        )[0][0]
+        duplicate(client, "0-1")
+        duplicate(client, "1-0")
+        reinsert(client, "id-2")
+
+    report = compact_duplicates(pipeline, "programs", dry_run=True)
+    assert [(id_hash, checksum) for id_hash, checksum, *_ in report] == [
+        ("id-0", "0-1"),
+        ("id-1", "1-0"),
+        ("id-2", "2-0"),
+    ]
+
+    deleted = compact_duplicates(pipeline, "programs")
+    assert sorted(row[:3] for row in deleted) == sorted(row[:3] for row in report)
+    assert compact_duplicates(pipeline, "programs") == []
+
+    with pipeline.sql_client() as client:
+        # both versions 0-0 are kept, A -> B -> A is not a duplicate
+        assert client.execute_sql(
+            "SELECT checksum, on_website_to IS NULL FROM programs"
+            " WHERE id_hash = 'id-0' ORDER BY on_website_from"
+        ) == [("0-0", False), ("0-1", False), ("0-0", True)]
+        assert client.execute_sql(
+            "SELECT _dlt_id FROM programs WHERE checksum = '0-0'"
+            " ORDER BY on_website_from LIMIT 1"
+        ) == [(first_version,)]
+        # the first version is kept and valid until the end of its duplicates
+        assert client.execute_sql(
+            "SELECT id_hash, _dlt_id LIKE '%-copy' OR _dlt_id LIKE '%-again',"
+            " on_website_to IS NULL FROM programs"
+            " WHERE id_hash IN ('id-1', 'id-2') ORDER BY id_hash"
+        ) == [("id-1", False, True), ("id-2", False, True)]
+
+    refresh_current_state(
+        pipeline, "programs", columns, id_hashes={row[0] for row in deleted}
+    )
+    assert verify_current_state(pipeline, "programs", columns) == 0
+
+
+def test_backfill_markdown(duckdb_pipeline, program, load_programs):
+    pipeline = duckdb_pipeline("backfill")
+    # loaded before the *_md columns were filled, id-0 changed once
+    for revisions in ({0: 0, 1: 0}, {0: 1, 1: 0}):
+        load_programs(
+            pipeline,
+            [
+                program(number, revision, description=f"<p>Förderung {revision}</p>")
+                for number, revision in revisions.items()
+            ],
+        )
+    externalize_content(pipeline, "programs")
+    refresh_current_state(
+        pipeline, "programs", columns, content_columns=CONTENT_COLUMNS
+    )
+
+    converted = []
+
+    def convert(values):
+        converted.extend(values)
+        return [md(value) for value in values]
+
+    assert backfill_markdown(pipeline, "programs", convert=convert) == {"id-0", "id-1"}
+    # every distinct HTML value is converted once
+    assert sorted(converted) == ["<p>Förderung 0</p>", "<p>Förderung 1</p>"]
+
+    refresh_current_state(
+        pipeline,
+        "programs",
+        columns,
+        id_hashes={"id-0", "id-1"},
+        content_columns=CONTENT_COLUMNS,
+    )
+    assert verify_current_state(pipeline, "programs", columns, CONTENT_COLUMNS) == 0
+    with pipeline.sql_client() as client:
+        assert client.execute_sql(
+            "SELECT id_hash, description_md, more_info_md FROM programs_current"
+            " ORDER BY id_hash"
+        ) == [
+            ("id-0", md("<p>Förderung 1</p>"), None),
+            ("id-1", md("<p>Förderung 0</p>"), None),
+        ]
+        # stored once in the content table, like the HTML
+        assert client.execute_sql(
+            "SELECT COUNT(*) FROM programs WHERE description_md IS NULL"
+            " OR description_md NOT IN (SELECT content_hash FROM programs_content)"
+        ) == [(0,)]
+
+    converted.clear()
+    assert backfill_markdown(pipeline, "programs", convert=convert) == set()
+    assert converted == []
@@ -3,8 +3,11 @@ import zipfile
 import io
 from concurrent.futures import ThreadPoolExecutor
 import polars as pl
+import pytest
 from tqdm import tqdm
 
+pytestmark = pytest.mark.network
+
 
 def test_not_deleted():
     data_url = (
@@ -0,0 +1,95 @@
+import glob
+from markdownify import markdownify as md
+from scrapy.http import HtmlResponse
+import pyarrow as pa
+from funding_crawler.extraction import (
+    CompiledExtractor,
+    SelectorExtractor,
+    extract_item_from_body,
+)
+from funding_crawler.helpers import (
+    MARKDOWN_FIELDS,
+    add_markdown,
+    pydantic_to_arrow_schema,
+)
+from funding_crawler.models import FundingProgramSchema
+from funding_crawler.spider import FundingSpider
+
+
+def test_compiled_extractor_matches_selectors():
+    for file_name in sorted(glob.glob("tests/test_scrapy/*.html")):
+        with open(file_name, "rb") as f:
+            html = f.read()
+
+        response = HtmlResponse(
+            url="https://www.foerderdatenbank.de/FDB/Content/DE/Foerderprogramm/Bund/test.html",
+            body=html,
+            encoding="utf-8",
+        )
+
+        reference_warnings = []
+        compiled_warnings = []
+
+        reference = SelectorExtractor().extract(
+            response.selector, response.url, reference_warnings.append
+        )
+        compiled = CompiledExtractor().extract(
+            response.selector, response.url, compiled_warnings.append
+        )
+
+        assert compiled == reference, file_name
+        assert compiled_warnings == reference_warnings, file_name
+
+        if compiled is not None:
+            assert all(
+                type(value) in (str, list) or value is None
+                for value in compiled.values()
+            )
+
+
+def test_extract_item_from_body_matches_spider():
+    url = (
+        "https://www.foerderdatenbank.de/FDB/Content/DE/Foerderprogramm/Bund/test.html"
+    )
+
+    with open("tests/test_scrapy/detail_single_desc.html", "rb") as f:
+        html = f.read()
+
+    response = HtmlResponse(url=url, body=html, encoding="utf-8")
+    expected = list(FundingSpider().parse_details(response))[0]
+
+    item, warnings = extract_item_from_body("compiled", html, url, "utf-8")
+
+    # license_info contains the time of extraction
+    assert (
+        item.pop("license_info").split(" zuletzt")[0]
+        == expected.pop("license_info").split(" zuletzt")[0]
+    )
+    assert item == expected
+    assert warnings == []
+
+
+def test_add_markdown():
+    url = (
+        "https://www.foerderdatenbank.de/FDB/Content/DE/Foerderprogramm/Bund/test.html"
+    )
+
+    with open("tests/test_scrapy/detail_multi_desc.html", "rb") as f:
+        item, _ = extract_item_from_body("compiled", f.read(), url, "utf-8")
+    # converted on the pipeline thread, not during extraction
+    assert not any(f"{field}_md" in item for field in MARKDOWN_FIELDS)
+
+    expected = {
+        f"{field}_md": None if item[field] is None else md(item[field])
+        for field in MARKDOWN_FIELDS
+    }
+    table = pa.Table.from_pylist(
+        [item, {**item, "description_md": "stored"}],
+        schema=pydantic_to_arrow_schema(FundingProgramSchema),
+    )
+
+    assert add_markdown([dict(item)]) == [{**item, **expected}]
+    assert add_markdown(table).select(list(expected)).to_pylist() == [
+        expected,
+        {**expected, "description_md": "stored"},
+    ]
@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+from scrapy.core.downloader import Slot
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+from funding_crawler.middlewares import AdaptiveConcurrencyMiddleware
+
+
+def make_middleware():
+    crawler = get_crawler(
+        settings_dict={
+            "ADAPTIVE_CONCURRENCY_ENABLED": True,
+            "ADAPTIVE_CONCURRENCY_MIN": 2,
+            "ADAPTIVE_CONCURRENCY_MAX": 6,
+            "ADAPTIVE_DELAY_MIN": 0.2,
+            "ADAPTIVE_DELAY_MAX": 10.0,
+            "ADAPTIVE_TARGET_LATENCY": 1.0,
+            "ADAPTIVE_WINDOW": 10,
+            "RETRY_HTTP_CODES": [500, 503, 429],
+        }
+    )
+    crawler.stats.open_spider(None)
+    slot = Slot(concurrency=4, delay=0.7, randomize_delay=False)
+    crawler.engine = SimpleNamespace(
+        downloader=SimpleNamespace(slots={"example.com": slot})
+    )
+    return AdaptiveConcurrencyMiddleware.from_crawler(crawler), slot, crawler.stats
+
+
+def respond(middleware, status=200, latency=0.1, headers=None):
+    request = Request(
+        "https://example.com",
+        meta={"download_slot": "example.com", "download_latency": latency},
+    )
+    response = HtmlResponse(
+        "https://example.com", status=status, headers=headers, request=request
+    )
+    return middleware.process_response(request, response, None)
+
+
+def test_additive_increase():
+    middleware, slot, stats = make_middleware()
+
+    for _ in range(10):
+        respond(middleware)
+
+    assert slot.concurrency == 5
+    assert abs(slot.delay - 0.7 * 0.75) < 1e-9
+    assert stats.get_value("adaptive/increase_count") == 1
+
+    for _ in range(100):
+        respond(middleware)
+
+    assert slot.concurrency == 6
+    assert slot.delay == 0.2
+
+
+def test_multiplicative_decrease():
+    middleware, slot, stats = make_middleware()
+
+    for _ in range(8):
+        respond(middleware)
+    respond(middleware, status=503)
+    respond(middleware, status=503)
+
+    assert slot.concurrency == 2
+    assert abs(slot.delay - 1.4) < 1e-9
+    assert stats.get_value("adaptive/decrease_count") == 1
+
+
+def test_retry_after():
+    middleware, slot, stats = make_middleware()
+
+    respond(middleware, status=429, headers={"Retry-After": "5"})
+
+    assert slot.concurrency == 2
+    assert slot.delay == 5.0
+    assert stats.get_value("adaptive/retry_after_count") == 1
+
+
+def test_burst_decreases_once_per_window():
+    middleware, slot, stats = make_middleware()
+
+    # responses to requests that were in flight together
+    for _ in range(7):
+        respond(middleware, status=503, headers={"Retry-After": "1"})
+
+    assert slot.concurrency == 2
+    assert slot.delay == 1.0
+    assert stats.get_value("adaptive/decrease_count") == 1
+    assert stats.get_value("adaptive/retry_after_count") == 7
+
+    # a longer Retry-After still raises the delay, without another decrease
+    respond(middleware, status=429, headers={"Retry-After": "3"})
+    assert slot.delay == 3.0
+    assert stats.get_value("adaptive/decrease_count") == 1
+
+
+def test_recovery_is_proportional():
+    middleware, slot, stats = make_middleware()
+    respond(middleware, status=429, headers={"Retry-After": "60"})
+    assert slot.delay == 10.0
+
+    # the rest of the window after the decrease, then clean windows
+    for _ in range(9 + 10 * 20):
+        respond(middleware)
+
+    assert slot.delay == 0.2
+    assert slot.concurrency == 6
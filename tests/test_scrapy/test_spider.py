@@ -1,7 +1,9 @@
 from scrapy.http import HtmlResponse, Request
 from funding_crawler.spider import FundingSpider
+from funding_crawler.cache import ValidatorCache, open_store
 from pydantic import ValidationError
 from funding_crawler.models import FundingProgramSchema
+import pytest
 import requests
 
 
@@ -41,6 +43,40 @@ def test_parse():
     assert pagination_requests[0].callback == spider.parse
 
 
+def test_parse_fanout():
+    spider = FundingSpider()
+    spider.pagination_fanout = True
+
+    with open("tests/test_scrapy/overview.html") as f:
+        html = f.read()
+
+    url = "https://www.foerderdatenbank.de/SiteGlobals/FDB/Forms/Suche/Foederprogrammsuche_Formular.html"
+    response = HtmlResponse(
+        url=url, body=html, encoding="utf-8", request=Request(url=url)
+    )
+
+    results = list(spider.parse(response))
+
+    detail_requests = [req for req in results if req.callback == spider.parse_details]
+    pagination_requests = [req for req in results if req.callback == spider.parse]
+
+    assert len(detail_requests) == 10
+    # 2395 hits with 10 cards per page, pages 2 to 240
+    assert len(pagination_requests) == 239
+    assert "list%253D2&" in pagination_requests[0].url
+    assert "list%253D240&" in pagination_requests[-1].url
+    assert pagination_requests[-1].meta["fanout_last"]
+    assert not any(req.meta["fanout_last"] for req in pagination_requests[:-1])
+
+    # fanned out pages do not follow the next page link, except for the last one
+    page_response = HtmlResponse(
+        url=url, body=html, encoding="utf-8", request=pagination_requests[0]
+    )
+    assert not [
+        req for req in spider.parse(page_response) if req.callback == spider.parse
+    ]
+
+
 def test_parse_details_multi():
     spider = FundingSpider()
 
@@ -147,6 +183,7 @@ def test_parse_details_single_alt():
     )
 
 
+@pytest.mark.network
 def test_parse_details_single_fail_07_25():
     spider = FundingSpider()
 
@@ -172,3 +209,119 @@ def test_parse_details_single_fail_07_25():
         raise AssertionError(f"Validation error: {e}")
 
     print(validated_item.checksum)
+
+
+def test_parse_details_validator_cache(tmp_path):
+    spider = FundingSpider()
+    spider.validator_cache = ValidatorCache(open_store(str(tmp_path / "cache.sqlite")))
+
+    url = "https://www.foerderdatenbank.de/FDB/Content/DE/Foerderprogramm/Bund/BMWi/exist-women.html"
+
+    with open("tests/test_scrapy/detail_single_desc.html", "rb") as f:
+        detail_html = f.read()
+
+    response = HtmlResponse(
+        url=url,
+        body=detail_html,
+        encoding="utf-8",
+        headers={"ETag": '"abc"'},
+        request=spider.details_request(url),
+    )
+    item = list(spider.parse_details(response))[0]
+
+    request = spider.details_request(url)
+    assert request.headers.get("If-None-Match") == b'"abc"'
+    assert request.meta["handle_httpstatus_list"] == [304]
+
+    not_modified = HtmlResponse(url=url, status=304, body=b"", request=request)
+    cached = list(spider.parse_details(not_modified))
+
+    assert len(cached) == 1
+    assert cached[0]["checksum"] == item["checksum"]
+    assert cached[0]["contact_info_email"] == item["contact_info_email"]
+
+    spider.validator_cache.close()
+
+
+def test_validator_cache_miss_and_version(tmp_path):
+    spider = FundingSpider()
+    store = open_store(str(tmp_path / "cache.sqlite"))
+    spider.validator_cache = ValidatorCache(store, version="v1")
+
+    url = "https://www.foerderdatenbank.de/FDB/Content/DE/Foerderprogramm/Bund/BMWi/exist-women.html"
+
+    with open("tests/test_scrapy/detail_single_desc.html", "rb") as f:
+        detail_html = f.read()
+
+    response = HtmlResponse(
+        url=url,
+        body=detail_html,
+        encoding="utf-8",
+        headers={"ETag": '"abc"'},
+        request=spider.details_request(url),
+    )
+    list(spider.parse_details(response))
+    request = spider.details_request(url)
+    assert request.headers.get("If-None-Match") == b'"abc"'
+
+    # entries of another extractor version are neither used nor validated
+    spider.validator_cache = ValidatorCache(store, version="v2")
+    assert spider.details_request(url).headers.get("If-None-Match") is None
+
+    # a 304 for a request made before the entry became unusable
+    spider.checkpoint = object()
+    spider.track(request)
+    not_modified = HtmlResponse(url=url, status=304, body=b"", request=request)
+    (retry,) = list(spider.parse_details(not_modified))
+    # the new request is pending instead of the answered one
+    assert list(spider.frontier.values()) == [retry]
+
+    assert isinstance(retry, Request)
+    assert retry.url == url
+    assert retry.dont_filter
+    assert retry.callback == spider.parse_details
+    assert retry.headers.get("If-None-Match") is None
+    assert retry.headers.get("If-Modified-Since") is None
+    assert "handle_httpstatus_list" not in retry.meta
+
+    store.close()
+
+
+def test_checkpoint_resume(tmp_path):
+    from funding_crawler.dlt_utils.checkpoint import CrawlCheckpoint
+
+    checkpoint = CrawlCheckpoint(str(tmp_path))
+    spider = FundingSpider(checkpoint=checkpoint)
+    spider.start_urls = ["http://example.com"]
+
+    start_request = list(spider.start_requests())[0]
+
+    with open("tests/test_scrapy/overview.html") as f:
+        html = f.read()
+
+    response = HtmlResponse(
+        url="http://example.com", body=html, encoding="utf-8", request=start_request
+    )
+    results = list(spider.parse(response))
+
+    # listing page is done, the requests it produced are pending
+    assert len(spider.frontier) == len(results) == 11
+
+    checkpoint.record_item({"title": "Scraped before interruption"})
+    spider.save_checkpoint()
+    checkpoint.close()
+
+    checkpoint = CrawlCheckpoint(str(tmp_path))
+    assert checkpoint.is_resumable
+    assert list(checkpoint.replay_items()) == [{"title": "Scraped before interruption"}]
+
+    resumed = FundingSpider(checkpoint=checkpoint)
+    requests_ = list(resumed.start_requests())
+
+    assert sorted(r.url for r in requests_) == sorted(r.url for r in results)
+    assert resumed.unique_urls == spider.unique_urls
+    assert resumed.page_count == 1
+
+    checkpoint.clear()
+    assert not checkpoint.is_resumable
+    checkpoint.close()
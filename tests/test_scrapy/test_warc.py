@@ -0,0 +1,98 @@
+import gzip
+from unittest.mock import patch
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+from funding_crawler.spider import FundingSpider
+from funding_crawler.warc import (
+    WarcArchiveMiddleware,
+    WarcReplayDownloadHandler,
+    replay_settings,
+    run_ids,
+)
+
+url = "https://www.foerderdatenbank.de/FDB/Content/DE/Foerderprogramm/Bund/detail_multi_desc.html"
+
+
+def archive(directory, responses, keep_runs=10):
+    crawler = get_crawler(
+        settings_dict={"WARC_ARCHIVE_DIR": str(directory), "WARC_KEEP_RUNS": keep_runs}
+    )
+    crawler.stats.open_spider(None)
+    middleware = WarcArchiveMiddleware.from_crawler(crawler)
+    for response in responses:
+        middleware.process_response(response.request, response, None)
+    middleware.spider_closed(None)
+    return middleware.run_id
+
+
+def replay(directory, request, until=None):
+    crawler = get_crawler(settings_dict=replay_settings(str(directory), until))
+    crawler.stats.open_spider(None)
+    handler = WarcReplayDownloadHandler.from_crawler(crawler)
+    results = []
+    handler.download_request(request, None).addCallback(results.append)
+    return results[0]
+
+
+def test_warc_roundtrip(tmp_path):
+    with open("tests/test_scrapy/detail_multi_desc.html", "rb") as f:
+        body = f.read()
+
+    compressed = HtmlResponse(
+        url=url,
+        body=gzip.compress(body),
+        headers={"Content-Encoding": "gzip", "ETag": '"abc"'},
+        request=Request(url),
+    )
+    not_modified = HtmlResponse(url=url, status=304, request=Request(url))
+    archive(tmp_path, [compressed, not_modified])
+
+    # the 304 is archived, but replay serves the last response with a body
+    response = replay(tmp_path, Request(url + "#fragment"))
+    assert response.status == 200
+    assert response.headers.get("Content-Encoding") == b"gzip"
+    assert response.headers.get("ETag") == b'"abc"'
+    assert gzip.decompress(response.body) == body
+    assert "warc" in response.flags
+
+    missing = replay(tmp_path, Request(url.replace("multi", "single")))
+    assert missing.status == 404
+
+
+def test_warc_replay_parse(tmp_path):
+    with open("tests/test_scrapy/detail_multi_desc.html", "rb") as f:
+        body = f.read()
+
+    live = HtmlResponse(url=url, body=body, encoding="utf-8", request=Request(url))
+    archive(tmp_path, [live])
+    replayed = replay(tmp_path, Request(url))
+
+    spider = FundingSpider()
+    live_item = next(spider.parse_details(live))
+    replayed_item = next(spider.parse_details(replayed))
+
+    assert replayed_item["checksum"] == live_item["checksum"]
+
+
+def test_warc_runs(tmp_path):
+    def respond(url, body):
+        return HtmlResponse(url=url, body=body, request=Request(url))
+
+    other = url.replace("multi", "single")
+    runs = []
+    for number, run_id in enumerate(["20250101020000", "20250103020000"]):
+        with patch("funding_crawler.warc._run_id", return_value=run_id):
+            responses = [respond(url, f"<p>run {number}</p>".encode())]
+            if number == 0:
+                responses.append(respond(other, b"<p>only in run 0</p>"))
+            runs.append(archive(tmp_path, responses))
+
+    assert run_ids(tmp_path) == runs
+    assert replay(tmp_path, Request(url)).body == b"<p>run 1</p>"
+    assert replay(tmp_path, Request(url), runs[0]).body == b"<p>run 0</p>"
+    # pages not fetched again are served from the run that last fetched them
+    assert replay(tmp_path, Request(other)).body == b"<p>only in run 0</p>"
+
+    with patch("funding_crawler.warc._run_id", return_value="20250105020000"):
+        archive(tmp_path, [], keep_runs=2)
+    assert run_ids(tmp_path) == ["20250103020000", "20250105020000"]
@@ -6,9 +6,30 @@ from funding_crawler.helpers import (
     pydantic_to_polars_schema,
 )
 import random
+import uuid
+import dlt
 import polars as pl
+from dlt.common.libs.pydantic import pydantic_to_table_schema_columns
+import pytest
+from markdownify import markdownify as md
 from sqlalchemy import create_engine
 import os
+from funding_crawler.current_state import (
+    _touched_query,
+    _watermark_query,
+    refresh_current_state,
+    verify_current_state,
+)
+from funding_crawler.dlt_utils.changes import ChangeSet
+from funding_crawler.dlt_utils.content import content_hash, sql_content_hash
+from funding_crawler.maintenance import (
+    HISTORY_INDEXES,
+    backfill_markdown,
+    compact_duplicates,
+    ensure_indexes,
+    externalize_content,
+    index_name,
+)
 from funding_crawler.models import FundingProgramSchema
 
 dataset_name = "foerderdatenbankdumpbackend"
@@ -17,7 +38,41 @@ columns = list(FundingProgramSchema.__annotations__.keys())
 
 postgres_conn_str = os.getenv("POSTGRES_CONN_STR")
 
-engine = create_engine(postgres_conn_str)
+pytestmark = pytest.mark.skipif(
+    postgres_conn_str is None, reason="POSTGRES_CONN_STR is not set"
+)
+
+engine = create_engine(postgres_conn_str) if postgres_conn_str else None
+
+
+@pytest.fixture
+def postgres_pipeline(monkeypatch, tmp_path, program, load_programs):
+    """
+    Pipeline loading two days of three programs into the history table "programs"
+    of a new dataset, which is dropped afterwards.
+    """
+    monkeypatch.setenv("RUNTIME__DLTHUB_TELEMETRY", "false")
+    pipeline = dlt.pipeline(
+        pipeline_name="maintenance_postgres",
+        pipelines_dir=str(tmp_path / "pipelines"),
+        destination=dlt.destinations.postgres(postgres_conn_str),
+        dataset_name=f"test_maintenance_{uuid.uuid4().hex[:8]}",
+    )
+    for revisions in ({0: 0, 1: 0, 2: 0}, {0: 1, 1: 0, 2: 0}):
+        load_programs(
+            pipeline,
+            [
+                program(number, revision, description=f"<p>Förderung {revision}</p>")
+                for number, revision in revisions.items()
+            ],
+        )
+    yield pipeline
+    with pipeline.sql_client() as client:
+        client.drop_dataset()
+        # the scd2 merge loads through a staging dataset next to it
+        with client.with_staging_dataset():
+            if client.has_dataset():
+                client.drop_dataset()
 
 
 def test_gen_comp_a():
@@ -146,3 +201,219 @@ def test_gen_query_complete():
     assert len(present.filter(pl.col("previous_update_dates").is_null())) < len(present)
 
     assert len(present.filter(pl.col("last_updated") < pl.col("on_website_from"))) == 0
+
+
+def test_ensure_indexes_postgres(postgres_pipeline):
+    created = ensure_indexes(postgres_pipeline, "programs")
+    assert created == [index_name("programs", suffix) for suffix, *_ in HISTORY_INDEXES]
+    assert ensure_indexes(postgres_pipeline, "programs") == []
+
+    with postgres_pipeline.sql_client() as client:
+        (indexdef,) = client.execute_sql(
+            "SELECT indexdef FROM pg_indexes WHERE schemaname = %s AND indexname = %s",
+            client.dataset_name,
+            index_name("programs", "active_id_hash"),
+        )[0]
+    assert "INCLUDE (checksum)" in indexdef
+    assert "WHERE (on_website_to IS NULL)" in indexdef
+
+
+def test_compact_duplicates_postgres(postgres_pipeline, program, load_programs):
+    # id-0 changes back to its first version, A -> B -> A
+    load_programs(
+        postgres_pipeline,
+        [program(number, 0, description="<p>Förderung 0</p>") for number in range(3)],
+    )
+    with postgres_pipeline.sql_client() as client:
+        history = client.make_qualified_table_name("programs")
+        copied = [
+            name
+            for (name,) in client.execute_sql(
+                "SELECT column_name FROM information_schema.columns"
+                " WHERE table_schema = %s AND table_name = 'programs'",
+                client.dataset_name,
+            )
+            if name not in ("_dlt_id", "_dlt_load_id")
+        ]
+        # store the retired version of id-0 and the current one of id-1 again,
+        # as a later load would
+        client.execute_sql(
+            f"INSERT INTO {history} (_dlt_id, _dlt_load_id, {', '.join(copied)})"
+            " SELECT _dlt_id || '-copy',"
+            " CAST(CAST(_dlt_load_id AS NUMERIC) + 1 AS VARCHAR),"
+            f" {', '.join(copied)} FROM {history}"
+            " WHERE checksum IN ('0-1', '1-0')"
+        )
+        # id-2 missed by one crawl: retired and inserted again from the same moment
+        client.execute_sql(
+            f"UPDATE {history} SET on_website_to = on_website_from + INTERVAL '1 hour'"
+            " WHERE id_hash = 'id-2'"
+        )
+        client.execute_sql(
+            f"INSERT INTO {history} (_dlt_id, _dlt_load_id, {', '.join(copied)})"
+            " SELECT _dlt_id || '-again', _dlt_load_id,"
+            f" {', '.join(copied)} FROM {history} WHERE id_hash = 'id-2'"
+        )
+        client.execute_sql(
+            f"UPDATE {history} SET on_website_from = on_website_to,"
+            " on_website_to = NULL WHERE _dlt_id LIKE '%%-again'"
+        )
+
+    report = compact_duplicates(postgres_pipeline, "programs", dry_run=True)
+    assert [(id_hash, checksum) for id_hash, checksum, *_ in report] == [
+        ("id-0", "0-1"),
+        ("id-1", "1-0"),
+        ("id-2", "2-0"),
+    ]
+    deleted = compact_duplicates(postgres_pipeline, "programs")
+    assert sorted(row[:3] for row in deleted) == sorted(row[:3] for row in report)
+    assert compact_duplicates(postgres_pipeline, "programs") == []
+
+    with postgres_pipeline.sql_client() as client:
+        # the reverted version is kept, the validity has no gap
+        assert client.execute_sql(
+            f"SELECT checksum, on_website_to IS NULL FROM {history}"
+            " WHERE id_hash = 'id-0' ORDER BY on_website_from"
+        ) == [("0-0", False), ("0-1", False), ("0-0", True)]
+        assert client.execute_sql(
+            f"SELECT COUNT(*) FROM {history} AS history WHERE EXISTS ("
+            f" SELECT 1 FROM {history} AS later"
+            " WHERE later.id_hash = history.id_hash"
+            " AND later.on_website_from > history.on_website_from)"
+            " AND NOT EXISTS ("
+            f" SELECT 1 FROM {history} AS later"
+            " WHERE later.id_hash = history.id_hash"
+            " AND later.on_website_from = history.on_website_to)"
+        ) == [(0,)]
+        # the first version of each run is kept and valid until its end
+        assert client.execute_sql(
+            f"SELECT id_hash, _dlt_id LIKE '%%-copy' OR _dlt_id LIKE '%%-again',"
+            f" on_website_to IS NULL FROM {history}"
+            " WHERE id_hash IN ('id-1', 'id-2') ORDER BY id_hash"
+        ) == [("id-1", False, True), ("id-2", False, True)]
+
+
+def test_content_hash_postgres(postgres_pipeline):
+    value = "<p>Förderung für Vereine – 100 %</p>"
+    with postgres_pipeline.sql_client() as client:
+        assert client.execute_sql(
+            f"SELECT {sql_content_hash('postgres', '%s')}", value
+        ) == [(content_hash(value),)]
+
+    # 4 versions, 2 distinct descriptions
+    assert externalize_content(postgres_pipeline, "programs", ["description"]) == 4
+    assert externalize_content(postgres_pipeline, "programs", ["description"]) == 0
+
+    with postgres_pipeline.sql_client() as client:
+        history = client.make_qualified_table_name("programs")
+        content = client.make_qualified_table_name("programs_content")
+        assert client.execute_sql(
+            f"SELECT DISTINCT description FROM {history} ORDER BY description"
+        ) == sorted(
+            (content_hash(f"<p>Förderung {revision}</p>"),) for revision in (0, 1)
+        )
+        assert client.execute_sql(
+            f"SELECT content FROM {content} ORDER BY content"
+        ) == [("<p>Förderung 0</p>",), ("<p>Förderung 1</p>",)]
+
+
+def test_backfill_markdown_postgres(postgres_pipeline):
+    # the history is checked until the current state table exists
+    assert backfill_markdown(postgres_pipeline, "programs", content_columns=()) == {
+        "id-0",
+        "id-1",
+        "id-2",
+    }
+    refresh_current_state(postgres_pipeline, "programs", columns)
+    assert backfill_markdown(postgres_pipeline, "programs", content_columns=()) == set()
+
+    with postgres_pipeline.sql_client() as client:
+        history = client.make_qualified_table_name("programs")
+        assert client.execute_sql(
+            f"SELECT DISTINCT description, description_md FROM {history}"
+            " ORDER BY description"
+        ) == [
+            (f"<p>Förderung {revision}</p>", md(f"<p>Förderung {revision}</p>"))
+            for revision in (0, 1)
+        ]
+    assert verify_current_state(postgres_pipeline, "programs", columns) == 0
+
+
+def test_retire_absent_postgres(postgres_pipeline, program, write_disposition):
+    def load(revisions):
+        change_set = ChangeSet("id_hash")
+        disposition = change_set.prepare(
+            postgres_pipeline, "programs", write_disposition
+        )
+        items = [
+            item
+            for item in (
+                program(number, revision, description=f"<p>Förderung {revision}</p>")
+                for number, revision in revisions.items()
+            )
+            if change_set(item)
+        ]
+        # column hints like the pipeline runner passes them, see ScrapingHost.run
+        postgres_pipeline.run(
+            dlt.resource(items, name="programs", merge_key=change_set.key),
+            columns=pydantic_to_table_schema_columns(FundingProgramSchema),
+            write_disposition=disposition,
+        )
+        return change_set, change_set.retire_absent(postgres_pipeline, "programs")
+
+    # id-0 changed, id-1 unchanged, id-2 no longer listed
+    change_set, retired = load({0: 2, 1: 0})
+    assert retired == 1
+    assert change_set.stats["forwarded"] == 1
+
+    with postgres_pipeline.sql_client() as client:
+        history = client.make_qualified_table_name("programs")
+        rows = client.execute_sql(
+            f"SELECT checksum, on_website_to FROM {history} ORDER BY checksum"
+        )
+    valid_to = dict(rows)
+    assert [checksum for checksum, to in rows if to is None] == ["0-2", "1-0"]
+    # the absent program is retired at the boundary of the load
+    assert valid_to["2-0"] == valid_to["0-1"] == change_set.boundary_timestamp
+    assert valid_to["0-0"] < valid_to["0-1"]
+
+    # nothing is retired when every active program was seen
+    assert load({0: 2, 1: 0})[1] == 0
+    with postgres_pipeline.sql_client() as client:
+        assert (
+            client.execute_sql(
+                f"SELECT checksum, on_website_to FROM {history} ORDER BY checksum"
+            )
+            == rows
+        )
+
+
+def test_current_state_postgres(postgres_pipeline, program, load_programs):
+    ensure_indexes(postgres_pipeline, "programs")
+    assert refresh_current_state(postgres_pipeline, "programs", columns) == 3
+
+    # id-0 unchanged, id-1 changed, id-2 retired
+    load_programs(
+        postgres_pipeline,
+        [program(number, revision) for number, revision in {0: 1, 1: 1}.items()],
+    )
+    assert refresh_current_state(postgres_pipeline, "programs", columns) == 2
+    assert refresh_current_state(postgres_pipeline, "programs", columns) == 0
+    assert verify_current_state(postgres_pipeline, "programs", columns) == 0
+
+    # the watermark and the touched programs are read from the indexes, the cost
+    # of a refresh does not grow with the history
+    with postgres_pipeline.sql_client() as client:
+        history = client.make_qualified_table_name("programs")
+        (refreshed_through,) = client.execute_sql(
+            f"SELECT MAX(on_website_from) FROM {history}"
+        )[0]
+        client.execute_sql("SET enable_seqscan = off")
+        for query, args in [
+            (_watermark_query(history), []),
+            _touched_query(history, refreshed_through, ["id-0"]),
+        ]:
+            plan = "\n".join(
+                line for (line,) in client.execute_sql(f"EXPLAIN {query}", *args)
+            )
+            assert "Seq Scan" not in plan, plan
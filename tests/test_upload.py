@@ -0,0 +1,93 @@
+import zipfile
+
+import pytest
+from botocore.exceptions import ClientError
+
+from funding_crawler.upload import (
+    DIGEST_METADATA_KEY,
+    TRANSFER_CONFIG,
+    Uploader,
+    file_digest,
+    remote_digest,
+    zip_digest,
+)
+from tests.fake_s3 import FakeS3Client
+
+
+@pytest.fixture
+def client():
+    return FakeS3Client("dump")
+
+
+def write_zip(path, date_time):
+    with zipfile.ZipFile(path, "w") as zipf:
+        zipf.writestr(zipfile.ZipInfo("data.csv", date_time), "id_hash\nid-0\n")
+
+
+def test_uploads_only_changed_files(tmp_path, client):
+    first, second = tmp_path / "first.zip", tmp_path / "second.zip"
+    write_zip(first, (2025, 1, 1, 2, 0, 0))
+    # the same entries, written in a later run
+    write_zip(second, (2025, 1, 3, 2, 0, 0))
+    large = tmp_path / "dump"
+    large.write_bytes(b"x" * 2**20)
+
+    assert file_digest(first) != file_digest(second)
+    assert zip_digest(first) == zip_digest(second)
+
+    uploader = Uploader(client)
+    uploader.submit(
+        str(first),
+        "dump",
+        "data/csv_data.zip",
+        extra_args={"ContentType": "application/zip"},
+        digest=zip_digest,
+    )
+    uploader.submit(str(large), "dump", "dump_20250101")
+    assert uploader.wait() == {
+        ("dump", "data/csv_data.zip"): True,
+        ("dump", "dump_20250101"): True,
+    }
+    assert remote_digest(client, "dump", "dump_20250101") == file_digest(large)
+    assert remote_digest(client, "dump", "missing") is None
+    _, _, _, extra_args, config = next(
+        call for call in client.upload_file_calls if call[2] == "data/csv_data.zip"
+    )
+    assert extra_args == {
+        "ContentType": "application/zip",
+        "Metadata": {DIGEST_METADATA_KEY: zip_digest(first)},
+    }
+    assert config is TRANSFER_CONFIG
+    etag = client.head_object(Bucket="dump", Key="data/csv_data.zip")["ETag"]
+
+    uploader.submit(str(second), "dump", "data/csv_data.zip", digest=zip_digest)
+    assert uploader.wait() == {("dump", "data/csv_data.zip"): False}
+    assert client.head_object(Bucket="dump", Key="data/csv_data.zip")["ETag"] == etag
+
+    write_zip(second, (2025, 1, 3, 2, 0, 0))
+    with zipfile.ZipFile(second, "a") as zipf:
+        zipf.writestr("LICENSE-DATA", "CC")
+    uploader.submit(str(second), "dump", "data/csv_data.zip", digest=zip_digest)
+    assert uploader.wait() == {("dump", "data/csv_data.zip"): True}
+    assert client.head_object(Bucket="dump", Key="data/csv_data.zip")["Metadata"] == {
+        DIGEST_METADATA_KEY: zip_digest(second)
+    }
+    uploader.close()
+
+
+def test_upload_errors(tmp_path, client):
+    path = tmp_path / "dump"
+    path.write_bytes(b"x")
+
+    # only a missing object counts as changed, other errors are raised
+    with pytest.raises(ClientError):
+        remote_digest(client, "other", "dump")
+
+    uploader = Uploader(client)
+    uploader.submit(str(path), "dump", "dump")
+    uploader.submit(str(path), "other", "dump")
+    with pytest.raises(ClientError, match="NoSuchBucket"):
+        uploader.wait()
+    assert uploader.futures == {}
+    assert ("dump", "dump") in client.objects
+    uploader.close()